@@ -0,0 +1,255 @@
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# The most vectors the coarse quantizer is trained on. The rest are only assigned to their nearest list
+MAX_TRAINING_VECTORS = 100_000
+
+
+class IVFIndex:
+    """
+    An inverted file (IVF) index of unit-length vectors, for finding the most cosine-similar ones to a query without
+    comparing it with every vector (Jégou et al., "Product quantization for nearest neighbor search", 2011).
+
+    The vectors are split into `n_lists` lists by a coarse K-Means quantizer. A query is only compared with the vectors
+    of the `n_probe` lists whose centroids are closest to it, so it scans roughly `n_probe / n_lists` of the index.
+    More probes give better recall, at the cost of speed.
+
+    Each vector has a name (a document's file name, or its URL in a segment corpus). Vectors are kept sorted by list,
+    so the vectors of a list are a contiguous slice.
+    """
+
+    def __init__(self, centroids: np.ndarray, names: List[str], vectors: np.ndarray, lists: np.ndarray,
+                 n_probe: int = 8):
+        """
+        :param centroids: The centroids of the coarse quantizer, one row per list
+        :param names: The name of each vector
+        :param vectors: The unit-length vectors, one row each
+        :param lists: The list of each vector
+        :param n_probe: The number of lists to scan per query, by default
+        """
+
+        self.centroids = centroids.astype(np.float32)
+        self.n_probe = n_probe
+
+        self._set_vectors(names, vectors, lists)
+
+    @classmethod
+    def build(cls, names: Sequence[str], vectors: np.ndarray, n_lists: Optional[int] = None,
+              random_state: int = 0) -> 'IVFIndex':
+        """
+        Build an index of vectors.
+
+        :param names: The name of each vector
+        :param vectors: The unit-length vectors, one row each
+        :param n_lists: The number of lists. About 4 * sqrt(n) if None
+        :param random_state: The seed of the coarse quantizer
+        :return: The index
+        """
+
+        # Only needed to build an index, not to search one, so similar.py doesn't have to import scikit-learn
+        from sklearn.cluster import MiniBatchKMeans
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = min(n_lists or max(1, int(4 * np.sqrt(len(vectors)))), len(vectors))
+
+        generator = np.random.RandomState(random_state)
+        sample = vectors
+        if len(vectors) > MAX_TRAINING_VECTORS:
+            sample = vectors[generator.choice(len(vectors), MAX_TRAINING_VECTORS, replace=False)]
+
+        quantizer = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=1).fit(sample)
+
+        index = cls(quantizer.cluster_centers_, [], np.empty((0, vectors.shape[1]), dtype=np.float32),
+                    np.empty(0, dtype=np.int32))
+        index.add(names, vectors)
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._positions
+
+    def vector(self, name: str) -> np.ndarray:
+        """
+        :param name: The name of an indexed vector
+        :return: Its vector
+        """
+
+        return self.vectors[self._positions[name]]
+
+    def add(self, names: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Add vectors to the index, replacing those of names already indexed. The quantizer is not refitted.
+
+        :param names: The name of each vector
+        :param vectors: The unit-length vectors, one row each
+        """
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.remove(names)
+
+        # Assign the vectors to their lists a block at a time, rather than scoring them all against every list at once
+        lists = [self._nearest_lists(vectors[start:start + 8192], 1)[:, 0] for start in range(0, len(vectors), 8192)]
+
+        self._set_vectors(self.names + list(names), np.vstack([self.vectors, vectors]),
+                          np.concatenate([self.lists, *lists]))
+
+    def remove(self, names: Sequence[str]) -> None:
+        """
+        Remove vectors from the index. Names that aren't indexed are ignored.
+
+        :param names: The names of the vectors
+        """
+
+        positions = [self._positions[name] for name in names if name in self._positions]
+        if not positions:
+            return
+
+        keep = np.ones(len(self.names), dtype=bool)
+        keep[positions] = False
+        self._set_vectors([name for name, kept in zip(self.names, keep) if kept], self.vectors[keep], self.lists[keep])
+
+    def search(self, query: np.ndarray, k: int = 10, n_probe: Optional[int] = None,
+               exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Find the most similar vectors to a query.
+
+        :param query: The unit-length query vector
+        :param k: The number of vectors to return
+        :param n_probe: The number of lists to scan. `self.n_probe` if None
+        :param exclude: The name of a vector to leave out, e.g. the query's own
+        :return: The name and cosine similarity of the most similar vectors, most similar first
+        """
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        probed = self._nearest_lists(query[None, :], n_probe or self.n_probe)[0]
+
+        candidates = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in probed])
+
+        return self._top(query, candidates, k, exclude)
+
+    def search_exact(self, query: np.ndarray, k: int = 10, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Find the most similar vectors to a query by comparing it with every vector, e.g. to measure the recall of
+        `search`.
+
+        :param query: The unit-length query vector
+        :param k: The number of vectors to return
+        :param exclude: The name of a vector to leave out, e.g. the query's own
+        :return: The name and cosine similarity of the most similar vectors, most similar first
+        """
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+
+        return self._top(query, None, k, exclude)
+
+    def save(self, path: str) -> None:
+        """
+        Save the index to a `.npz` file.
+
+        :param path: The file to save to
+        """
+
+        np.savez(path, centroids=self.centroids, vectors=self.vectors, lists=self.lists,
+                 names=np.array(self.names, dtype=object).astype(str), n_probe=self.n_probe)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['IVFIndex']:
+        """
+        Load an index saved with `save`.
+
+        :param path: The file it was saved to
+        :return: The index, or None if there is no such file
+        """
+
+        if not Path(path).exists():
+            return None
+
+        with np.load(path) as data:
+            return cls(data['centroids'], data['names'].tolist(), data['vectors'], data['lists'],
+                       int(data['n_probe']))
+
+    def _set_vectors(self, names: List[str], vectors: np.ndarray, lists: np.ndarray) -> None:
+        # Sort the vectors by list, so each list is a contiguous slice starting at its offset
+        order = np.argsort(lists, kind='stable')
+
+        self.names = [names[i] for i in order]
+        self.vectors = np.ascontiguousarray(vectors[order], dtype=np.float32)
+        self.lists = lists[order].astype(np.int32)
+        self.offsets = np.searchsorted(self.lists, np.arange(len(self.centroids) + 1))
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    def _nearest_lists(self, vectors: np.ndarray, n: int) -> np.ndarray:
+        """
+        :param vectors: Vectors, one row each
+        :param n: The number of lists to return per vector
+        :return: The `n` lists with the closest centroids to each vector, closest first
+        """
+
+        # The closest centroid by Euclidean distance is the one maximizing x.c - |c|^2 / 2
+        scores = vectors @ self.centroids.T - 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+        n = min(n, len(self.centroids))
+        nearest = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+        return np.take_along_axis(nearest, np.argsort(-np.take_along_axis(scores, nearest, axis=1), axis=1), axis=1)
+
+    def _top(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int,
+             exclude: Optional[str]) -> List[Tuple[str, float]]:
+        """
+        :param query: The unit-length query vector
+        :param candidates: The positions of the vectors to compare the query with. Every vector if None
+        :param k: The number of vectors to return
+        :param exclude: The name of a vector to leave out
+        :return: The name and cosine similarity of the most similar candidates, most similar first
+        """
+
+        # Comparing with every vector doesn't need to copy them first
+        if candidates is None:
+            candidates = np.arange(len(self.names))
+            similarities = self.vectors @ query
+        else:
+            similarities = self.vectors[candidates] @ query
+
+        if exclude in self._positions:
+            kept = candidates != self._positions[exclude]
+            candidates, similarities = candidates[kept], similarities[kept]
+        if len(candidates) == 0:
+            return []
+
+        k = min(k, len(candidates))
+        best = np.argpartition(-similarities, k - 1)[:k]
+        best = best[np.argsort(-similarities[best])]
+
+        return [(self.names[candidates[i]], float(similarities[i])) for i in best]
+
+
+def benchmark(index: IVFIndex, queries: np.ndarray, k: int = 10, probes: Sequence[int] = (1, 2, 4, 8, 16, 32)) -> dict:
+    """
+    Measure the recall and latency of the index's searches against exact search, for several numbers of probes.
+
+    :param index: The index
+    :param queries: The unit-length query vectors, one row each
+    :param k: The number of vectors each query returns
+    :param probes: The numbers of lists to scan
+    :return: The mean latency of exact search, and the recall@k and mean latency of each number of probes
+    """
+
+    start = time.perf_counter()
+    exact = [{name for name, _ in index.search_exact(query, k)} for query in queries]
+    results = {'queries': len(queries), 'k': k,
+               'exact_ms': (time.perf_counter() - start) / len(queries) * 1000, 'probes': {}}
+
+    for n_probe in probes:
+        start = time.perf_counter()
+        found = [{name for name, _ in index.search(query, k, n_probe)} for query in queries]
+        latency = (time.perf_counter() - start) / len(queries) * 1000
+
+        recall = np.mean([len(a & e) / len(e) for a, e in zip(found, exact) if e])
+        results['probes'][n_probe] = {'recall': float(recall), 'ms': latency}
+
+    return results
@@ -0,0 +1,183 @@
+import gzip
+import mmap
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.client import responses as REASONS
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+
+class ArchivedResponse(NamedTuple):
+    """
+    A response read back from an archive.
+    """
+
+    url: str
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+class ArchiveWriter:
+    """
+    Record responses to a WARC file (ISO 28500), as `response` records holding the raw HTTP status line, headers and
+    body. Each record is its own gzip member, as in a standard `.warc.gz`, so the file can be read with any WARC tool
+    and a single record can be decompressed without reading the ones before it.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The file to write to. It is overwritten if it exists
+        """
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'wb')
+        self.count = 0
+
+    def write(self, url: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        """
+        Append a response to the archive.
+
+        :param url: The URL of the response
+        :param status: The HTTP status code
+        :param headers: The HTTP headers, as (name, value) pairs
+        :param body: The body, as it came off the wire (e.g. still gzip-encoded)
+        """
+
+        http_block = b''.join([
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n".encode('ascii'),
+            *(name + b': ' + value + b'\r\n' for name, value in headers),
+            b'\r\n',
+            body,
+        ])
+
+        warc_headers = (
+            "WARC/1.1\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+            f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            "Content-Type: application/http; msgtype=response\r\n"
+            f"Content-Length: {len(http_block)}\r\n"
+            "\r\n"
+        ).encode('utf-8')
+
+        self._file.write(gzip.compress(warc_headers + http_block + b'\r\n\r\n'))
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArchiveReader:
+    """
+    Read responses back from a `.warc.gz` file written by `ArchiveWriter`.
+
+    When opened, the archive is scanned once to find the offset of each URL's record. Records are then decompressed
+    one at a time, as they are asked for. If a URL was recorded more than once, the last record wins.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The archive to read
+        """
+
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # URL -> (offset, length) of its gzip member
+        self.index: Dict[str, Tuple[int, int]] = {}
+        for offset, length, record in self._members():
+            url = _warc_header(record, b'WARC-Target-URI')
+            if url is not None and _warc_header(record, b'WARC-Type') == 'response':
+                self.index[url] = (offset, length)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.index
+
+    def get(self, url: str) -> ArchivedResponse:
+        """
+        Read the recorded response of a URL.
+
+        :param url: The URL
+        :return: The response
+        :raises KeyError: If the URL wasn't recorded
+        """
+
+        offset, length = self.index[url]
+        record = gzip.decompress(self._data[offset:offset + length])
+
+        return _parse_record(url, record)
+
+    def close(self) -> None:
+        self._data.close()
+        self._file.close()
+
+    def _members(self) -> Iterator[Tuple[int, int, bytes]]:
+        """
+        Walk the gzip members of the archive.
+
+        :return: A generator of the offset and compressed length of each member, with its decompressed content
+        """
+
+        view = memoryview(self._data)
+        offset = 0
+        try:
+            while offset < len(view):
+                # wbits=31 reads exactly one gzip member, leaving whatever follows it in unused_data
+                decompressor = zlib.decompressobj(wbits=31)
+                record = decompressor.decompress(view[offset:])
+                length = len(view) - offset - len(decompressor.unused_data)
+                yield offset, length, record
+                offset += length
+        finally:
+            view.release()
+
+
+def _warc_header(record: bytes, name: bytes):
+    """
+    Get the value of a WARC header from a record, without parsing the rest of it.
+
+    :param record: The decompressed record
+    :param name: The name of the header
+    :return: The value of the header, or None if the record doesn't have it
+    """
+
+    head = record[:record.find(b'\r\n\r\n')]
+    for line in head.split(b'\r\n')[1:]:
+        key, _, value = line.partition(b':')
+        if key.strip().lower() == name.lower():
+            return value.strip().decode('utf-8')
+
+    return None
+
+
+def _parse_record(url: str, record: bytes) -> ArchivedResponse:
+    """
+    Split a `response` record into its HTTP status, headers and body.
+
+    :param url: The URL of the record
+    :param record: The decompressed record
+    :return: The response
+    """
+
+    warc_end = record.find(b'\r\n\r\n') + 4
+    length = int(_warc_header(record, b'Content-Length'))
+    http_block = record[warc_end:warc_end + length]
+
+    head_end = http_block.find(b'\r\n\r\n')
+    status_line, *header_lines = http_block[:head_end].split(b'\r\n')
+    status = int(status_line.split(b' ', 2)[1])
+
+    headers = []
+    for line in header_lines:
+        name, _, value = line.partition(b':')
+        headers.append((name.strip(), value.strip()))
+
+    return ArchivedResponse(url, status, headers, http_block[head_end + 4:])
@@ -0,0 +1,148 @@
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class ClusterArtifact:
+    """
+    The results of a clustering run in one columnar file (`clusters/clusters.npz`), for other jobs to read without
+    re-running it.
+
+    It holds the name of each document (its file name, or its URL in a segment corpus), then for each k:
+
+    - `k{k}_cluster`: the cluster of each document
+    - `k{k}_distance`: the distance from each document to its cluster's centroid, in the LSA space
+    - `k{k}_size`: the number of documents in each cluster
+    - `k{k}_terms` and `k{k}_weights`: the top terms of each cluster and their weights, best first
+
+    A loaded artifact reads each column from the file only when it is first used, so e.g. looking up cluster sizes
+    doesn't read the document columns.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        """
+        :param names: The name of each document, in the order of their rows
+        """
+
+        self._columns = {'names': np.array(names, dtype=str)}
+        self._file = None
+
+    def add(self, k: int, labels: np.ndarray, distances: np.ndarray, terms: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Add the clustering of one k.
+
+        :param k: The number of clusters
+        :param labels: The cluster of each document
+        :param distances: The distance from each document to its cluster's centroid
+        :param terms: The top terms of each cluster, best first, one row per cluster
+        :param weights: The weights of those terms
+        """
+
+        self._columns[f'k{k}_cluster'] = np.asarray(labels, dtype=np.int32)
+        self._columns[f'k{k}_distance'] = np.asarray(distances, dtype=np.float32)
+        self._columns[f'k{k}_size'] = np.bincount(labels, minlength=k)
+        self._columns[f'k{k}_terms'] = np.asarray(terms, dtype=str)
+        self._columns[f'k{k}_weights'] = np.asarray(weights, dtype=np.float32)
+
+    @property
+    def ks(self) -> List[int]:
+        return sorted(int(key[1:-len('_cluster')]) for key in self._keys() if key.endswith('_cluster'))
+
+    @property
+    def names(self) -> np.ndarray:
+        return self._column('names')
+
+    def clusters(self, k: int) -> np.ndarray:
+        """
+        :param k: The number of clusters
+        :return: The cluster of each document
+        """
+
+        return self._column(f'k{k}_cluster')
+
+    def distances(self, k: int) -> np.ndarray:
+        """
+        :param k: The number of clusters
+        :return: The distance from each document to its cluster's centroid
+        """
+
+        return self._column(f'k{k}_distance')
+
+    def sizes(self, k: int) -> np.ndarray:
+        """
+        :param k: The number of clusters
+        :return: The number of documents in each cluster
+        """
+
+        return self._column(f'k{k}_size')
+
+    def top_terms(self, k: int, cluster: int) -> List[Tuple[str, float]]:
+        """
+        :param k: The number of clusters
+        :param cluster: The cluster
+        :return: Its top terms and their weights, best first
+        """
+
+        return list(zip(self._column(f'k{k}_terms')[cluster].tolist(),
+                        self._column(f'k{k}_weights')[cluster].tolist()))
+
+    def members(self, k: int, cluster: int) -> np.ndarray:
+        """
+        :param k: The number of clusters
+        :param cluster: The cluster
+        :return: The names of the documents in it, closest to its centroid first
+        """
+
+        positions = np.flatnonzero(self.clusters(k) == cluster)
+        positions = positions[np.argsort(self.distances(k)[positions], kind='stable')]
+
+        return self.names[positions]
+
+    def save(self, path: str = 'clusters/clusters.npz') -> None:
+        """
+        Save the artifact, uncompressed, so each column can be read on its own.
+
+        :param path: The file to save to
+        """
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, **self._columns)
+
+    @classmethod
+    def load(cls, path: str = 'clusters/clusters.npz') -> Optional['ClusterArtifact']:
+        """
+        Open a saved artifact. Its columns are read when they are first used.
+
+        :param path: The file it was saved to
+        :return: The artifact, or None if there is no such file
+        """
+
+        if not Path(path).exists():
+            return None
+
+        artifact = cls([])
+        artifact._columns = {}
+        artifact._file = np.load(path)
+
+        return artifact
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self) -> 'ClusterArtifact':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _keys(self) -> set:
+        return set(self._columns) | set(self._file.files if self._file is not None else [])
+
+    def _column(self, key: str) -> np.ndarray:
+        # Each column of the file is read once, the first time it is needed
+        if key not in self._columns:
+            self._columns[key] = self._file[key]
+
+        return self._columns[key]
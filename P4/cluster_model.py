@@ -0,0 +1,273 @@
+import json
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from P4.ann import IVFIndex
+
+# The share of the training documents allowed to be further from their nearest centroid than the distance threshold
+THRESHOLD_PERCENTILE = 95
+
+
+class ClusterModel:
+    """
+    A fitted clustering model: the TF-IDF vectorizer, the LSA pipeline, and a K-Means model for each k, along with the
+    cluster each document was assigned to.
+
+    Models are saved as numbered versions (`models/v1/`, `models/v2/`, etc.), each with a `manifest.json` describing
+    it. New or changed documents can then be assigned to the clusters of the latest version without refitting.
+
+    To tell when the clusters no longer fit the documents, the distance from each training document to its nearest
+    centroid is recorded, and its `THRESHOLD_PERCENTILE`th percentile kept as the threshold for each k. The drift of a
+    batch of new documents is the share of them further than that from every centroid.
+
+    The documents' LSA vectors are also kept in an approximate nearest neighbour index (see `P4/ann.py`), to find the
+    documents most similar to a given one, or to any text, with `similar`.
+    """
+
+    def __init__(self, vectorizer, lsa, kmeans: Dict[int, object], thresholds: Dict[int, float],
+                 documents: Dict[str, Tuple[str, List[int]]], manifest: Optional[dict] = None,
+                 index: Optional[IVFIndex] = None):
+        """
+        :param vectorizer: The fitted TF-IDF vectorizer
+        :param lsa: The fitted LSA pipeline (SVD, then normalization)
+        :param kmeans: The fitted K-Means model of each k
+        :param thresholds: The distance threshold of each k
+        :param documents: Each document's content hash, and the cluster it is in for each k (in the order of `ks`)
+        :param manifest: The manifest the model was loaded with, if any
+        :param index: The nearest neighbour index of the documents' LSA vectors, if any
+        """
+
+        self.vectorizer = vectorizer
+        self.lsa = lsa
+        self.kmeans = kmeans
+        self.thresholds = thresholds
+        self.documents = documents
+        self.manifest = manifest or {}
+        self.index = index
+
+        self.folder = None
+
+    @property
+    def ks(self) -> List[int]:
+        return sorted(self.kmeans)
+
+    @classmethod
+    def fit_thresholds(cls, kmeans: Dict[int, object], X_lsa: np.ndarray) -> Dict[int, float]:
+        """
+        Compute the distance threshold of each k from the training documents.
+
+        :param kmeans: The fitted K-Means model of each k
+        :param X_lsa: The training documents, in the LSA space
+        :return: The distance threshold of each k
+        """
+
+        return {k: float(np.percentile(model.transform(X_lsa).min(axis=1), THRESHOLD_PERCENTILE))
+                for k, model in kmeans.items()}
+
+    def transform(self, documents: list, input_type: str = 'content') -> np.ndarray:
+        """
+        Transform documents into the LSA space of the model.
+
+        :param documents: The documents, as text or file names
+        :param input_type: How the vectorizer should read them: 'content' or 'filename'
+        :return: The documents, in the LSA space
+        """
+
+        self.vectorizer.input = input_type
+
+        return self.lsa.transform(self.vectorizer.transform(documents))
+
+    def predict(self, X_lsa: np.ndarray) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        :param X_lsa: Documents, in the LSA space
+        :return: For each k, the cluster of each document and its distance to that cluster's centroid
+        """
+
+        predictions = {}
+        for k, model in self.kmeans.items():
+            distances = model.transform(X_lsa)
+            predictions[k] = distances.argmin(axis=1), distances.min(axis=1)
+
+        return predictions
+
+    def drift(self, predictions: Dict[int, Tuple[np.ndarray, np.ndarray]]) -> float:
+        """
+        :param predictions: The predictions for a batch of documents, from `predict`
+        :return: The share of the documents further than the threshold from every centroid, for the worst k
+        """
+
+        return max(float(np.mean(distances > self.thresholds[k])) for k, (_, distances) in predictions.items())
+
+    def similar(self, name: Optional[str] = None, text: Optional[str] = None, k: int = 10,
+                n_probe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Find the documents most similar to an indexed document, or to some text.
+
+        :param name: The name of an indexed document
+        :param text: Any text, used if `name` is None
+        :param k: The number of documents to return
+        :param n_probe: The number of lists of the index to scan. The index's default if None
+        :return: The name and cosine similarity of the most similar documents, most similar first
+        """
+
+        if name is not None:
+            return self.index.search(self.index.vector(name), k, n_probe, exclude=name)
+
+        return self.index.search(self.transform([text])[0], k, n_probe)
+
+    def cluster_sizes(self) -> Dict[int, np.ndarray]:
+        """
+        :return: The number of documents in each cluster, for each k
+        """
+
+        sizes = {k: np.zeros(k, dtype=int) for k in self.ks}
+        for _, clusters in self.documents.values():
+            for k, cluster in zip(self.ks, clusters):
+                sizes[k][cluster] += 1
+
+        return sizes
+
+    def save(self, root: str = 'models', **details) -> Path:
+        """
+        Save the model as a new version.
+
+        :param root: The folder holding every version
+        :param details: Anything else to describe the version with in its manifest, e.g. what it was fitted on
+        :return: The folder of the new version
+        """
+
+        version = latest_version(root) + 1
+        folder = Path(root) / f"v{version}"
+        folder.mkdir(parents=True)
+
+        joblib.dump(self.vectorizer, folder / 'vectorizer.joblib')
+        joblib.dump(self.lsa, folder / 'lsa.joblib')
+        for k, model in self.kmeans.items():
+            joblib.dump(model, folder / f'kmeans-k{k}.joblib')
+
+        self.manifest = {
+            'version': version,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'ks': self.ks,
+            'n_documents': len(self.documents),
+            'n_features': len(self.vectorizer.vocabulary_),
+            'n_components': int(self.lsa[0].n_components),
+            'explained_variance': float(self.lsa[0].explained_variance_ratio_.sum()),
+            'thresholds': {str(k): threshold for k, threshold in self.thresholds.items()},
+            'threshold_percentile': THRESHOLD_PERCENTILE,
+            **details,
+        }
+        with open(folder / 'manifest.json', 'wt') as f:
+            json.dump(self.manifest, f, indent=2)
+
+        self.folder = folder
+        self.save_documents()
+        self.save_index()
+
+        return folder
+
+    def save_documents(self) -> None:
+        """
+        Save the documents' content hashes and clusters, e.g. after assigning new ones, to `documents.tsv` in the
+        model's folder.
+        """
+
+        with open(self.folder / 'documents.tsv', 'wt', encoding='utf-8') as f:
+            f.write('\t'.join(['name', 'content_hash', *(f'k{k}' for k in self.ks)]) + '\n')
+            for name, (content_hash, clusters) in self.documents.items():
+                f.write('\t'.join([name, content_hash, *map(str, clusters)]) + '\n')
+
+    def save_index(self) -> None:
+        """
+        Save the nearest neighbour index, e.g. after adding new documents to it, to `ann.npz` in the model's folder.
+        """
+
+        if self.index is not None:
+            self.index.save(self.folder / 'ann.npz')
+
+    @classmethod
+    def load(cls, root: str = 'models', version: Optional[int] = None) -> Optional['ClusterModel']:
+        """
+        Load a saved model.
+
+        :param root: The folder holding every version
+        :param version: The version to load. The latest one if None
+        :return: The model, or None if there is no saved model
+        """
+
+        version = version or latest_version(root)
+        folder = Path(root) / f"v{version}"
+        if not (folder / 'manifest.json').exists():
+            return None
+
+        with open(folder / 'manifest.json', 'rt') as f:
+            manifest = json.load(f)
+
+        vectorizer = joblib.load(folder / 'vectorizer.joblib')
+        lsa = joblib.load(folder / 'lsa.joblib')
+        kmeans = {k: joblib.load(folder / f'kmeans-k{k}.joblib') for k in manifest['ks']}
+        thresholds = {int(k): threshold for k, threshold in manifest['thresholds'].items()}
+
+        documents = {}
+        with open(folder / 'documents.tsv', 'rt', encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                name, content_hash, *clusters = line.rstrip('\n').split('\t')
+                documents[name] = content_hash, [int(c) for c in clusters]
+
+        model = cls(vectorizer, lsa, kmeans, thresholds, documents, manifest, IVFIndex.load(folder / 'ann.npz'))
+        model.folder = folder
+
+        return model
+
+
+def load_manifest(root: str = 'models', version: Optional[int] = None) -> Optional[dict]:
+    """
+    Read the manifest of a saved version, without loading the model.
+
+    :param root: The folder holding every version
+    :param version: The version. The latest one if None
+    :return: The manifest, or None if there is no such version
+    """
+
+    path = Path(root) / f"v{version or latest_version(root)}" / 'manifest.json'
+    if not path.exists():
+        return None
+
+    with open(path, 'rt') as f:
+        return json.load(f)
+
+
+def latest_version(root: str = 'models') -> int:
+    """
+    :param root: The folder holding every version
+    :return: The number of the latest saved version, or 0 if there are none
+    """
+
+    versions = [int(path.name[1:]) for path in Path(root).glob('v*') if path.name[1:].isdigit()]
+
+    return max(versions, default=0)
+
+
+def prune_versions(root: str = 'models', keep: int = 5) -> List[int]:
+    """
+    Delete all but the latest saved versions.
+
+    :param root: The folder holding every version
+    :param keep: The number of versions to keep. 0 keeps every version
+    :return: The versions deleted
+    """
+
+    versions = sorted(int(path.name[1:]) for path in Path(root).glob('v*') if path.name[1:].isdigit())
+    if keep <= 0:
+        return []
+
+    for version in versions[:-keep]:
+        shutil.rmtree(Path(root) / f"v{version}")
+
+    return versions[:-keep]
@@ -0,0 +1,318 @@
+import zlib
+from pathlib import Path
+from re import sub
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+
+class IndexEntry(NamedTuple):
+    """
+    Where a document lives in a segment corpus.
+    """
+
+    segment: int
+    offset: int
+    length: int
+    compressed: bool
+
+
+# A deleted document is recorded in the index with this length
+_TOMBSTONE = -1
+
+
+def _segment_name(segment: int) -> str:
+    return f"segment-{segment:05d}.seg"
+
+
+def _read_index(folder: Path) -> Dict[str, IndexEntry]:
+    """
+    Read the index of a segment corpus. Later entries for a URL replace earlier ones, and deleted documents are left
+    out.
+
+    :param folder: The folder of the corpus
+    :return: The index, from URL to where the document lives
+    """
+
+    index = {}
+
+    index_path = folder / 'index.tsv'
+    if not index_path.exists():
+        return index
+
+    with open(index_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            # A partially written last line (e.g. from a crash) is ignored
+            if not line.endswith('\n'):
+                break
+
+            url, segment, offset, length, compressed = line.rstrip('\n').split('\t')
+
+            if int(length) == _TOMBSTONE:
+                index.pop(url, None)
+            else:
+                index[url] = IndexEntry(int(segment), int(offset), int(length), compressed == '1')
+
+    return index
+
+
+class CorpusWriter:
+    """
+    Append documents to a corpus made of a few large segment files, instead of one small file per page.
+
+    Documents are appended to the current segment, optionally zlib-compressed one by one (so any of them can still be
+    read on its own), and a new segment is started once the current one grows past `segment_size` bytes. Each write
+    appends a line to `index.tsv` recording the URL, segment, offset and length of the document.
+    """
+
+    def __init__(self, folder: str, segment_size: int = 64 * 1024 * 1024, compress: bool = False):
+        """
+        :param folder: The folder of the corpus. Created if it doesn't exist, and appended to if it does
+        :param segment_size: The size, in bytes, past which a new segment is started
+        :param compress: Whether to compress each document
+        """
+
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        self.segment_size = segment_size
+        self.compress = compress
+
+        self.urls = set(_read_index(self.folder))
+
+        # Continue appending to the last segment
+        segments = sorted(self.folder.glob('segment-*.seg'))
+        self.segment = int(segments[-1].stem.split('-')[1]) if segments else 0
+
+        self.segment_file = open(self.folder / _segment_name(self.segment), 'ab')
+        self.index_file = open(self.folder / 'index.tsv', 'at', encoding='utf-8')
+
+    def write(self, url: str, text: str) -> None:
+        """
+        Append a document to the corpus. If the URL was already in the corpus, this version replaces it.
+
+        :param url: The URL of the document
+        :param text: The text of the document
+        """
+
+        data = text.encode('utf-8')
+        if self.compress:
+            data = zlib.compress(data)
+
+        if self.segment_file.tell() > 0 and self.segment_file.tell() + len(data) > self.segment_size:
+            self._next_segment()
+
+        offset = self.segment_file.tell()
+        self.segment_file.write(data)
+
+        # The document is flushed before its index entry, so the index never points at missing data
+        self.segment_file.flush()
+        self.index_file.write(f"{url}\t{self.segment}\t{offset}\t{len(data)}\t{int(self.compress)}\n")
+        self.index_file.flush()
+
+        self.urls.add(url)
+
+    def delete(self, url: str) -> None:
+        """
+        Remove a document from the corpus. Its data stays in its segment, but is no longer indexed.
+
+        :param url: The URL of the document
+        """
+
+        if url not in self.urls:
+            return
+
+        self.index_file.write(f"{url}\t{self.segment}\t0\t{_TOMBSTONE}\t0\n")
+        self.index_file.flush()
+
+        self.urls.discard(url)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.urls
+
+    def close(self) -> None:
+        self.segment_file.close()
+        self.index_file.close()
+
+    def _next_segment(self) -> None:
+        """
+        Close the current segment and start a new one.
+        """
+
+        self.segment_file.close()
+        self.segment += 1
+        self.segment_file = open(self.folder / _segment_name(self.segment), 'ab')
+
+
+class CorpusReader:
+    """
+    Read documents from a corpus written by a `CorpusWriter`, either one at a time by URL, or all of them in a
+    single sequential pass over the segments.
+    """
+
+    def __init__(self, folder: str):
+        """
+        :param folder: The folder of the corpus
+        """
+
+        self.folder = Path(folder)
+        self.index = _read_index(self.folder)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.index
+
+    def urls(self) -> list:
+        """
+        :return: The URLs of all documents, in the order they are stored in
+        """
+
+        return sorted(self.index, key=self.index.get)
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        Read a single document.
+
+        :param url: The URL of the document
+        :return: The document's text, or None if it isn't in the corpus
+        """
+
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+
+        with open(self.folder / _segment_name(entry.segment), 'rb') as f:
+            f.seek(entry.offset)
+            return _decode(f.read(entry.length), entry.compressed)
+
+    def iter_documents(self, limit: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Stream the documents in the order they are stored in, so that each segment is read sequentially.
+
+        :param limit: The most documents to read. All of them if None
+        :return: An iterator of (URL, text) pairs
+        """
+
+        urls = self.urls()[:limit]
+
+        segment, f = None, None
+        try:
+            for url in urls:
+                entry = self.index[url]
+
+                if entry.segment != segment:
+                    if f is not None:
+                        f.close()
+                    segment = entry.segment
+                    f = open(self.folder / _segment_name(segment), 'rb')
+
+                f.seek(entry.offset)
+                yield url, _decode(f.read(entry.length), entry.compressed)
+        finally:
+            if f is not None:
+                f.close()
+
+
+def _decode(data: bytes, compressed: bool) -> str:
+    if compressed:
+        data = zlib.decompress(data)
+
+    return data.decode('utf-8')
+
+
+def text_file_name(url: str) -> str:
+    """
+    :param url: The URL of a page
+    :return: The file its text is saved to in `text_files/`
+    """
+
+    # Get the actual page name, removing 'https://', replacing '/' characters for '-' characters.
+    # This helps with file saving
+    page = url.split('//')[-1].replace('/', '-')
+
+    # Replace invalid characters with a '-'
+    page = sub(r'[\\/:*?\"<>|]', '-', page)
+
+    return f"text_files/{page}.txt"
+
+
+class TextFileStore:
+    """
+    Store each page's text in its own file in `text_files/`. This is the original way pages were saved.
+    """
+
+    def write(self, url: str, filename: str, text: str) -> None:
+        # Ensure the required directory exists and write the text of the page into the file
+        Path(filename).parent.mkdir(exist_ok=True, parents=True)
+        with open(filename, 'wt', encoding='utf-8') as f:
+            f.writelines(text)
+
+    def delete(self, url: str, filename: str) -> None:
+        Path(filename).unlink(missing_ok=True)
+
+    def exists(self, url: str, filename: str) -> bool:
+        return Path(filename).exists()
+
+    def close(self) -> None:
+        pass
+
+
+class SegmentStore:
+    """
+    Store each page's text in a segment corpus, through a `CorpusWriter`.
+    """
+
+    def __init__(self, folder: str, segment_size: int, compress: bool):
+        self.writer = CorpusWriter(folder, segment_size=segment_size, compress=compress)
+
+    def write(self, url: str, filename: str, text: str) -> None:
+        self.writer.write(url, text)
+
+    def delete(self, url: str, filename: str) -> None:
+        self.writer.delete(url)
+
+    def exists(self, url: str, filename: str) -> bool:
+        return url in self.writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class NullStore:
+    """
+    Don't store the pages' text anywhere, e.g. when it is only clustered as it is crawled.
+    """
+
+    def write(self, url: str, filename: str, text: str) -> None:
+        pass
+
+    def delete(self, url: str, filename: str) -> None:
+        pass
+
+    def exists(self, url: str, filename: str) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+def open_store(settings):
+    """
+    Open the document store chosen by the `CORPUS_STORE` setting: 'files', 'segments' or 'none'.
+
+    :param settings: The crawler settings
+    :return: The store
+    """
+
+    kind = settings.get('CORPUS_STORE', 'files')
+
+    if kind == 'files':
+        return TextFileStore()
+    if kind == 'segments':
+        return SegmentStore(settings.get('CORPUS_STORE_PATH', 'corpus'),
+                            settings.getint('CORPUS_SEGMENT_SIZE', 64 * 1024 * 1024),
+                            settings.getbool('CORPUS_COMPRESS', False))
+    if kind == 'none':
+        return NullStore()
+
+    raise ValueError(f"Unknown CORPUS_STORE '{kind}'. Choose from: files, segments, none")
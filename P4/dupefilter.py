@@ -0,0 +1,311 @@
+import json
+import logging
+import math
+import mmap
+from hashlib import blake2b
+from pathlib import Path
+from typing import Optional
+
+from scrapy.dupefilters import BaseDupeFilter
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    A fixed-capacity Bloom filter: a set that uses a few bits per key, at the cost of sometimes claiming to contain a
+    key that was never added (with probability `error_rate` once `capacity` keys have been added).
+
+    The bits live either in memory, or in a memory-mapped file so the OS can page them out to disk.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, path: Optional[Path] = None, count: int = 0):
+        """
+        :param capacity: How many keys the filter is sized for
+        :param error_rate: The false-positive rate once `capacity` keys have been added
+        :param path: The file to memory-map the bits to. If None, the bits are kept in memory
+        :param count: How many keys were already added, when reopening an existing file
+        """
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = count
+
+        # The optimal number of bits and hash functions for this capacity and error rate
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+
+        num_bytes = (self.num_bits + 7) // 8
+
+        self.path = path
+        if path is None:
+            self.bits = bytearray(num_bytes)
+        else:
+            with open(path, 'ab') as f:
+                f.truncate(num_bytes)
+            self._file = open(path, 'r+b')
+            self.bits = mmap.mmap(self._file.fileno(), num_bytes)
+
+    def _positions(self, key: bytes):
+        """
+        Get the bit positions of a key, using double hashing on a single 128-bit digest.
+
+        :param key: The key
+        :return: The positions of the key's bits
+        """
+
+        digest = blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: bytes) -> None:
+        """
+        Add a key. The caller is expected to have checked that it isn't already in the filter.
+
+        :param key: The key
+        """
+
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+    def estimated_fp_rate(self) -> float:
+        """
+        :return: The expected false-positive rate, given how many keys were added so far
+        """
+
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def save(self, path: Path) -> None:
+        """
+        Write the bits to a file. Memory-mapped filters are flushed to their own file instead.
+
+        :param path: The file to write to
+        """
+
+        if self.path is None:
+            path.write_bytes(self.bits)
+        else:
+            self.bits.flush()
+
+    def close(self) -> None:
+        if self.path is not None:
+            self.bits.close()
+            self._file.close()
+
+
+class ScalableBloomFilter:
+    """
+    A Bloom filter that grows as keys are added, while keeping the overall false-positive rate below `error_rate`
+    (Almeida et al., "Scalable Bloom Filters", 2007).
+
+    It is a list of plain Bloom filters. Once the last one is full, a new one is added with `growth` times the
+    capacity and a false-positive rate `tightening` times lower, so the sum of all their rates stays bounded.
+    """
+
+    def __init__(self, initial_capacity: int = 100_000, error_rate: float = 0.001, folder: Optional[str] = None,
+                 growth: int = 2, tightening: float = 0.5):
+        """
+        :param initial_capacity: The capacity of the first filter
+        :param error_rate: The target overall false-positive rate
+        :param folder: The folder to memory-map the filters to. If None, they are kept in memory
+        :param growth: How much larger each new filter is than the last
+        :param tightening: How much lower each new filter's false-positive rate is than the last
+        """
+
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.folder = Path(folder) if folder is not None else None
+        self.growth = growth
+        self.tightening = tightening
+
+        self.filters = []
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in f for f in reversed(self.filters))
+
+    def add(self, key: bytes) -> bool:
+        """
+        Add a key, unless it (probably) was already added.
+
+        :param key: The key
+        :return: Whether the key was added. False if it was already in the filter
+        """
+
+        if key in self:
+            return False
+
+        if not self.filters or self.filters[-1].is_full():
+            self._add_filter()
+
+        self.filters[-1].add(key)
+        return True
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self.filters)
+
+    def estimated_fp_rate(self) -> float:
+        """
+        :return: The expected false-positive rate of the whole filter, given how many keys were added so far
+        """
+
+        no_false_positive = 1.0
+        for f in self.filters:
+            no_false_positive *= 1 - f.estimated_fp_rate()
+
+        return 1 - no_false_positive
+
+    def memory_bytes(self) -> int:
+        return sum(f.memory_bytes() for f in self.filters)
+
+    def save(self, folder: str) -> None:
+        """
+        Save the filter, so it can be reloaded with `load`.
+
+        :param folder: The folder to save to
+        """
+
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        for i, f in enumerate(self.filters):
+            f.save(folder / f"filter-{i}.bits")
+
+        meta = {
+            'initial_capacity': self.initial_capacity,
+            'error_rate': self.error_rate,
+            'growth': self.growth,
+            'tightening': self.tightening,
+            'counts': [f.count for f in self.filters],
+        }
+        with open(folder / 'meta.json', 'wt') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, folder: str, memory_mapped: bool = False) -> 'ScalableBloomFilter':
+        """
+        Reload a filter saved with `save`.
+
+        :param folder: The folder it was saved to
+        :param memory_mapped: Whether to memory-map the filters from their files, instead of reading them into memory
+        :return: The filter
+        """
+
+        folder = Path(folder)
+        with open(folder / 'meta.json', 'rt') as f:
+            meta = json.load(f)
+
+        bloom = cls(meta['initial_capacity'], meta['error_rate'], folder if memory_mapped else None,
+                    meta['growth'], meta['tightening'])
+
+        for i, count in enumerate(meta['counts']):
+            bloom._add_filter(count)
+            if not memory_mapped:
+                bits = (folder / f"filter-{i}.bits").read_bytes()
+                bloom.filters[-1].bits[:] = bits
+
+        return bloom
+
+    def close(self) -> None:
+        for f in self.filters:
+            f.close()
+
+    def _add_filter(self, count: int = 0) -> None:
+        """
+        Add a new, larger and stricter filter to the end of the list.
+
+        :param count: How many keys were already added to it, when reloading
+        """
+
+        i = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** i
+
+        # The first filter gets (1 - tightening) of the error budget, the next one (1 - tightening) * tightening, etc.
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** i
+
+        path = self.folder / f"filter-{i}.bits" if self.folder is not None else None
+        if path is not None:
+            self.folder.mkdir(parents=True, exist_ok=True)
+
+        self.filters.append(BloomFilter(capacity, error_rate, path, count))
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """
+    A duplicate request filter backed by a `ScalableBloomFilter` of request fingerprints, instead of Scrapy's
+    in-memory set of fingerprints. Memory use is a few bits per URL rather than a full fingerprint string, at the cost
+    of wrongly skipping a small, bounded fraction of new URLs.
+
+    Settings:
+
+    - `DUPEFILTER_CAPACITY`: The capacity of the first Bloom filter.
+    - `DUPEFILTER_ERROR_RATE`: The target false-positive rate.
+    - `DUPEFILTER_PATH`: The folder the filter is saved to. If set, the filter is memory-mapped from it when
+      `DUPEFILTER_DISK` is enabled, and reloaded at the next run when `DUPEFILTER_PERSIST` is enabled.
+    """
+
+    def __init__(self, crawler, capacity: int, error_rate: float, path: Optional[str], disk: bool, persist: bool,
+                 debug: bool = False):
+        self.crawler = crawler
+        self.fingerprinter = crawler.request_fingerprinter
+        self.stats = crawler.stats
+        self.path = path
+        self.persist = persist
+        self.debug = debug
+        self.log_dupes = True
+
+        if path is not None and persist and (Path(path) / 'meta.json').exists():
+            self.bloom = ScalableBloomFilter.load(path, memory_mapped=disk)
+            logger.info(f"Reloaded duplicate filter with {len(self.bloom)} fingerprints from {path}")
+        else:
+            if path is not None:
+                # Start from an empty filter
+                for file in Path(path).glob('*'):
+                    file.unlink()
+            self.bloom = ScalableBloomFilter(capacity, error_rate, path if disk else None)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(crawler,
+                   settings.getint('DUPEFILTER_CAPACITY', 100_000),
+                   settings.getfloat('DUPEFILTER_ERROR_RATE', 0.001),
+                   settings.get('DUPEFILTER_PATH'),
+                   settings.getbool('DUPEFILTER_DISK', False),
+                   settings.getbool('DUPEFILTER_PERSIST', False),
+                   settings.getbool('DUPEFILTER_DEBUG'))
+
+    def request_seen(self, request) -> bool:
+        return not self.bloom.add(self.fingerprinter.fingerprint(request))
+
+    def close(self, reason: str) -> None:
+        self.stats.set_value('dupefilter/fingerprints', len(self.bloom))
+        self.stats.set_value('dupefilter/filters', len(self.bloom.filters))
+        self.stats.set_value('dupefilter/memory_bytes', self.bloom.memory_bytes())
+        self.stats.set_value('dupefilter/estimated_fp_rate', self.bloom.estimated_fp_rate())
+
+        if self.path is not None and self.persist:
+            self.bloom.save(self.path)
+
+        self.bloom.close()
+
+    def log(self, request, spider) -> None:
+        if self.debug:
+            logger.debug(f"Filtered duplicate request: {request}", extra={'spider': spider})
+        elif self.log_dupes:
+            logger.debug(f"Filtered duplicate request: {request} - no more duplicates will be shown "
+                         f"(see DUPEFILTER_DEBUG to show all duplicates)", extra={'spider': spider})
+            self.log_dupes = False
+
+        self.stats.inc_value('dupefilter/filtered', spider=spider)
@@ -0,0 +1,92 @@
+# Define here the extensions of the crawler
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import os
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+from P4.metrics import Metrics
+
+
+class MetricsExtension:
+    """
+    Collect per-stage crawl metrics and export them.
+
+    The spider and item pipelines time their own stages (extract, link filter, clean, write) through `spider.metrics`.
+    This extension times downloads and counts bytes through signals, samples queue depths and throughput, writes a
+    Prometheus textfile every `METRICS_INTERVAL` seconds, and writes a JSON summary when the spider closes.
+
+    When `METRICS_ENABLED` is off, the extension isn't loaded, and the spider keeps its no-op `NullMetrics`.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.metrics = Metrics()
+
+        self.interval = settings.getfloat('METRICS_INTERVAL', 15.0)
+        self.textfile = settings.get('METRICS_TEXTFILE')
+        self.json_path = settings.get('METRICS_JSON')
+
+        self.export_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        spider.metrics = self.metrics
+
+        self.export_task = task.LoopingCall(self._export)
+        self.export_task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.export_task is not None and self.export_task.running:
+            self.export_task.stop()
+        self._export()
+
+        if self.json_path:
+            Path(self.json_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.json_path, 'wt') as f:
+                json.dump(self.metrics.summary(), f, indent=2)
+
+    def response_received(self, response, request, spider):
+        self.metrics.observe('download', request.meta.get('download_latency', 0.0))
+        self.metrics.inc('bytes_in', len(response.body))
+        self.metrics.inc('responses')
+
+    def _export(self) -> None:
+        """
+        Sample the queue depths and throughput, and write the Prometheus textfile.
+        """
+
+        engine = self.crawler.engine
+        slot = getattr(engine, 'slot', None) or getattr(engine, '_slot', None)
+
+        # Not every scheduler can tell how many requests it holds (e.g. the shared frontier one)
+        if slot is not None and hasattr(slot.scheduler, '__len__'):
+            self.metrics.set_gauge('scheduler_queue', len(slot.scheduler))
+        self.metrics.set_gauge('downloader_active', len(engine.downloader.active))
+        self.metrics.set_gauge('scraper_active', len(engine.scraper.slot.active) if engine.scraper.slot else 0)
+        self.metrics.set_gauge('pages_per_second', self.metrics.summary()['pages_per_second'])
+
+        if self.textfile:
+            # Write to a temporary file first, so the exporter never reads a half-written file
+            Path(self.textfile).parent.mkdir(parents=True, exist_ok=True)
+            temporary = f"{self.textfile}.tmp"
+            with open(temporary, 'wt') as f:
+                f.write(self.metrics.to_prometheus())
+            os.replace(temporary, self.textfile)
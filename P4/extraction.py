@@ -0,0 +1,188 @@
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from bs4 import BeautifulSoup
+
+from P4.metrics import NULL_METRICS
+
+
+class PageContent(NamedTuple):
+    """
+    The parts of a page that the spider cares about.
+    """
+
+    lang: Optional[str]
+    paragraphs: List[str]
+    headings: List[str]
+    div_bodies: List[str]
+    list_items: List[str]
+    links: List[str]
+
+
+# Set a list of valid HTML heading tags to parse. This narrows the scope of the text
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+# The elements whose text BeautifulSoup's `.text` leaves out, and which the lxml backend removes to match it.
+# `<noscript>` isn't one of them: `html.parser` parses its content as markup, so its text is kept
+HIDDEN_TAGS = ('script', 'style', 'template')
+
+# A `<body>` start tag. lxml adds a body to every document, while BeautifulSoup only has one if the page does
+BODY_TAG = re.compile(rb'<body[\s/>]', re.IGNORECASE)
+
+
+def extract_bs4(body: bytes, metrics=NULL_METRICS) -> PageContent:
+    """
+    Extract the page content using BeautifulSoup and the pure-Python `html.parser`.
+
+    This is the original extraction path: it walks the parsed tree once per kind of element.
+
+    :param body: The raw bytes of the response
+    :param metrics: Where to record the time spent parsing and extracting
+    :return: The extracted page content
+    """
+
+    # Parse the response body
+    with metrics.time('parse'):
+        contents = BeautifulSoup(body, features="html.parser", from_encoding='utf-8')
+
+    with metrics.time('extract'):
+        return _find_all_bs4(contents)
+
+
+def _find_all_bs4(contents) -> PageContent:
+    """
+    Pull the page content out of a parsed BeautifulSoup tree.
+
+    :param contents: The parsed tree
+    :return: The extracted page content
+    """
+
+    lang = contents.html.get('lang') if contents.html is not None else None
+
+    if contents.body is None:
+        return PageContent(lang, [], [], [], [], [])
+
+    # Get all paragraph text
+    paragraphs = [p.text for p in contents.body.find_all('p')]
+
+    # Get all headings by type
+    headings_lists = [contents.body.find_all(h) for h in HEADING_TAGS]
+
+    # Flatten the headings list, keeping only the text of each heading
+    headings = [item.text for sublist in headings_lists for item in sublist]
+
+    # Get all divs with the 'body' class
+    div_bodies = [d.text for d in contents.body.find_all('div', {'class': 'body'})]
+
+    # Get all list items
+    list_items = [li.text for li in contents.body.find_all('li')]
+
+    # Get all links on this page
+    links = [l['href'] for l in contents.body.find_all('a', href=True)]
+
+    return PageContent(lang, paragraphs, headings, div_bodies, list_items, links)
+
+
+def extract_lxml(body: bytes, metrics=NULL_METRICS) -> PageContent:
+    """
+    Extract the page content using lxml, collecting every kind of element in a single traversal of the document.
+
+    Headings are bucketed by level while walking, so they come out in the same order as `extract_bs4`
+    (all h1s, then all h2s, etc.). The text of scripts, styles and templates is left out, like `.text` does, and a
+    page without a `<body>` has no content, like with `extract_bs4`.
+
+    lxml closes unclosed `<p>` and `<li>` tags where HTML says they end, whereas `html.parser` nests everything up to
+    the parent's end tag inside them. So on such pages the two backends differ: `extract_bs4` repeats the text of the
+    following elements in each unclosed one.
+
+    :param body: The raw bytes of the response
+    :param metrics: Where to record the time spent parsing and extracting
+    :return: The extracted page content
+    """
+
+    # Imported here so that lxml is only required when this backend is selected
+    from lxml import etree, html
+
+    try:
+        with metrics.time('parse'):
+            root = html.document_fromstring(body, parser=html.HTMLParser(encoding='utf-8'))
+    except (etree.ParserError, ValueError):
+        return PageContent(None, [], [], [], [], [])
+
+    with metrics.time('extract'):
+        if BODY_TAG.search(body) is None:
+            return PageContent(root.get('lang'), [], [], [], [], [])
+
+        return _traverse_lxml(root)
+
+
+def _traverse_lxml(root) -> PageContent:
+    """
+    Pull the page content out of a parsed lxml document, in a single traversal.
+
+    :param root: The root element of the document
+    :return: The extracted page content
+    """
+
+    from lxml import etree
+
+    lang = root.get('lang')
+
+    page_body = root.find('body')
+    if page_body is None:
+        return PageContent(lang, [], [], [], [], [])
+
+    # Drop the text BeautifulSoup's `.text` leaves out, keeping the text that follows each element
+    etree.strip_elements(page_body, *HIDDEN_TAGS, with_tail=False)
+
+    paragraphs = []
+    headings_by_level = {h: [] for h in HEADING_TAGS}
+    div_bodies = []
+    list_items = []
+    links = []
+
+    for element in page_body.iter():
+        tag = element.tag
+
+        # Comments and processing instructions don't have a string tag
+        if not isinstance(tag, str):
+            continue
+
+        if tag == 'p':
+            paragraphs.append(element.text_content())
+        elif tag in headings_by_level:
+            headings_by_level[tag].append(element.text_content())
+        elif tag == 'div':
+            if 'body' in element.get('class', '').split():
+                div_bodies.append(element.text_content())
+        elif tag == 'li':
+            list_items.append(element.text_content())
+        elif tag == 'a':
+            href = element.get('href')
+            if href is not None:
+                links.append(href)
+
+    headings = [item for h in HEADING_TAGS for item in headings_by_level[h]]
+
+    return PageContent(lang, paragraphs, headings, div_bodies, list_items, links)
+
+
+# The available extraction backends, by name
+BACKENDS: Dict[str, Callable[..., PageContent]] = {
+    'bs4': extract_bs4,
+    'lxml': extract_lxml,
+}
+
+
+def get_backend(name: str) -> Callable[..., PageContent]:
+    """
+    Get an extraction backend by name.
+
+    :param name: The name of the backend. One of the keys of `BACKENDS`
+    :return: The extraction function
+    """
+
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown extraction backend '{name}'. Choose from: {', '.join(BACKENDS)}") from None
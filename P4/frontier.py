@@ -0,0 +1,227 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+
+class Frontier:
+    """
+    A crawl frontier shared by several crawler processes, possibly on several machines.
+
+    It holds the queue of requests still to download, the set of request fingerprints already seen (so each page is
+    only crawled once across all workers), the global budget of files to save, and the time each host may next be
+    contacted (so that adding workers doesn't make the crawl any less polite).
+
+    Backends are chosen with the `FRONTIER_BACKEND` setting, and must implement every method below.
+    """
+
+    @classmethod
+    def from_settings(cls, settings):
+        raise NotImplementedError
+
+    def push(self, fingerprint: str, host: str, data: bytes, priority: int) -> bool:
+        """
+        Add a request to the frontier, unless a request with the same fingerprint was ever added.
+
+        :param fingerprint: The request's fingerprint
+        :param host: The host the request is for
+        :param data: The serialized request
+        :param priority: The request's priority. Higher priorities are popped first
+        :return: Whether the request was added
+        """
+
+        raise NotImplementedError
+
+    def pop(self, delay: float) -> Optional[tuple]:
+        """
+        Claim the next request whose host may be contacted now, and hold that host off for `delay` seconds.
+
+        :param delay: How long to wait before the host of the claimed request may be contacted again
+        :return: The (fingerprint, data) of the claimed request, or None if no request is ready
+        """
+
+        raise NotImplementedError
+
+    def done(self, fingerprint: str) -> None:
+        """
+        Mark a claimed request as finished.
+
+        :param fingerprint: The request's fingerprint
+        """
+
+        raise NotImplementedError
+
+    def has_pending(self) -> bool:
+        """
+        :return: Whether any request is waiting to be claimed
+        """
+
+        raise NotImplementedError
+
+    def is_active(self, grace: float) -> bool:
+        """
+        Check whether any worker may still add requests: some are claimed, or were finished in the last `grace`
+        seconds and their pages may still be being parsed.
+
+        :param grace: How long, in seconds, after a request is finished its worker may still add requests
+        :return: Whether the crawl is still active
+        """
+
+        raise NotImplementedError
+
+    def claim_file(self, max_files: int) -> bool:
+        """
+        Reserve one file from the global budget of files to save.
+
+        :param max_files: The global budget
+        :return: Whether a file was reserved. False once the budget is spent
+        """
+
+        raise NotImplementedError
+
+    def release_file(self) -> None:
+        """
+        Give a reserved file back to the global budget, e.g. when the page ended up not being saved.
+        """
+
+        raise NotImplementedError
+
+    def files_used(self) -> int:
+        """
+        :return: How many files have been reserved across all workers
+        """
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+# The states of a request in the SQLite frontier
+_PENDING, _CLAIMED, _DONE = 0, 1, 2
+
+
+class SQLiteFrontier(Frontier):
+    """
+    A frontier stored in a single SQLite database, relying on SQLite's file locking to coordinate workers.
+
+    Every worker on the same machine (or on machines sharing a filesystem with working locks) opens the same database.
+    Requests that stay claimed for longer than the lease timeout, e.g. because their worker died, are handed out again.
+    """
+
+    def __init__(self, path: str, lease_timeout: float = 300.0):
+        """
+        :param path: The path to the database file
+        :param lease_timeout: How long, in seconds, a request may stay claimed before it is handed out again
+        """
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.lease_timeout = lease_timeout
+
+        # Autocommit mode, so that each claim can be wrapped in an explicit write transaction
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS requests (
+                id INTEGER PRIMARY KEY,
+                fingerprint TEXT UNIQUE NOT NULL,
+                host TEXT NOT NULL,
+                data BLOB NOT NULL,
+                priority INTEGER NOT NULL,
+                state INTEGER NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS requests_queue ON requests (state, priority DESC, id);
+            CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                next_allowed REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS budget (
+                name TEXT PRIMARY KEY,
+                used INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO budget (name, used) VALUES ('files', 0);
+            """
+        )
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get('FRONTIER_PATH'), settings.getfloat('FRONTIER_LEASE_TIMEOUT', 300.0))
+
+    def push(self, fingerprint: str, host: str, data: bytes, priority: int) -> bool:
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO requests (fingerprint, host, data, priority, state, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (fingerprint, host, data, priority, _PENDING, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def pop(self, delay: float) -> Optional[tuple]:
+        now = time.time()
+
+        # Take the write lock up front, so that no two workers can claim the same request or host slot
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Hand out requests whose worker seems to have died
+            self.connection.execute(
+                "UPDATE requests SET state = ? WHERE state = ? AND updated < ?",
+                (_PENDING, _CLAIMED, now - self.lease_timeout)
+            )
+
+            row = self.connection.execute(
+                "SELECT r.fingerprint, r.host, r.data FROM requests r LEFT JOIN hosts h ON h.host = r.host "
+                "WHERE r.state = ? AND (h.next_allowed IS NULL OR h.next_allowed <= ?) "
+                "ORDER BY r.priority DESC, r.id LIMIT 1",
+                (_PENDING, now)
+            ).fetchone()
+
+            if row is None:
+                self.connection.execute("COMMIT")
+                return None
+
+            fingerprint, host, data = row
+            self.connection.execute(
+                "UPDATE requests SET state = ?, updated = ? WHERE fingerprint = ?", (_CLAIMED, now, fingerprint)
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO hosts (host, next_allowed) VALUES (?, ?)", (host, now + delay)
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return fingerprint, data
+
+    def done(self, fingerprint: str) -> None:
+        self.connection.execute(
+            "UPDATE requests SET state = ?, updated = ? WHERE fingerprint = ?", (_DONE, time.time(), fingerprint)
+        )
+
+    def has_pending(self) -> bool:
+        row = self.connection.execute("SELECT 1 FROM requests WHERE state = ? LIMIT 1", (_PENDING,)).fetchone()
+        return row is not None
+
+    def is_active(self, grace: float) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM requests WHERE state = ? OR (state = ? AND updated >= ?) LIMIT 1",
+            (_CLAIMED, _DONE, time.time() - grace)
+        ).fetchone()
+        return row is not None
+
+    def claim_file(self, max_files: int) -> bool:
+        cursor = self.connection.execute(
+            "UPDATE budget SET used = used + 1 WHERE name = 'files' AND used < ?", (max_files,)
+        )
+        return cursor.rowcount == 1
+
+    def release_file(self) -> None:
+        self.connection.execute("UPDATE budget SET used = used - 1 WHERE name = 'files' AND used > 0")
+
+    def files_used(self) -> int:
+        return self.connection.execute("SELECT used FROM budget WHERE name = 'files'").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
@@ -7,6 +7,20 @@ import scrapy
 
 
 class P4Item(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+    # The URL of the page
+    url = scrapy.Field()
+
+    # The file the page's text is saved to
+    filename = scrapy.Field()
+
+    # The raw text of the page's paragraphs, headings, body divs and list items, as a list of lists of strings.
+    # These are cleaned by the `CleaningPipeline`, off the reactor thread
+    fragments = scrapy.Field()
+
+    # The cleaned text of the page, filled in by the `CleaningPipeline`
+    text = scrapy.Field()
+
+    # The URL of an earlier page this one is a near duplicate of, and their estimated Jaccard similarity, filled in by
+    # the `NearDuplicatePipeline` when tagging rather than dropping near duplicates
+    duplicate_of = scrapy.Field()
+    similarity = scrapy.Field()
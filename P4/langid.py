@@ -0,0 +1,66 @@
+import re
+from collections import Counter
+from typing import Optional, Tuple
+
+# The most frequent character trigrams of each language, most frequent first (spaces mark word boundaries). These are
+# small, hand-picked versions of the rank profiles from Cavnar & Trenkle, "N-Gram-Based Text Categorization" (1994),
+# enough to tell English and French pages apart
+PROFILES = {
+    'en': [' th', 'the', 'he ', 'and', ' an', 'nd ', 'ing', ' to', 'to ', 'ng ', ' of', 'of ', 'er ', 'in ', 'ed ',
+           ' in', 'is ', 'ion', 'tio', 'ent', ' re', 're ', 'on ', 'at ', ' co', 'es ', 'for', ' fo', 'or ', 'ati',
+           'ter', 'hat', 'tha', ' is', 'his', 'as ', ' be', 'it ', 'ou ', 'you', ' yo', ' wi', 'wit', 'ith', 'th ',
+           've ', 'all', ' ha', 'are', ' ar', 'ly ', 'st ', ' st', 'our', 'ers', 'ons', ' on', 'ive', 'hip', 'ts '],
+    'fr': [' de', 'de ', 'es ', 'le ', ' le', 'ent', ' la', 'la ', 'les', ' et', 'et ', 'ion', 'tio', 're ', 'nt ',
+           ' pa', ' co', 'ue ', 'on ', ' qu', 'que', 'des', ' pr', 'ons', 'ne ', ' un', 'une', 'ur ', ' po', 'our',
+           'pou', 'men', 'eme', 'ait', 'est', ' es', ' en', 'en ', ' du', 'du ', 'aux', ' au', 'ité', 'té ', ' à ',
+           'ées', 'ée ', 'ais', 'par', ' se', 'dan', 'ans', 'qui', ' l\'', 'ser', 'eur', 'ez ', 'à l', 'é d', 'és '],
+}
+
+# Each profile as a map from trigram to weight. More frequent trigrams weigh more
+_WEIGHTS = {lang: {gram: len(grams) - rank for rank, gram in enumerate(grams)} for lang, grams in PROFILES.items()}
+
+_TAGS = re.compile(r'<(script|style)\b.*?</\1>|<[^>]+>', re.S | re.I)
+_NON_LETTERS = re.compile(r"[^\w']+")
+
+
+def visible_text(html: str) -> str:
+    """
+    Roughly strip the markup, scripts and styles out of some HTML. Good enough to guess the language of a page
+    without parsing it.
+
+    :param html: The HTML
+    :return: The text
+    """
+
+    return _TAGS.sub(' ', html)
+
+
+def identify(text: str, min_trigrams: int = 50) -> Tuple[Optional[str], float]:
+    """
+    Guess the language of some text from its character trigrams.
+
+    :param text: The text
+    :param min_trigrams: The fewest known trigrams needed to make a guess
+    :return: The language code, and the share of the total score it got (between 0.5 and 1 for two languages).
+             The language is None if there isn't enough text to tell
+    """
+
+    text = f" {_NON_LETTERS.sub(' ', text.lower())} "
+    grams = Counter(text[i:i + 3] for i in range(len(text) - 2))
+
+    scores = {lang: 0 for lang in _WEIGHTS}
+    known = 0
+    for gram, count in grams.items():
+        for lang, weights in _WEIGHTS.items():
+            weight = weights.get(gram)
+            if weight is not None:
+                scores[lang] += weight * count
+                known += count
+
+    total = sum(scores.values())
+    if known < min_trigrams or total == 0:
+        return None, 0.0
+
+    lang = max(scores, key=scores.get)
+
+    return lang, scores[lang] / total
@@ -0,0 +1,272 @@
+import io
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from P4.resources import AFINN_111, afinn_165, bundled_source, lexicon_folder, lexicon_source, write_atomic
+
+# A token is a run of word characters or a single other character. Each one is captured along with the whitespace
+# before it, to tell "cover-up" from "cover - up"
+TOKEN_PATTERN = re.compile(r"(\s*)(\w+|[^\w\s])")
+
+
+class Lexicon:
+    """
+    A sentiment lexicon like AFINN, compiled into a token trie for scoring many texts at once.
+
+    Entries can be single words or phrases ("does not work", "can't stand"). Each entry is split into tokens, and the
+    trie has an edge for each token, keyed by the token's id and whether it directly follows the one before it. Texts
+    are matched the way the `afinn` library does with its regular expression: lowercased, taking the longest entry
+    starting at each token, then carrying on after it.
+
+    Everything is held in a few flat NumPy arrays, which can be saved and memory-mapped back with `load`:
+
+    - `tokens`: every token of the entries, sorted
+    - `entries` and `weights`: each entry and its score
+    - `edge_keys` and `edge_children`: the sorted edges of the trie, and the node each one leads to. The key of an edge
+      is `node * 2 * len(tokens) + 2 * token + joined`
+    - `node_entries`: the entry ending at each node of the trie, or -1
+    """
+
+    def __init__(self, tokens: np.ndarray, entries: np.ndarray, weights: np.ndarray, edge_keys: np.ndarray,
+                 edge_children: np.ndarray, node_entries: np.ndarray):
+        self.tokens = tokens
+        self.entries = entries
+        self.weights = weights
+        self.edge_keys = edge_keys
+        self.edge_children = edge_children
+        self.node_entries = node_entries
+
+        # The longest entry, in tokens, is the deepest node of the trie
+        self.max_length = max((len(_tokenize(entry)[0]) for entry in entries.tolist()), default=0)
+
+        # Tokens are looked up in a dict, which is much faster than searching the sorted array one token at a time
+        self._ids = {token: i for i, token in enumerate(tokens.tolist())}
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Lexicon':
+        """
+        Compile a lexicon from a tab-separated file of entries and their scores, like `AFINN-111.txt`.
+
+        :param path: The file
+        :return: The lexicon
+        """
+
+        scores = {}
+        with open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry, score = line.rstrip('\n').split('\t')
+                scores[entry] = int(score)
+
+        return cls.from_dict(scores)
+
+    @classmethod
+    def from_dict(cls, scores: dict) -> 'Lexicon':
+        """
+        Compile a lexicon from a dict of entries and their scores.
+
+        :param scores: The score of each entry
+        :return: The lexicon
+        """
+
+        entries = sorted(scores)
+        split = [_tokenize(entry) for entry in entries]
+
+        tokens = sorted({token for entry_tokens, _ in split for token in entry_tokens})
+        ids = {token: i for i, token in enumerate(tokens)}
+
+        # Build the trie as a dict of edges first, numbering the nodes as they are created. The root is node 0
+        edges = {}
+        node_entries = [-1]
+        for i, (entry_tokens, joined) in enumerate(split):
+            node = 0
+            for depth, token in enumerate(entry_tokens):
+                key = node * 2 * len(tokens) + 2 * ids[token] + (joined[depth] if depth > 0 else 0)
+                if key not in edges:
+                    edges[key] = len(node_entries)
+                    node_entries.append(-1)
+                node = edges[key]
+            node_entries[node] = i
+
+        edge_keys = np.array(sorted(edges), dtype=np.int64)
+
+        return cls(np.array(tokens, dtype=str), np.array(entries, dtype=str),
+                   np.array([scores[entry] for entry in entries], dtype=np.float32), edge_keys,
+                   np.array([edges[key] for key in edge_keys.tolist()], dtype=np.int32),
+                   np.array(node_entries, dtype=np.int32))
+
+    def save(self, folder: str, source: Optional[dict] = None) -> None:
+        """
+        Save the compiled lexicon as one `.npy` file per array, so that `load` can memory-map them. Each file is
+        replaced at once, so a process loading the lexicon meanwhile never reads a partly written one.
+
+        :param folder: The folder to save to
+        :param source: The size and modification time of the file it was compiled from, if any
+        """
+
+        folder = Path(folder)
+
+        for name in ('tokens', 'entries', 'weights', 'edge_keys', 'edge_children', 'node_entries'):
+            buffer = io.BytesIO()
+            np.save(buffer, getattr(self, name))
+            write_atomic(folder / f'{name}.npy', buffer.getvalue())
+
+        meta = {'entries': len(self.entries), 'nodes': len(self.node_entries), 'source': source}
+        write_atomic(folder / 'meta.json', json.dumps(meta, indent=2).encode('utf-8'))
+
+    @classmethod
+    def load(cls, folder: str) -> Optional['Lexicon']:
+        """
+        Memory-map a lexicon saved with `save`.
+
+        :param folder: The folder it was saved to
+        :return: The lexicon, or None if there is none in the folder
+        """
+
+        folder = Path(folder)
+        if not (folder / 'meta.json').exists():
+            return None
+
+        return cls(*(np.load(folder / f'{name}.npy', mmap_mode='r')
+                     for name in ('tokens', 'entries', 'weights', 'edge_keys', 'edge_children', 'node_entries')))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def find_all(self, text: str) -> List[str]:
+        """
+        :param text: Any text
+        :return: The entries found in it, in order
+        """
+
+        _, entries, _ = self._matches([text])
+
+        return [str(self.entries[i]) for i in entries.tolist()]
+
+    def score(self, text: str) -> float:
+        """
+        :param text: Any text
+        :return: The sum of the scores of the entries found in it
+        """
+
+        return float(self.score_many([text])[0])
+
+    def score_many(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        Score many texts at once, as the product of their entry counts and the entries' scores.
+
+        :param texts: The texts
+        :return: The score of each text
+        """
+
+        return self.counts(texts) @ self.weights
+
+    def counts(self, texts: Iterable[str]):
+        """
+        :param texts: The texts
+        :return: The number of times each entry is found in each text, as a `scipy.sparse.csr_matrix` with one row per
+                 text and one column per entry
+        """
+
+        from scipy import sparse
+
+        documents, entries, n_texts = self._matches(texts)
+
+        counts = sparse.csr_matrix((np.ones(len(entries), dtype=np.float32), (documents, entries)),
+                                   shape=(n_texts, len(self.entries)))
+        counts.sum_duplicates()
+
+        return counts
+
+    def _matches(self, texts: Iterable[str]):
+        """
+        Find the entries in every text, walking the trie from every token at once, one level at a time.
+
+        :param texts: The texts
+        :return: The text of each match, its entry, and the number of texts
+        """
+
+        ids, joined, ends, documents = [], [], [], []
+        n_texts = 0
+        for n_texts, text in enumerate(texts, start=1):
+            tokens, text_joined = _tokenize(text.lower())
+            ids.extend(self._ids.get(token, -1) for token in tokens)
+            joined.extend(text_joined)
+            ends.extend([len(ids)] * len(tokens))
+            documents.extend([n_texts - 1] * len(tokens))
+
+        ids = np.array(ids, dtype=np.int64)
+        joined = np.array(joined, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+        documents = np.array(documents, dtype=np.int64)
+
+        # The node reached from each starting token, and the longest entry found from it so far
+        starts = np.arange(len(ids))
+        nodes = np.zeros(len(ids), dtype=np.int64)
+        alive = ids >= 0
+        lengths = np.zeros(len(ids), dtype=np.int64)
+        found = np.full(len(ids), -1, dtype=np.int64)
+
+        for depth in range(self.max_length):
+            alive &= starts + depth < ends
+            active = np.flatnonzero(alive)
+            positions = active + depth
+
+            keys = nodes[active] * 2 * len(self.tokens) + 2 * ids[positions] + (joined[positions] if depth else 0)
+            edges = np.searchsorted(self.edge_keys, keys)
+            exists = (ids[positions] >= 0) & (edges < len(self.edge_keys))
+            exists[exists] = self.edge_keys[edges[exists]] == keys[exists]
+
+            alive[active[~exists]] = False
+            active, edges = active[exists], edges[exists]
+            nodes[active] = self.edge_children[edges]
+
+            entries = self.node_entries[nodes[active]]
+            ended = entries >= 0
+            found[active[ended]] = entries[ended]
+            lengths[active[ended]] = depth + 1
+
+        # Like the regular expression, take the longest match at the first token, then carry on after it
+        matched, kept = np.flatnonzero(found >= 0).tolist(), []
+        end = 0
+        for start in matched:
+            if start >= end:
+                kept.append(start)
+                end = start + lengths[start]
+
+        return documents[kept], found[kept], n_texts
+
+
+def _tokenize(text: str):
+    """
+    :param text: Any text
+    :return: Its tokens, and whether each one directly follows the one before it
+    """
+
+    pairs = TOKEN_PATTERN.findall(text)
+
+    return [token for _, token in pairs], [int(not space) for space, _ in pairs]
+
+
+@lru_cache(maxsize=None)
+def get_lexicon(path: str = AFINN_111) -> Lexicon:
+    """
+    Memory-map a lexicon from the resource bundle (see `P4.resources`), compiling it into the bundle first if it isn't
+    there or its file has changed since. It is only loaded once per process.
+
+    :param path: The lexicon's file, or the folder of a compiled lexicon
+    :return: The lexicon
+    """
+
+    if Path(path).is_dir():
+        return Lexicon.load(path)
+
+    folder, source = lexicon_folder(path), lexicon_source(path)
+    if bundled_source(folder) != source:
+        Lexicon.from_file(path).save(folder, source=source)
+
+    return Lexicon.load(folder)
@@ -0,0 +1,226 @@
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# The matrices smaller than this along their shortest side are decomposed exactly with ARPACK. Larger ones use the
+# randomized solver, which is much faster and only approximate
+ARPACK_MAX_SIDE = 5000
+
+# The share of the memory left over once the TF-IDF matrix is built that the randomized SVD may use
+SVD_MEMORY_SHARE = 0.5
+
+
+def document_frequencies(documents: Iterable[str], analyzer) -> Tuple[Counter, int]:
+    """
+    Count in how many documents each term is found, one document at a time, without building a matrix.
+
+    :param documents: The text of each document
+    :param analyzer: The analyzer of the vectorizer, to tokenize the documents the same way
+    :return: The document frequency of each term, and the number of documents
+    """
+
+    df = Counter()
+    n_documents = 0
+    for text in documents:
+        df.update(set(analyzer(text)))
+        n_documents += 1
+
+    return df, n_documents
+
+
+def prune_vocabulary(df: Counter, n_documents: int, max_df: float, min_df: float) -> List[str]:
+    """
+    Keep the terms within `max_df` and `min_df`, the same way `TfidfVectorizer` prunes its vocabulary.
+
+    :param df: The document frequency of each term
+    :param n_documents: The number of documents
+    :param max_df: Drop terms found in more than this share (or number, if an int) of the documents
+    :param min_df: Drop terms found in fewer than this share (or number, if an int) of the documents
+    :return: The kept terms, sorted alphabetically
+    """
+
+    high = max_df if isinstance(max_df, int) else max_df * n_documents
+    low = min_df if isinstance(min_df, int) else min_df * n_documents
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    terms = sorted(term for term, count in df.items() if low <= count <= high)
+    if not terms:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    return terms
+
+
+def svd_parameters(n_samples: int, n_features: int, n_components: int, available_bytes: float,
+                   itemsize: int = 4) -> dict:
+    """
+    Choose the SVD solver and its oversampling for a matrix size and a memory budget.
+
+    Small matrices are decomposed exactly with ARPACK. Larger ones use the randomized solver, whose working memory
+    grows with the number of components plus the oversampling, in dense blocks as tall as each side of the matrix.
+    More oversampling gives a more accurate decomposition of text, whose singular values decay slowly, so it is made as
+    large as the budget allows, between 10 and `n_components`.
+
+    :param n_samples: The number of rows of the matrix
+    :param n_features: The number of columns of the matrix
+    :param n_components: The number of components to keep
+    :param available_bytes: The memory the SVD may use
+    :param itemsize: The size of each value of the matrix, in bytes
+    :return: The parameters of the `TruncatedSVD`
+    """
+
+    if n_components < min(n_samples, n_features) <= ARPACK_MAX_SIDE:
+        return {'n_components': n_components, 'algorithm': 'arpack'}
+
+    # The range finder holds about three blocks of each side of the matrix at once
+    bytes_per_column = 3 * (n_samples + n_features) * itemsize
+    oversamples = int(available_bytes * SVD_MEMORY_SHARE // bytes_per_column) - n_components
+
+    return {'n_components': n_components, 'algorithm': 'randomized',
+            'n_oversamples': max(10, min(oversamples, n_components))}
+
+
+def top_terms(svd, centers: np.ndarray, n: int = 20, block_size: int = 65536,
+              return_weights: bool = False):
+    """
+    Find the terms with the highest weights in each centroid, once mapped back from the LSA space.
+
+    This gives the same terms as `svd.inverse_transform(centers).argsort()[:, ::-1][:, :n]`, but maps the centroids
+    back one block of terms at a time, keeping only the best `n` of each, instead of building and sorting dense
+    centroids over the whole vocabulary.
+
+    :param svd: The fitted SVD step of the LSA reduction
+    :param centers: The centroids, in the LSA space
+    :param n: The number of terms to keep for each centroid
+    :param block_size: The number of terms to map back at once
+    :param return_weights: Whether to also return the weights of the top terms
+    :return: The index of the top terms of each centroid, best first, and their weights if `return_weights`
+    """
+
+    components = svd.components_
+    n_features = components.shape[1]
+
+    best_weights = np.empty((len(centers), 0), dtype=components.dtype)
+    best_terms = np.empty((len(centers), 0), dtype=np.intp)
+
+    for start in range(0, n_features, block_size):
+        weights = np.hstack([best_weights, centers @ components[:, start:start + block_size]])
+        terms = np.hstack([best_terms, np.broadcast_to(np.arange(start, min(start + block_size, n_features)),
+                                                       (len(centers), min(block_size, n_features - start)))])
+
+        keep, best_weights = largest(weights, n)
+        best_terms = np.take_along_axis(terms, keep, axis=1)
+
+    if return_weights:
+        return best_terms, best_weights
+
+    return best_terms
+
+
+def largest(weights: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the `n` largest weights of each row with a partial selection, sorting only those rather than whole rows.
+
+    :param weights: The weights, one row each
+    :param n: The number of weights to keep for each row
+    :return: The columns of the largest weights of each row, largest first, and those weights
+    """
+
+    n = min(n, weights.shape[1])
+    columns = np.argpartition(-weights, n - 1, axis=1)[:, :n] if n < weights.shape[1] else \
+        np.broadcast_to(np.arange(n), weights.shape)
+
+    best = np.take_along_axis(weights, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind='stable')
+
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+class MemoryReport:
+    """
+    Report the peak resident memory (RSS) of each stage of the clustering.
+
+    On Linux, the peak is reset at the start of each stage, so each stage gets its own peak. Elsewhere, it can't be
+    reset, so the peak reported is the highest so far.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        :param enabled: Whether to report anything. When False, `stage` does nothing
+        """
+
+        self.enabled = enabled
+        self.peaks = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure the peak memory of the code run within this context.
+
+        :param name: The name of the stage
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        _reset_peak_rss()
+        yield
+
+        peak = _peak_rss()
+        self.peaks[name] = peak
+        if peak is not None:
+            print(f"\n[memory] {name}: peak RSS {peak / 2 ** 20:,.0f} MB")
+
+
+def current_rss() -> Optional[int]:
+    """
+    :return: The resident memory of this process, in bytes, or None if it can't be read
+    """
+
+    return _read_status('VmRSS')
+
+
+def _reset_peak_rss() -> None:
+    # Writing 5 to clear_refs resets the peak RSS of the process (Linux 4.0+)
+    try:
+        with open('/proc/self/clear_refs', 'wt') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss() -> Optional[int]:
+    peak = _read_status('VmHWM')
+    if peak is not None or resource is None:
+        return peak
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _read_status(field: str) -> Optional[int]:
+    """
+    :param field: A memory field of `/proc/self/status`, e.g. VmRSS
+    :return: Its value in bytes, or None if it can't be read
+    """
+
+    try:
+        with open('/proc/self/status', 'rt') as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
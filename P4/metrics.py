@@ -0,0 +1,155 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# The upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    A latency histogram with fixed buckets, in the style of a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+
+        # One count per bucket, plus one for values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        :param q: The quantile, between 0 and 1
+        :return: The estimated value
+        """
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+
+        return float('inf')
+
+
+class Metrics:
+    """
+    Per-stage latency histograms, counters and gauges for a crawl, exportable as a Prometheus textfile or as a JSON
+    summary.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+        self.started = time.monotonic()
+
+    @contextmanager
+    def time(self, stage: str):
+        """
+        Time the body of a `with` block as one observation of a stage.
+
+        :param stage: The name of the stage
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+
+        histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def to_prometheus(self) -> str:
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+
+        lines = ['# TYPE crawl_stage_seconds histogram']
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'crawl_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'crawl_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'crawl_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'crawl_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines.append('# TYPE crawl_total counter')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'crawl_total{{name="{name}"}} {value}')
+
+        lines.append('# TYPE crawl_gauge gauge')
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f'crawl_gauge{{name="{name}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """
+        :return: A summary of the metrics, for saving as JSON
+        """
+
+        elapsed = time.monotonic() - self.started
+
+        return {
+            'elapsed_seconds': elapsed,
+            'pages_per_second': self.counters.get('pages', 0) / elapsed if elapsed else 0.0,
+            'stages': {
+                stage: {
+                    'count': h.count,
+                    'total_seconds': h.sum,
+                    'mean_seconds': h.sum / h.count if h.count else 0.0,
+                    'p50_seconds': h.quantile(0.5),
+                    'p95_seconds': h.quantile(0.95),
+                    'p99_seconds': h.quantile(0.99),
+                }
+                for stage, h in sorted(self.histograms.items())
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': dict(sorted(self.gauges.items())),
+        }
+
+
+class NullMetrics:
+    """
+    Stand-in for `Metrics` when instrumentation is turned off. Every method does nothing.
+    """
+
+    @contextmanager
+    def time(self, stage: str):
+        yield
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def inc(self, name: str, value: float = 1) -> None:
+        pass
+
+    def set_gauge(self, name: str, value: float) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
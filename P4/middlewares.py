@@ -3,7 +3,17 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import re
+import time
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured, StopDownload
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from twisted.internet import task
+
+from P4.archive import ArchiveReader, ArchiveWriter
+from P4.langid import identify, visible_text
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -101,3 +111,411 @@ class P4DownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class ConditionalRequestMiddleware:
+    """
+    When the spider is crawling incrementally, turn requests for previously crawled pages into HTTP
+    conditional requests, using the validators remembered in the spider's `PageCache`.
+
+    Unchanged pages then come back as a bodiless 304 instead of being downloaded again.
+    """
+
+    # Statuses the spider handles itself when crawling incrementally, instead of having them filtered out
+    HANDLED_STATUSES = [304, 404, 410]
+
+    def process_request(self, request, spider):
+        cache = getattr(spider, 'page_cache', None)
+        if cache is None:
+            return None
+
+        request.meta.setdefault('handle_httpstatus_list', self.HANDLED_STATUSES)
+
+        page = cache.get(request.url)
+        if page is None:
+            return None
+
+        if page.etag:
+            request.headers.setdefault('If-None-Match', page.etag)
+        if page.last_modified:
+            request.headers.setdefault('If-Modified-Since', page.last_modified)
+
+        return None
+
+
+class _HostState:
+    """
+    The recent health of one host, as seen by the `AdaptiveThrottleMiddleware`.
+    """
+
+    def __init__(self):
+        self.responses = 0
+        self.errors = 0
+        self.total_latency = 0.0
+
+    def record(self, latency: float, error: bool) -> None:
+        self.responses += 1
+        self.errors += int(error)
+        self.total_latency += latency
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+class AdaptiveThrottleMiddleware:
+    """
+    Adapt each host's download delay and concurrency to how well it is coping, instead of a fixed `DOWNLOAD_DELAY`
+    and one connection at a time.
+
+    Every `ADAPTIVE_THROTTLE_WINDOW` responses from a host, its mean latency and error rate are checked. While the host
+    is healthy (latency under `ADAPTIVE_THROTTLE_TARGET_LATENCY`, error rate under `ADAPTIVE_THROTTLE_ERROR_RATE`),
+    the delay is cut, and once it is at `ADAPTIVE_THROTTLE_MIN_DELAY`, one more concurrent request is allowed, up to
+    `ADAPTIVE_THROTTLE_MAX_CONCURRENCY`. When it isn't, concurrency is halved and the delay doubled. A 429 or 503,
+    or a download error, backs off immediately, honouring any Retry-After header.
+
+    The minimum delay and maximum concurrency are the ceiling on the load put on each host. They default to
+    `DOWNLOAD_DELAY` and a single request, so the throttle only backs off unless they are set.
+    """
+
+    # Statuses that mean the host is overloaded or asking us to slow down
+    BACKOFF_STATUSES = (429, 503)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.stats = crawler.stats
+
+        # Unless they are set, never crawl a host faster than DOWNLOAD_DELAY allows, nor more than one request at a time
+        self.min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', settings.getfloat('DOWNLOAD_DELAY'))
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 60.0)
+        self.max_concurrency = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 1)
+        self.target_latency = settings.getfloat('ADAPTIVE_THROTTLE_TARGET_LATENCY', 2.0)
+        self.max_error_rate = settings.getfloat('ADAPTIVE_THROTTLE_ERROR_RATE', 0.1)
+        self.window = settings.getint('ADAPTIVE_THROTTLE_WINDOW', 10)
+        self.timeline_interval = settings.getfloat('ADAPTIVE_THROTTLE_TIMELINE_INTERVAL', 60.0)
+
+        self.hosts = {}
+
+        self.timeline = []
+        self.timeline_task = None
+        self.started = None
+        self.last_count = 0
+        self.last_time = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_response(self, request, response, spider):
+        key, slot = self._get_slot(request)
+        if slot is None:
+            return response
+
+        state = self.hosts.setdefault(key, _HostState())
+
+        if response.status in self.BACKOFF_STATUSES:
+            state.record(self.target_latency, error=True)
+            self._back_off(key, slot, _retry_after(response))
+        else:
+            state.record(request.meta.get('download_latency', 0.0), error=response.status >= 500)
+            if state.responses >= self.window:
+                self._adjust(key, slot, state)
+
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self._get_slot(request)
+        if slot is not None:
+            self.hosts.setdefault(key, _HostState()).record(self.target_latency, error=True)
+            self._back_off(key, slot)
+
+    def spider_opened(self, spider):
+        self.started = self.last_time = time.monotonic()
+        self.timeline_task = task.LoopingCall(self._record_timeline)
+        self.timeline_task.start(self.timeline_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.timeline_task is not None and self.timeline_task.running:
+            self.timeline_task.stop()
+        self._record_timeline()
+
+    def _get_slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _adjust(self, key: str, slot, state: _HostState) -> None:
+        """
+        Speed up or slow down a host, based on its health over the last window of responses.
+        """
+
+        mean_latency = state.total_latency / state.responses
+        error_rate = state.errors / state.responses
+        state.reset()
+
+        if mean_latency > self.target_latency or error_rate > self.max_error_rate:
+            self._back_off(key, slot)
+        elif slot.delay > self.min_delay:
+            slot.delay = max(self.min_delay, slot.delay * 0.75)
+            self._log_change(key, slot, 'speed_up')
+        elif slot.concurrency < self.max_concurrency:
+            slot.concurrency += 1
+            self._log_change(key, slot, 'speed_up')
+
+    def _back_off(self, key: str, slot, retry_after: float = 0.0) -> None:
+        """
+        Slow a host down: halve its concurrency and double its delay (or wait as long as it asked us to).
+        """
+
+        slot.concurrency = max(1, slot.concurrency // 2)
+        slot.delay = min(self.max_delay, max(slot.delay * 2, self.min_delay, retry_after))
+        self.hosts[key].reset()
+        self._log_change(key, slot, 'back_off')
+
+    def _log_change(self, key: str, slot, direction: str) -> None:
+        self.stats.inc_value(f'adaptive_throttle/{direction}')
+        self.crawler.spider.logger.debug(
+            f"Adaptive throttle ({direction}) for {key}: delay {slot.delay:.2f}s, concurrency {slot.concurrency}"
+        )
+
+    def _record_timeline(self) -> None:
+        """
+        Record the crawl throughput since the last entry, and each host's current delay and concurrency.
+        """
+
+        count = self.stats.get_value('response_received_count', 0)
+        slots = self.crawler.engine.downloader.slots
+
+        # The last entry, recorded when the spider closes, usually covers less than a full interval
+        now = time.monotonic()
+        elapsed = now - self.last_time
+
+        self.timeline.append({
+            'elapsed': round(now - self.started, 1),
+            'pages_per_minute': round((count - self.last_count) * 60 / elapsed, 1) if elapsed > 0 else 0.0,
+            'hosts': {key: {'delay': round(slots[key].delay, 2), 'concurrency': slots[key].concurrency}
+                      for key in self.hosts if key in slots},
+        })
+        self.last_count = count
+        self.last_time = now
+
+        self.stats.set_value('adaptive_throttle/timeline', self.timeline)
+
+
+def _retry_after(response) -> float:
+    """
+    Get how long a host asked us to wait, from the Retry-After header of its response.
+
+    :param response: The response from the internet
+    :return: The number of seconds to wait, or 0 if the header is missing or isn't a number of seconds
+    """
+
+    value = response.headers.get('Retry-After')
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ResponseFilterMiddleware:
+    """
+    Cheaply reject responses the spider would throw away anyway, before they are parsed (and, where possible, before
+    they are even downloaded):
+
+    - URLs matching a pattern of `RESPONSE_FILTER_URL_BLOCKLIST` are never requested.
+    - Responses whose Content-Type isn't in `RESPONSE_FILTER_CONTENT_TYPES`, or whose Content-Length is over
+      `RESPONSE_FILTER_MAX_SIZE`, are cut off as soon as their headers arrive.
+    - Pages whose `<html lang=...>` isn't in `RESPONSE_FILTER_LANGUAGES` are rejected from a sniff of the first bytes
+      of the body. Pages without a lang attribute have their language guessed from character trigrams instead.
+
+    The number of rejections, the bytes they came to, and an estimate of the parse time they saved are kept in the
+    `response_filter/` stats.
+    """
+
+    # How many bytes of the body to sniff for the <html> tag, and to guess the language from
+    SNIFF_BYTES = 4096
+    LANGID_BYTES = 65536
+
+    _LANG_ATTRIBUTE = re.compile(rb'<html\b[^>]*?\blang\s*=\s*["\']?([a-zA-Z]+)', re.I)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RESPONSE_FILTER_ENABLED'):
+            raise NotConfigured
+
+        self.stats = crawler.stats
+
+        self.blocklist = [re.compile(pattern) for pattern in settings.getlist('RESPONSE_FILTER_URL_BLOCKLIST')]
+        self.content_types = [t.encode() for t in settings.getlist('RESPONSE_FILTER_CONTENT_TYPES')]
+        self.max_size = settings.getint('RESPONSE_FILTER_MAX_SIZE', 5 * 1024 * 1024)
+        self.languages = set(settings.getlist('RESPONSE_FILTER_LANGUAGES'))
+        self.min_confidence = settings.getfloat('RESPONSE_FILTER_LANGID_CONFIDENCE', 0.6)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        for pattern in self.blocklist:
+            if pattern.search(request.url):
+                self._reject('url', 0)
+                raise IgnoreRequest(f"URL is blocklisted: {request.url}")
+
+        return None
+
+    def headers_received(self, headers, body_length, request, spider):
+        # robots.txt is plain text, but the RobotsTxtMiddleware needs all of it: an empty one allows everything
+        if request.url.endswith('/robots.txt'):
+            return
+
+        # Stop downloading the body of responses that will be rejected anyway. The response still reaches
+        # process_response, flagged as stopped, and is rejected there
+        if self._bad_content_type(headers) or body_length > self.max_size:
+            raise StopDownload(fail=False)
+
+    def process_response(self, request, response, spider):
+        # Only pages with content are filtered. 304s, errors, redirects, robots.txt etc. go through as they are
+        if response.status != 200 or request.url.endswith('/robots.txt'):
+            return response
+
+        reason = self._rejection_reason(response)
+        if reason is None:
+            return response
+
+        self._reject(reason, int(response.headers.get('Content-Length', len(response.body))))
+        raise IgnoreRequest(f"Rejected before parsing ({reason}): {response.url}")
+
+    def spider_closed(self, spider):
+        # Estimate the parse time saved from the average parse time per byte of the pages that were parsed
+        parse_seconds = self.stats.get_value('parse/seconds', 0.0)
+        parse_bytes = self.stats.get_value('parse/bytes', 0)
+        rejected_bytes = self.stats.get_value('response_filter/bytes_rejected', 0)
+
+        if parse_bytes:
+            self.stats.set_value('response_filter/parse_seconds_saved', rejected_bytes * parse_seconds / parse_bytes)
+
+    def _rejection_reason(self, response):
+        """
+        Decide whether a response should be rejected before parsing.
+
+        :param response: The response from the internet
+        :return: Why the response is rejected, or None if it isn't
+        """
+
+        if self._bad_content_type(response.headers):
+            return 'content_type'
+
+        if 'download_stopped' in response.flags or len(response.body) > self.max_size:
+            return 'size'
+
+        if self.languages:
+            match = self._LANG_ATTRIBUTE.search(response.body[:self.SNIFF_BYTES])
+            if match is not None:
+                lang = match.group(1).decode('ascii').lower()
+                if lang not in self.languages:
+                    return 'language'
+            else:
+                text = visible_text(response.body[:self.LANGID_BYTES].decode('utf-8', errors='ignore'))
+                lang, confidence = identify(text)
+                if lang is not None and lang not in self.languages and confidence >= self.min_confidence:
+                    return 'language_guessed'
+
+        return None
+
+    def _bad_content_type(self, headers) -> bool:
+        content_type = headers.get('Content-Type')
+        if content_type is None or not self.content_types:
+            return False
+
+        return not any(content_type.lower().startswith(t) for t in self.content_types)
+
+    def _reject(self, reason: str, size: int) -> None:
+        self.stats.inc_value(f'response_filter/rejected/{reason}')
+        self.stats.inc_value('response_filter/bytes_rejected', size)
+
+
+class ArchiveMiddleware:
+    """
+    Record the crawl's responses to a WARC archive, or replay a recorded crawl from one without touching the network.
+
+    - In `record` mode, every response is appended to `ARCHIVE_PATH` as it came off the wire, before it is
+      decompressed, redirected or filtered, so replaying it goes through the same middlewares as the live crawl.
+    - In `replay` mode, requests are answered from `ARCHIVE_PATH` after `ARCHIVE_REPLAY_LATENCY` seconds, instead of
+      being downloaded. Requests for URLs that weren't recorded are dropped. Since replayed requests never reach the
+      downloader, the download delay and the adaptive throttle don't apply; the latency and `CONCURRENT_REQUESTS`
+      set the pace instead.
+
+    The number of responses recorded, replayed and missing from the archive are kept in the `archive/` stats.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.mode = settings.get('ARCHIVE_MODE')
+        if self.mode not in ('record', 'replay'):
+            raise NotConfigured
+
+        self.stats = crawler.stats
+        self.path = settings.get('ARCHIVE_PATH', 'crawl_state/crawl.warc.gz')
+        self.latency = settings.getfloat('ARCHIVE_REPLAY_LATENCY', 0.0)
+
+        self.writer = None
+        self.reader = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        if self.mode == 'record':
+            self.writer = ArchiveWriter(self.path)
+        else:
+            self.reader = ArchiveReader(self.path)
+            spider.logger.info(f"Replaying {len(self.reader)} responses from {self.path}")
+
+    def spider_closed(self, spider):
+        if self.writer is not None:
+            self.writer.close()
+        if self.reader is not None:
+            self.reader.close()
+
+    def process_request(self, request, spider):
+        if self.reader is None:
+            return None
+
+        if request.url not in self.reader:
+            self.stats.inc_value('archive/missing')
+            raise IgnoreRequest(f"Not in the archive: {request.url}")
+
+        archived = self.reader.get(request.url)
+        headers = Headers(archived.headers)
+        response_class = responsetypes.from_args(headers=headers, url=archived.url, body=archived.body)
+        response = response_class(url=archived.url, status=archived.status, headers=headers, body=archived.body,
+                                  request=request, flags=['replayed'])
+
+        self.stats.inc_value('archive/replayed')
+        request.meta['download_latency'] = self.latency
+
+        # Imported here, so that importing this module doesn't install a reactor before Scrapy chooses one
+        from twisted.internet import reactor
+
+        return task.deferLater(reactor, self.latency, lambda: response)
+
+    def process_response(self, request, response, spider):
+        if self.writer is not None:
+            headers = [(name, value) for name, values in response.headers.items() for value in values]
+            self.writer.write(response.url, response.status, headers, response.body)
+            self.stats.inc_value('archive/recorded')
+
+        return response
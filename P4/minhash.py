@@ -0,0 +1,191 @@
+import json
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# The Mersenne prime the permutations are taken modulo, and the largest hash value kept
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    Compute MinHash signatures of sets of words (Broder, "On the resemblance and containment of documents", 1997).
+
+    The share of positions where two signatures agree estimates the Jaccard similarity of the two sets. Each position
+    is the smallest value of one random permutation of the words' hashes, of the form (a * x + b) mod p.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        """
+        :param num_perm: The number of permutations, i.e. the length of the signatures
+        :param seed: The seed of the permutations. Signatures are only comparable if made with the same seed
+        """
+
+        self.num_perm = num_perm
+
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, np.int64(_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, np.int64(_PRIME), size=num_perm, dtype=np.uint64)
+
+    def signature(self, words) -> np.ndarray:
+        """
+        :param words: The set of words
+        :return: The MinHash signature of the set
+        """
+
+        hashes = np.fromiter((int.from_bytes(blake2b(w.encode('utf-8'), digest_size=4).digest(), 'little')
+                              for w in set(words)), dtype=np.uint64)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+
+        # One row per permutation, one column per word. The multiplication wraps around, which only mixes the bits more
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _PRIME & _MAX_HASH
+
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    :param a: A MinHash signature
+    :param b: Another MinHash signature
+    :return: The estimated Jaccard similarity of their sets
+    """
+
+    return float(np.mean(a == b))
+
+
+def _bands_for(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Choose how to split signatures into bands for a similarity threshold.
+
+    Two sets with similarity s share at least one band with probability 1 - (1 - s^r)^b, for b bands of r rows. That
+    probability rises most steeply around s = (1/b)^(1/r), which is made as close to the threshold as possible.
+
+    :param threshold: The similarity threshold
+    :param num_perm: The length of the signatures
+    :return: The number of bands, and of rows per band
+    """
+
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class LSHIndex:
+    """
+    A locality-sensitive hashing index of MinHash signatures, to find the near duplicates of a set without comparing
+    it with every other one.
+
+    Signatures are split into bands, and two signatures are candidates when any of their bands are identical. Candidates
+    are then checked against the threshold with their full signatures.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128):
+        """
+        :param threshold: The Jaccard similarity above which two sets are near duplicates
+        :param num_perm: The length of the signatures
+        """
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = _bands_for(threshold, num_perm)
+
+        self.keys: List[str] = []
+        self.signatures: List[np.ndarray] = []
+        self._positions: Dict[str, int] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def query(self, signature: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Find the most similar indexed set above the threshold.
+
+        :param signature: The signature of the set
+        :param exclude: A key to ignore, e.g. the page's own, from a previous crawl
+        :return: The key of the most similar set and its similarity, or None if no set is similar enough
+        """
+
+        candidates = set()
+        for band, bucket in zip(self._band_keys(signature), self._buckets):
+            candidates.update(bucket.get(band, ()))
+
+        best = None
+        for position in candidates:
+            key = self.keys[position]
+            if key == exclude or self._positions.get(key) != position:
+                continue
+
+            score = similarity(signature, self.signatures[position])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = key, score
+
+        return best
+
+    def insert(self, key: str, signature: np.ndarray) -> None:
+        """
+        Add a set to the index. If the key was already indexed, its old signature is replaced.
+
+        :param key: The key of the set, e.g. its page's URL
+        :param signature: The signature of the set
+        """
+
+        position = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+
+        # Older entries for the same key are left in the buckets, but no longer match `_positions`, so they're skipped
+        self._positions[key] = position
+
+        for band, bucket in zip(self._band_keys(signature), self._buckets):
+            bucket.setdefault(band, []).append(position)
+
+    def save(self, folder: str) -> None:
+        """
+        Save the index, so it can be reloaded with `load`.
+
+        :param folder: The folder to save to
+        """
+
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        # Only keep the latest signature of each key
+        positions = sorted(self._positions.values())
+        np.save(folder / 'signatures.npy', np.array([self.signatures[p] for p in positions], dtype=np.uint32)
+                .reshape(-1, self.num_perm))
+        with open(folder / 'keys.txt', 'wt', encoding='utf-8') as f:
+            f.writelines(f"{self.keys[p]}\n" for p in positions)
+        with open(folder / 'meta.json', 'wt') as f:
+            json.dump({'threshold': self.threshold, 'num_perm': self.num_perm}, f)
+
+    @classmethod
+    def load(cls, folder: str) -> 'LSHIndex':
+        """
+        Reload an index saved with `save`.
+
+        :param folder: The folder it was saved to
+        :return: The index
+        """
+
+        folder = Path(folder)
+        with open(folder / 'meta.json', 'rt') as f:
+            meta = json.load(f)
+
+        index = cls(meta['threshold'], meta['num_perm'])
+
+        signatures = np.load(folder / 'signatures.npy')
+        with open(folder / 'keys.txt', 'rt', encoding='utf-8') as f:
+            keys = [line.rstrip('\n') for line in f]
+
+        for key, signature in zip(keys, signatures):
+            index.insert(key, signature)
+
+        return index
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
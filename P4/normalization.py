@@ -0,0 +1,132 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet
+
+from P4.resources import get_stopwords
+
+# Punctuation, special characters and the unicode control characters found in experiment, all replaced with a space
+SEPARATORS = re.compile(r"[()<>{}\[\]!$=@&*-/|+.,:;`'?\"\xa0\x03\x02\x07\x05\xfc\u007F]+")
+
+# The characters `word_tokenize` splits into tokens of their own, once the separators are gone: quotes, dashes, '#'
+# and '%'
+SPLIT_CHARACTERS = re.compile(r"[«“‘„»”’#%\u2012-\u2015]")
+
+# The contractions `word_tokenize` splits in two, e.g. "cannot" into "can" and "not"
+CONTRACTIONS = re.compile(r"\b(?:(can)(not)|(gim)(me)|(gon)(na)|(got)(ta)|(lem)(me))\b|\b(wan)(na)(?=\s)", re.I)
+
+
+@lru_cache(maxsize=None)
+def stopword_set() -> FrozenSet[str]:
+    """
+    Get the first 150 stopwords, from the resource bundle rather than NLTK's corpus. They are only loaded when a
+    string is first cleaned, so that importing this module (e.g. with the spider) doesn't build the bundle.
+
+    :return: The stopwords, for constant-time lookups
+    """
+
+    return frozenset(get_stopwords('cleaning'))
+
+
+def clean_nltk(string: str) -> str:
+    """
+    Given a string, clean it according to some rules, tokenizing it with NLTK's `word_tokenize`.
+
+    :param string: The string to clean
+    :return: The cleaned string
+    """
+
+    # Importing NLTK takes seconds, so it's only imported when this normalizer is used
+    from nltk import word_tokenize
+
+    # Remove punctuation and special characters
+    string = re.sub(r"[()<>{}\[\]!$=@&*-/|+.,:;`'?\"]+", ' ', string)
+
+    # Remove certain unicode control characters, as found in experiment
+    string = re.sub(r'\xa0|\x03|\x02|\x07|\x05|\xfc|\u007F', ' ', string)
+
+    # Remove multiple spaces
+    string = re.sub(r'\s{2,}', ' ', string)
+
+    # Tokenize string
+    tokenized = word_tokenize(string)
+
+    # Remove stopwords
+    stopwords = stopword_set()
+    no_stopwords = [t for t in tokenized if t not in stopwords]
+
+    # Remove numbers
+    no_nums = [t for t in no_stopwords if not t.isnumeric()]
+
+    # Lowercase
+    lowercase = [t.lower() for t in no_nums]
+
+    # Remove tokens that are of length 1
+    no_len_1 = [t for t in lowercase if len(t) != 1]
+
+    # Remove duplicates
+    no_dupes = {t for t in no_len_1}
+
+    # Join into single string
+    to_return = ' '.join(t for t in no_dupes)
+
+    # Remove surrounding spaces
+    to_return = to_return.strip()
+
+    # Ensure 1 space at the end
+    to_return = f"{to_return} "
+
+    return to_return
+
+
+def clean_fast(string: str) -> str:
+    """
+    Clean a string exactly like `clean_nltk`, but with precompiled patterns instead of `word_tokenize`, and every
+    filter applied in a single pass over the tokens.
+
+    Once the separators are replaced, all that `word_tokenize` still does is split on whitespace, split off the
+    characters of `SPLIT_CHARACTERS`, and split the `CONTRACTIONS`. The tokens are then filtered in the same order as
+    `clean_nltk`: stopwords and numbers are checked before lowercasing, and single characters after.
+
+    :param string: The string to clean
+    :return: The cleaned string
+    """
+
+    string = SPLIT_CHARACTERS.sub(r' \g<0> ', SEPARATORS.sub(' ', string))
+    string = CONTRACTIONS.sub(_split_contraction, string + ' ')
+
+    # The tokens are added to the set in the same order as `clean_nltk` adds them, so it iterates in the same order
+    stopwords = stopword_set()
+    words = set()
+    for token in string.split():
+        if token in stopwords or token.isnumeric():
+            continue
+
+        token = token.lower()
+        if len(token) != 1:
+            words.add(token)
+
+    return ' '.join(words) + ' '
+
+
+def _split_contraction(match) -> str:
+    return ' ' + ' '.join(part for part in match.groups() if part) + ' '
+
+
+NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    'nltk': clean_nltk,
+    'fast': clean_fast,
+}
+
+
+def get_normalizer(name: str) -> Callable[[str], str]:
+    """
+    Get a text normalizer by name.
+
+    :param name: The name of the normalizer. One of the keys of `NORMALIZERS`
+    :return: The normalization function
+    """
+
+    try:
+        return NORMALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown text normalizer '{name}'. Choose from: {', '.join(NORMALIZERS)}") from None
@@ -0,0 +1,218 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+class Stage:
+    """
+    One step of the pipeline: a script run as its own process, once the stages it depends on have finished.
+
+    A stage is skipped when its fingerprint is the same as the last time it succeeded, and its outputs are still there.
+    The fingerprint covers its command, its parameters, the content of its `inputs`, and the names, sizes and
+    modification times of its `manifests` (for inputs like a corpus, too large to hash on every run).
+    """
+
+    def __init__(self, name: str, command: Sequence[str], params: Optional[dict] = None, inputs: Sequence[str] = (),
+                 manifests: Sequence[str] = (), outputs: Sequence[str] = (), after: Sequence[str] = ()):
+        """
+        :param name: The name of the stage
+        :param command: The script to run, and its arguments
+        :param params: The settings its outputs depend on
+        :param inputs: Glob patterns of the files its outputs depend on, hashed by content
+        :param manifests: Glob patterns of the files its outputs depend on, hashed by name, size and modification time
+        :param outputs: Glob patterns that must each match a file for the stage to be skipped
+        :param after: The names of the stages that must finish first
+        """
+
+        self.name = name
+        self.command = [str(part) for part in command]
+        self.params = params or {}
+        self.inputs = list(inputs)
+        self.manifests = list(manifests)
+        self.outputs = list(outputs)
+        self.after = list(after)
+
+    def fingerprint(self) -> str:
+        """
+        :return: The fingerprint of the stage's command, parameters and inputs, as they are now
+        """
+
+        digest = sha1(json.dumps({'command': self.command, 'params': self.params}, sort_keys=True).encode('utf-8'))
+
+        for pattern in self.inputs:
+            for path in sorted(glob.glob(pattern)):
+                digest.update(path.encode('utf-8'))
+                digest.update(_file_hash(path).encode('ascii'))
+
+        for pattern in self.manifests:
+            for path in sorted(glob.glob(pattern)):
+                stat = os.stat(path)
+                digest.update(f"{path}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def outputs_exist(self) -> bool:
+        return all(glob.glob(pattern) for pattern in self.outputs)
+
+
+class Pipeline:
+    """
+    Run stages as a DAG: each stage starts as soon as the stages it depends on have finished, so independent ones run
+    concurrently, and stages whose inputs haven't changed since they last succeeded are skipped.
+
+    What each stage printed is saved to `{state}/logs/{stage}.log`, the fingerprint of each successful stage to
+    `{state}/stages.json`, and the status and duration of each stage of the last run to `{state}/report.json`.
+    """
+
+    def __init__(self, stages: Iterable[Stage], state: str = 'pipeline_state', jobs: Optional[int] = None):
+        """
+        :param stages: The stages
+        :param state: The folder to keep the fingerprints, logs and report in
+        :param jobs: The most stages to run at once. The number of CPUs if None
+        """
+
+        self.stages = {stage.name: stage for stage in stages}
+        self.state = Path(state)
+        self.jobs = jobs or os.cpu_count() or 1
+
+        for stage in self.stages.values():
+            unknown = set(stage.after) - self.stages.keys()
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(sorted(unknown))}")
+
+        # Take away the stages with no dependencies left until none remain. If the ones left all wait on each other,
+        # there's a cycle, and the pipeline could never finish
+        remaining = dict(self.stages)
+        while remaining:
+            ready = [name for name, stage in remaining.items() if not set(stage.after) & remaining.keys()]
+            if not ready:
+                raise ValueError(f"The stages {', '.join(sorted(remaining))} depend on each other in a cycle")
+            for name in ready:
+                del remaining[name]
+
+    def run(self, force: Sequence[str] = (), verbose: bool = False) -> List[dict]:
+        """
+        Run every stage that is out of date.
+
+        :param force: The names of stages to run even if they are up to date. 'all' runs every stage
+        :param verbose: Whether to print what each stage printed, once it finishes
+        :return: The name, status ('ran', 'cached', 'failed' or 'blocked') and seconds of each stage, in the order
+                 they finished
+        """
+
+        (self.state / 'logs').mkdir(parents=True, exist_ok=True)
+        fingerprints = self._load_fingerprints()
+
+        results, finished = [], {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while len(finished) < len(self.stages):
+                for stage in self.stages.values():
+                    if stage.name in finished or stage.name in running.values():
+                        continue
+
+                    statuses = [finished.get(name) for name in stage.after]
+                    if any(status in ('failed', 'blocked') for status in statuses):
+                        finished[stage.name] = 'blocked'
+                        results.append({'stage': stage.name, 'status': 'blocked', 'seconds': 0.0})
+                        print(f"[{stage.name}] blocked: a stage it depends on failed")
+                        continue
+                    if None in statuses:
+                        continue
+
+                    # The inputs are only fingerprinted now, once the stages producing them have finished
+                    fingerprint = stage.fingerprint()
+                    if (stage.name not in force and 'all' not in force and fingerprints.get(stage.name) == fingerprint
+                            and stage.outputs_exist() and self._log(stage).exists()):
+                        finished[stage.name] = 'cached'
+                        results.append({'stage': stage.name, 'status': 'cached', 'seconds': 0.0})
+                        print(f"[{stage.name}] up to date")
+                        continue
+
+                    print(f"[{stage.name}] running: {' '.join(stage.command)}")
+                    running[executor.submit(self._run_stage, stage, fingerprint)] = stage.name
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    fingerprint, returncode, seconds = future.result()
+
+                    # A script that succeeds without writing its outputs would make the stages after it fail instead
+                    status = 'ran' if returncode == 0 and self.stages[name].outputs_exist() else 'failed'
+                    finished[name] = status
+                    results.append({'stage': name, 'status': status, 'seconds': seconds})
+
+                    if status == 'ran':
+                        fingerprints[name] = fingerprint
+                    else:
+                        fingerprints.pop(name, None)
+                    self._save_fingerprints(fingerprints)
+
+                    if status == 'ran':
+                        outcome = 'finished'
+                    elif returncode == 0:
+                        outcome = 'failed: some of its outputs are missing'
+                    else:
+                        outcome = f'failed (exit status {returncode})'
+                    print(f"[{name}] {outcome} in {seconds:.1f}s. Output: {self._log(self.stages[name])}")
+                    if verbose:
+                        print(self._log(self.stages[name]).read_text(encoding='utf-8', errors='replace'))
+
+        with open(self.state / 'report.json', 'wt') as f:
+            json.dump(results, f, indent=2)
+
+        return results
+
+    def _run_stage(self, stage: Stage, fingerprint: str) -> tuple:
+        """
+        Run a stage's script, saving what it prints to its log. Runs in one of the executor's threads.
+
+        :param stage: The stage
+        :param fingerprint: The fingerprint of its inputs
+        :return: The fingerprint, the script's exit status, and the seconds it took
+        """
+
+        start = time.perf_counter()
+        with open(self._log(stage), 'wb') as log:
+            returncode = subprocess.call([sys.executable, *stage.command], stdout=log, stderr=subprocess.STDOUT)
+
+        return fingerprint, returncode, time.perf_counter() - start
+
+    def _log(self, stage: Stage) -> Path:
+        return self.state / 'logs' / f'{stage.name}.log'
+
+    def _load_fingerprints(self) -> Dict[str, str]:
+        path = self.state / 'stages.json'
+        if not path.exists():
+            return {}
+
+        with open(path, 'rt') as f:
+            return json.load(f)
+
+    def _save_fingerprints(self, fingerprints: Dict[str, str]) -> None:
+        with open(self.state / 'stages.json', 'wt') as f:
+            json.dump(fingerprints, f, indent=2)
+
+
+def _file_hash(path: str) -> str:
+    """
+    :param path: A file
+    :return: The SHA-1 of its content
+    """
+
+    digest = sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
@@ -0,0 +1,162 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+
+class CachedPage(NamedTuple):
+    """
+    What was remembered about a page the last time it was crawled.
+    """
+
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+    filename: Optional[str]
+    links: List[str]
+
+
+class PageCache:
+    """
+    A persistent, per-URL store of the validators (ETag, Last-Modified) and content hash of every crawled page,
+    along with the file it was saved to and the links found on it.
+
+    Each crawl is a new "run". Pages seen during a run are stamped with that run's number, so pages that
+    disappeared from the site can be found once the run is over.
+    """
+
+    # How many writes to buffer before committing to disk
+    COMMIT_EVERY = 100
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the cache at the given path, and start a new run.
+
+        :param path: The path to the SQLite database file
+        """
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                filename TEXT,
+                links TEXT NOT NULL DEFAULT '[]',
+                last_run INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                run INTEGER PRIMARY KEY AUTOINCREMENT
+            );
+            """
+        )
+
+        self.run = self.connection.execute("INSERT INTO runs DEFAULT VALUES").lastrowid
+        self.connection.commit()
+
+        self._pending_writes = 0
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Get what is known about a URL.
+
+        :param url: The URL to look up
+        :return: The cached page, or None if it has never been crawled
+        """
+
+        row = self.connection.execute(
+            "SELECT url, etag, last_modified, content_hash, filename, links FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return CachedPage(*row[:5], links=json.loads(row[5]))
+
+    def update(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: Optional[str],
+               filename: Optional[str], links: List[str]) -> None:
+        """
+        Remember a freshly downloaded page, and mark it as seen during this run.
+
+        :param url: The URL of the page
+        :param etag: The ETag header of the response, if any
+        :param last_modified: The Last-Modified header of the response, if any
+        :param content_hash: The hash of the response body
+        :param filename: The file the page's text was saved to, or None if it wasn't saved
+        :param links: The links to follow from the page
+        """
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, filename, links, last_run) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, filename, json.dumps(links), self.run)
+        )
+        self._written()
+
+    def mark_seen(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """
+        Mark an unchanged page as seen during this run, refreshing its validators if new ones were sent.
+
+        :param url: The URL of the page
+        :param etag: The new ETag header, if any
+        :param last_modified: The new Last-Modified header, if any
+        """
+
+        self.connection.execute(
+            "UPDATE pages SET last_run = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+            "WHERE url = ?",
+            (self.run, etag, last_modified, url)
+        )
+        self._written()
+
+    def remove(self, url: str) -> Optional[CachedPage]:
+        """
+        Forget a page, e.g. because it no longer exists.
+
+        :param url: The URL of the page
+        :return: The page that was forgotten, or None if it wasn't known
+        """
+
+        page = self.get(url)
+        if page is not None:
+            self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._written()
+
+        return page
+
+    def unseen(self) -> List[CachedPage]:
+        """
+        Get all pages that were known before this run, but weren't seen during it.
+
+        :return: The unseen pages
+        """
+
+        rows = self.connection.execute(
+            "SELECT url, etag, last_modified, content_hash, filename, links FROM pages WHERE last_run < ?",
+            (self.run,)
+        ).fetchall()
+
+        return [CachedPage(*row[:5], links=json.loads(row[5])) for row in rows]
+
+    def close(self) -> None:
+        """
+        Commit any buffered writes and close the cache.
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+    def _written(self) -> None:
+        """
+        Count a write, committing once enough have been buffered.
+        """
+
+        self._pending_writes += 1
+        if self._pending_writes >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self._pending_writes = 0
@@ -3,11 +3,455 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import defer, reactor, threads
+
+from P4.minhash import LSHIndex, MinHasher
+from P4.normalization import get_normalizer
+from P4.spiders.MainSpider import _fill_page_text
+
+
+class CleaningPipeline:
+    """
+    Turn the raw fragments extracted by the spider into the page's cleaned text.
+
+    Cleaning (tokenizing, stopword removal, etc.) is CPU-heavy, so by default it is done in a pool of worker
+    processes rather than in the reactor thread, which would otherwise stall downloads while a large page is
+    cleaned. At most `CLEANING_MAX_PENDING` pages are on the pool at once. Past that, each new item waits here for a
+    page to finish, and isn't submitted until then. A waiting item keeps its response active in Scrapy's scraper, so
+    how many pages may wait is bounded by `SCRAPER_SLOT_MAX_ACTIVE_SIZE`: once the responses being scraped add up to
+    more than that, Scrapy stops sending new requests until the pool catches up.
+    """
+
+    def __init__(self, workers: int, max_pending: int, normalizer: str = 'fast'):
+        """
+        :param workers: The number of worker processes. 0 cleans in the reactor thread
+        :param max_pending: The most pages that may be on the pool at once
+        :param normalizer: The name of the text normalizer. See `P4.normalization.NORMALIZERS`
+        """
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.normalizer = normalizer
+
+        self.executor = None
+        self.pending = 0
+
+        # The Deferreds of the items waiting for room on the pool, fired in order as pages finish
+        self.waiting = deque()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        workers = crawler.settings.getint('CLEANING_WORKERS', os.cpu_count() or 1)
+        max_pending = crawler.settings.getint('CLEANING_MAX_PENDING', 32)
+        normalizer = crawler.settings.get('CLEANING_NORMALIZER', 'fast')
+
+        # Fail before the crawl starts, rather than in the first worker
+        get_normalizer(normalizer)
+
+        return cls(workers, max_pending, normalizer)
+
+    def open_spider(self, spider):
+        if self.workers > 0:
+            # Spawn fresh workers instead of forking the process running the reactor
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def close_spider(self, spider):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+
+        if self.executor is None:
+            with spider.metrics.time('clean'):
+                adapter['text'] = _fill_page_text(*adapter['fragments'], normalizer=self.normalizer)
+            return item
+
+        if self.pending < self.max_pending:
+            return self._clean_in_pool(item, spider)
+
+        # The pool is full, so the item waits for a page to finish before it's submitted
+        d = defer.Deferred()
+        self.waiting.append(d)
+        spider.metrics.set_gauge('cleaning_waiting', len(self.waiting))
+
+        return d.addCallback(lambda _: self._clean_in_pool(item, spider))
+
+    def _clean_in_pool(self, item, spider) -> defer.Deferred:
+        """
+        Clean an item's fragments in the worker pool.
+
+        :param item: The item to clean
+        :param spider: The spider the item came from
+        :return: A Deferred that fires with the item once its text has been filled in
+        """
+
+        self.pending += 1
+        spider.metrics.set_gauge('cleaning_pending', self.pending)
+
+        adapter = ItemAdapter(item)
+        future = self.executor.submit(_timed_fill_page_text, adapter['fragments'], self.normalizer)
+
+        # The future completes in one of the pool's threads, so hand the result back to the reactor thread
+        d = defer.Deferred()
+        future.add_done_callback(lambda f: reactor.callFromThread(_fire_from_future, d, f))
+
+        def fill_text(result):
+            adapter['text'], seconds = result
+            spider.metrics.observe('clean', seconds)
+            return item
+
+        def done(result):
+            self.pending -= 1
+            spider.metrics.set_gauge('cleaning_pending', self.pending)
+
+            # Hand the freed room to the item that has waited the longest
+            if self.waiting:
+                waiting = self.waiting.popleft()
+                spider.metrics.set_gauge('cleaning_waiting', len(self.waiting))
+                waiting.callback(None)
+
+            return result
+
+        return d.addCallback(fill_text).addBoth(done)
+
+
+class NearDuplicatePipeline:
+    """
+    Find pages that are near duplicates of a page already crawled (e.g. the same article under two URLs, or pages
+    differing only by a date), so they aren't saved and clustered twice.
+
+    Each page's cleaned text is MinHashed, and looked up in an LSH index (see `P4/minhash.py`) for a page whose
+    estimated Jaccard similarity is at least `NEAR_DUPLICATE_THRESHOLD`. Depending on `NEAR_DUPLICATE_ACTION`, near
+    duplicates are either dropped before being written, giving their file back to the budget, or tagged with the page
+    they duplicate and saved anyway. Either way, they are listed in `NEAR_DUPLICATE_REPORT`.
+
+    With `NEAR_DUPLICATE_PERSIST`, the index is saved to `NEAR_DUPLICATE_PATH` when the crawl ends, and reloaded by the
+    next one, so pages are also checked against those of earlier crawls.
+    """
+
+    def __init__(self, threshold: float, num_perm: int, action: str, path: str, persist: bool, report: str, stats):
+        """
+        :param threshold: The Jaccard similarity above which two pages are near duplicates
+        :param num_perm: The length of the MinHash signatures
+        :param action: What to do with near duplicates: 'drop' or 'tag'
+        :param path: The folder the index is saved to
+        :param persist: Whether to reload the index from `path`, and save it back when the crawl ends
+        :param report: The TSV file listing the near duplicates found
+        :param stats: The crawler's stats collector
+        """
+
+        if action not in ('drop', 'tag'):
+            raise ValueError(f"Unknown NEAR_DUPLICATE_ACTION: {action}. Use 'drop' or 'tag'")
+
+        self.action = action
+        self.path = path
+        self.persist = persist
+        self.report_path = Path(report)
+        self.stats = stats
+
+        self.hasher = MinHasher(num_perm)
+        self.index = None
+        if persist and (Path(path) / 'meta.json').exists():
+            self.index = LSHIndex.load(path)
+            if (self.index.threshold, self.index.num_perm) != (threshold, num_perm):
+                logging.getLogger(__name__).warning("The near duplicate settings changed, starting a new index")
+                self.index = None
+        if self.index is None:
+            self.index = LSHIndex(threshold, num_perm)
+
+        self.report = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('NEAR_DUPLICATE_ENABLED'):
+            raise NotConfigured
+
+        return cls(settings.getfloat('NEAR_DUPLICATE_THRESHOLD', 0.9),
+                   settings.getint('NEAR_DUPLICATE_NUM_PERM', 128),
+                   settings.get('NEAR_DUPLICATE_ACTION', 'drop'),
+                   settings.get('NEAR_DUPLICATE_PATH', 'crawl_state/near_duplicates/'),
+                   settings.getbool('NEAR_DUPLICATE_PERSIST'),
+                   settings.get('NEAR_DUPLICATE_REPORT', 'crawl_state/near_duplicates.tsv'),
+                   crawler.stats)
+
+    def open_spider(self, spider):
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        self.report = open(self.report_path, 'wt', encoding='utf-8')
+        self.report.write('url\tduplicate_of\tsimilarity\n')
+
+        spider.logger.info(f"Near duplicate index holds {len(self.index)} pages")
+
+    def close_spider(self, spider):
+        self.report.close()
+
+        if self.persist:
+            self.index.save(self.path)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        words = adapter['text'].split()
+
+        with spider.metrics.time('near_duplicates'):
+            signature = self.hasher.signature(words)
+            # A page re-crawled from an earlier run shouldn't count as a duplicate of itself
+            match = self.index.query(signature, exclude=adapter['url'])
+
+        if match is None:
+            self.index.insert(adapter['url'], signature)
+            return item
+
+        duplicate_of, score = match
+        self.report.write(f"{adapter['url']}\t{duplicate_of}\t{score:.3f}\n")
+
+        if self.action == 'tag':
+            adapter['duplicate_of'] = duplicate_of
+            adapter['similarity'] = score
+            self.stats.inc_value('near_duplicates/tagged')
+            return item
+
+        # Everything downstream of this (writing, then tokenizing and vectorizing for clustering) is saved
+        self.stats.inc_value('near_duplicates/dropped')
+        self.stats.inc_value('near_duplicates/bytes_saved', len(adapter['text'].encode('utf-8')))
+        self.stats.inc_value('near_duplicates/terms_saved', len(words))
+        spider._release_file()
+
+        raise DropItem(f"Near duplicate ({score:.2f}) of {duplicate_of}: {adapter['url']}")
 
 
 class P4Pipeline:
+    """
+    Save the cleaned text of each page to the spider's document store: either its own file in `text_files/`, or a
+    segment corpus (see `P4/corpus.py`), depending on the `CORPUS_STORE` setting.
+    """
+
     def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+
+        with spider.metrics.time('write'):
+            spider.store.write(adapter['url'], adapter['filename'], adapter['text'])
+        spider.log(f"Saved: {adapter['filename']}")
+
+        spider.metrics.inc('pages')
+        spider.metrics.inc('bytes_out', len(adapter['text'].encode('utf-8')))
+
         return item
+
+
+class StreamingClusterPipeline:
+    """
+    Cluster pages as they are crawled, instead of from the saved text files once the crawl is over.
+
+    Cleaned pages are handed through a bounded queue to a thread running an `OnlineClusterer` (see `P4/streaming.py`),
+    which takes a Mini-Batch K-Means step every `STREAM_CLUSTER_BATCH_SIZE` pages. Every
+    `STREAM_CLUSTER_SNAPSHOT_EVERY` pages, and at the end of the crawl, the top terms of each cluster are saved to
+    `clusters/k*/cluster-*.txt`, as `cluster.py` would, and a summary with each cluster's size and manual AFINN
+    sentiment score is saved to `clusters/live.json`.
+
+    When the queue is full, items wait until the clusterer catches up, which holds the crawl back. They wait on a
+    Deferred fired from the reactor once the clusterer has made room, rather than blocking a thread of the reactor's
+    pool, which Scrapy also needs (e.g. for DNS lookups).
+    """
+
+    # Put on the queue to tell the clusterer thread that the crawl is over
+    _DONE = object()
+
+    def __init__(self, ks: list, batch_size: int, snapshot_every: int, queue_size: int, folder: str):
+        """
+        :param ks: The numbers of clusters to fit
+        :param batch_size: The number of pages per Mini-Batch K-Means step
+        :param snapshot_every: How many pages to cluster between snapshots
+        :param queue_size: The most pages that may wait on the clusterer
+        :param folder: The folder to save the snapshots to
+        """
+
+        # Imported here, so that crawls without this pipeline don't load scikit-learn
+        from P4.resources import get_stopwords
+        from P4.streaming import OnlineClusterer
+
+        self.ks = ks
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.folder = Path(folder)
+
+        self.clusterer = OnlineClusterer(ks, stop_words=list(get_stopwords('clustering')))
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+
+        # The pages that didn't fit in the queue, in order, each with the Deferred its item waits on. Only touched
+        # from the reactor thread
+        self.waiting = deque()
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('STREAM_CLUSTER_ENABLED'):
+            raise NotConfigured
+
+        return cls([int(k) for k in settings.getlist('STREAM_CLUSTER_KS', [3, 6])],
+                   settings.getint('STREAM_CLUSTER_BATCH_SIZE', 50),
+                   settings.getint('STREAM_CLUSTER_SNAPSHOT_EVERY', 200),
+                   settings.getint('STREAM_CLUSTER_QUEUE_SIZE', 500),
+                   settings.get('STREAM_CLUSTER_FOLDER', 'clusters/'))
+
+    def open_spider(self, spider):
+        self.thread = threading.Thread(target=self._consume, name='streaming-cluster', daemon=True)
+        self.thread.start()
+
+    def close_spider(self, spider):
+        # Wait for the clusterer to finish the last batch and snapshot, without blocking the reactor
+        return threads.deferToThread(self._finish)
+
+    def process_item(self, item, spider):
+        text = ItemAdapter(item)['text']
+
+        # Pages already waiting go first, so they're clustered in the order they were crawled
+        if not self.waiting:
+            try:
+                self.queue.put_nowait(text)
+                return item
+            except queue.Full:
+                pass
+
+        # Hold the item back until the clusterer makes room (see `_make_room`), so the reactor keeps going meanwhile
+        d = defer.Deferred()
+        self.waiting.append((text, d))
+
+        return d.addCallback(lambda _: item)
+
+    def _make_room(self) -> None:
+        """
+        Move the waiting pages onto the queue, as far as there's room, and let their items go on. Called in the reactor
+        thread each time the clusterer takes a page off the queue.
+        """
+
+        while self.waiting:
+            try:
+                self.queue.put_nowait(self.waiting[0][0])
+            except queue.Full:
+                return
+
+            _, d = self.waiting.popleft()
+            d.callback(None)
+
+    def _finish(self) -> None:
+        self.queue.put(self._DONE)
+        self.thread.join()
+
+    def _consume(self) -> None:
+        """
+        Cluster the pages from the queue in batches, saving a snapshot every so often. Runs in its own thread.
+        """
+
+        batch = []
+        since_snapshot = 0
+
+        while True:
+            text = self.queue.get()
+            done = text is self._DONE
+            if not done:
+                batch.append(text)
+
+                # There's room on the queue again, for a page that was waiting
+                reactor.callFromThread(self._make_room)
+
+            try:
+                if len(batch) >= self.batch_size or (done and batch):
+                    self.clusterer.partial_fit(batch)
+                    since_snapshot += len(batch)
+                    batch = []
+
+                if since_snapshot >= self.snapshot_every or done:
+                    self._snapshot()
+                    since_snapshot = 0
+            except Exception:
+                # Keep draining the queue, so that a clustering error doesn't stall the crawl
+                self.logger.exception("Streaming clustering failed on a batch of pages")
+                batch = []
+
+            if done:
+                return
+
+    def _snapshot(self) -> None:
+        """
+        Save the current top terms of each cluster, and a summary of the clusters with their sentiment scores.
+        """
+
+        if not self.clusterer.fitted:
+            return
+
+        # Imported here, for the same reason as in __init__
+        from P4.lexicon import get_lexicon
+        from P4.resources import AFINN_111
+
+        lexicon = get_lexicon(AFINN_111)
+
+        summary = {'documents': self.clusterer.n_documents, 'clusters': {}}
+
+        for k in self.ks:
+            folder = self.folder / f"k{k}"
+            folder.mkdir(parents=True, exist_ok=True)
+
+            clusters = self.clusterer.top_terms(k)
+            for i, cluster in enumerate(clusters):
+                with open(folder / f"cluster-{i}.txt", 'wt') as f:
+                    f.write(' '.join(cluster))
+
+            summary['clusters'][k] = [
+                {'size': int(size), 'terms': cluster, 'sentiment': lexicon.score(' '.join(cluster))}
+                for size, cluster in zip(self.clusterer.sizes[k], clusters)
+            ]
+
+        # Write to a temporary file first, so that readers never see a half-written summary
+        temporary = self.folder / 'live.json.tmp'
+        with open(temporary, 'wt') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(temporary, self.folder / 'live.json')
+
+        self.logger.info(f"Saved a snapshot of the clusters after {self.clusterer.n_documents} pages")
+
+
+def _timed_fill_page_text(fragments: list, normalizer: str) -> tuple:
+    """
+    Clean a page's fragments, timing how long it took. Runs in the worker processes.
+
+    :param fragments: The list of lists of the page's raw text
+    :param normalizer: The name of the text normalizer
+    :return: The page's cleaned text, and the seconds it took to clean
+    """
+
+    start = time.perf_counter()
+    text = _fill_page_text(*fragments, normalizer=normalizer)
+
+    return text, time.perf_counter() - start
+
+
+def _fire_from_future(d: defer.Deferred, future) -> None:
+    """
+    Fire a Deferred with the outcome of a finished future.
+
+    :param d: The Deferred to fire
+    :param future: The finished future
+    """
+
+    exception = future.exception()
+    if exception is not None:
+        d.errback(exception)
+    else:
+        d.callback(future.result())
@@ -0,0 +1,167 @@
+"""
+The resource bundle: the stopword lists and the compiled AFINN lexicons, built once from NLTK's corpora and the
+lexicon files, then loaded from `resources/` by every run.
+
+Reading NLTK's stopwords corpus means importing NLTK, which takes seconds, and compiling a lexicon means parsing its
+file. The bundle keeps the stopwords as a pickle of plain tuples, and each lexicon as the `.npy` arrays of
+`P4.lexicon.Lexicon`, memory-mapped when they are loaded. Anything missing from the bundle is built the first time it
+is needed. A lexicon is compiled again when its file changes. To rebuild the whole bundle, e.g. after updating NLTK's
+data:
+
+    $ python -m P4.resources
+"""
+
+import json
+import os
+import pickle
+from functools import lru_cache
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Dict, Tuple
+
+# The folder of the bundle, relative to the working directory like clusters/ and models/
+BUNDLE = 'resources'
+
+# The lexicon shipped with the repository, used by `manual_AFINN`
+AFINN_111 = 'AFINN-111.txt'
+
+# Stopwords found in experiment, on top of NLTK's English and French ones, removed before clustering
+EXTRA_STOPWORDS = ['etaient', 'etais', 'etait', 'etant', 'etante', 'etantes',
+                   'etants', 'ete', 'etee', 'etees', 'etes', 'etiez', 'etions',
+                   'eumes', 'eutes', 'fumes', 'futes', 'meme', 'co', 'ca', 'cu', 'el']
+
+
+@lru_cache(maxsize=None)
+def afinn_165() -> str:
+    """
+    Find the lexicon the `afinn` library uses by default, in its data folder, without importing the library. It is
+    only looked up when it's used, so that this module can be imported without the library installed.
+
+    :return: The path of `AFINN-en-165.txt`
+    :raises FileNotFoundError: If the `afinn` library isn't installed
+    """
+
+    spec = find_spec('afinn')
+    if spec is None or spec.origin is None:
+        raise FileNotFoundError("The afinn library isn't installed, so AFINN-en-165.txt can't be found")
+
+    return str(Path(spec.origin).parent / 'data' / 'AFINN-en-165.txt')
+
+
+def _build_stopwords() -> Dict[str, Tuple[str, ...]]:
+    """
+    :return: Every stopword list, by name: 'cleaning' for the first 150 English stopwords removed from page text, and
+             'clustering' for the English, French and extra ones removed before clustering
+    """
+
+    from nltk.corpus import stopwords
+
+    english = stopwords.words('english')
+
+    return {
+        'cleaning': tuple(english[:150]),
+        'clustering': tuple(english + stopwords.words('french') + EXTRA_STOPWORDS),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_stopwords(name: str) -> Tuple[str, ...]:
+    """
+    Get a stopword list from the bundle, building the bundle's stopwords first if they aren't there.
+
+    :param name: 'cleaning' or 'clustering'
+    :return: The stopwords, in NLTK's order
+    """
+
+    path = Path(BUNDLE) / 'stopwords.pickle'
+    try:
+        with open(path, 'rb') as f:
+            lists = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        lists = _build_stopwords()
+        write_atomic(path, pickle.dumps(lists, protocol=pickle.HIGHEST_PROTOCOL))
+
+    try:
+        return lists[name]
+    except KeyError:
+        raise ValueError(f"Unknown stopword list '{name}'. Choose from: {', '.join(lists)}") from None
+
+
+def lexicon_folder(path: str) -> Path:
+    """
+    :param path: A lexicon file
+    :return: The folder of its compiled copy in the bundle
+    """
+
+    return Path(BUNDLE) / 'lexicons' / Path(path).stem
+
+
+def lexicon_source(path: str) -> dict:
+    """
+    :param path: A lexicon file
+    :return: Its size and modification time, to tell whether its compiled copy is still up to date
+    """
+
+    stat = os.stat(path)
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def bundled_source(folder: Path):
+    """
+    :param folder: The folder of a compiled lexicon
+    :return: The size and modification time of the file it was compiled from, or None if it isn't there
+    """
+
+    try:
+        with open(folder / 'meta.json', 'rt') as f:
+            return json.load(f).get('source')
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """
+    Write a file of the bundle so that a process reading it at the same time sees either the old file or the new one,
+    e.g. when the pipeline runs several sentiment stages at once.
+
+    :param path: The file
+    :param data: Its content
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def build() -> None:
+    """
+    Build the whole bundle again: the stopwords, and the lexicons the scripts use.
+    """
+
+    from P4.lexicon import Lexicon
+
+    path = Path(BUNDLE) / 'stopwords.pickle'
+    write_atomic(path, pickle.dumps(_build_stopwords(), protocol=pickle.HIGHEST_PROTOCOL))
+    print(f"Saved the stopwords to {path}")
+
+    lexicons = [AFINN_111]
+    try:
+        lexicons.append(afinn_165())
+    except FileNotFoundError as e:
+        print(e)
+
+    for lexicon in lexicons:
+        if not Path(lexicon).exists():
+            print(f"The lexicon {lexicon} can't be found")
+            continue
+
+        Lexicon.from_file(lexicon).save(lexicon_folder(lexicon), source=lexicon_source(lexicon))
+        print(f"Compiled {lexicon} to {lexicon_folder(lexicon)}")
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,122 @@
+import pickle
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+
+class SharedFrontierScheduler(BaseScheduler):
+    """
+    A scheduler that keeps its queue and seen-set in a `Frontier` shared with other crawler processes, instead of in
+    memory. Run several crawlers with this scheduler and the same frontier, and they split the crawl between them.
+
+    Enable it with `SCHEDULER = "P4.scheduler.SharedFrontierScheduler"`, and pick the backend with `FRONTIER_BACKEND`.
+    """
+
+    def __init__(self, crawler, frontier):
+        self.crawler = crawler
+        self.frontier = frontier
+        self.stats = crawler.stats
+
+        self.spider = None
+
+        # Each request claimed from the frontier is held off its host for this long, across all workers
+        self.delay = crawler.settings.getfloat('DOWNLOAD_DELAY')
+
+        # How long after another worker finishes a request this worker waits for new requests before closing
+        self.idle_grace = crawler.settings.getfloat('FRONTIER_IDLE_GRACE', 10.0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        frontier = load_object(crawler.settings.get('FRONTIER_BACKEND')).from_settings(crawler.settings)
+        scheduler = cls(crawler, frontier)
+
+        # A request is done once it leaves the downloader, but some never reach it: they are answered by a downloader
+        # middleware (e.g. replayed from an archive), or dropped by one (see `FrontierLeaseMiddleware`)
+        crawler.signals.connect(scheduler.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        crawler.signals.connect(scheduler.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+
+        # Let the spider spend the global file budget through the frontier
+        spider.frontier = self.frontier
+
+    def close(self, reason):
+        self.frontier.close()
+
+    def has_pending_requests(self) -> bool:
+        return self.frontier.has_pending()
+
+    def enqueue_request(self, request) -> bool:
+        fingerprint = self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+        # Requests that opt out of deduplication are still deduplicated across workers (every worker sends the same
+        # start requests), but each retry of a request gets a fingerprint of its own
+        if request.dont_filter:
+            fingerprint = f"{fingerprint}-{request.meta.get('retry_times', 0)}"
+
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+
+        if not self.frontier.push(fingerprint, urlparse(request.url).netloc, data, request.priority):
+            self.stats.inc_value('frontier/filtered', spider=self.spider)
+            return False
+
+        self.stats.inc_value('frontier/enqueued', spider=self.spider)
+        return True
+
+    def next_request(self):
+        claimed = self.frontier.pop(self.delay)
+        if claimed is None:
+            return None
+
+        fingerprint, data = claimed
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta['frontier_fingerprint'] = fingerprint
+
+        self.stats.inc_value('frontier/dequeued', spider=self.spider)
+        return request
+
+    def request_left_downloader(self, request, spider):
+        self._done(request)
+
+    def response_received(self, response, request, spider):
+        self._done(request)
+
+    def request_dropped(self, request, spider):
+        self._done(request)
+
+    def _done(self, request) -> None:
+        # Marking a request done more than once is harmless, and settles its lease either way
+        fingerprint = request.meta.get('frontier_fingerprint')
+        if fingerprint is not None:
+            self.frontier.done(fingerprint)
+
+    def spider_idle(self, spider):
+        # Other workers may still be downloading or parsing pages whose links haven't reached the frontier yet
+        if self.frontier.is_active(self.idle_grace):
+            raise DontCloseSpider
+
+
+class FrontierLeaseMiddleware:
+    """
+    Settle the lease of a request claimed from a shared frontier when a downloader middleware drops it, e.g. the
+    `RobotsTxtMiddleware`, the URL blocklist of the `ResponseFilterMiddleware`, or the `ArchiveMiddleware` replaying a
+    crawl. Those requests never reach the downloader, so without this they would stay claimed, keep every worker
+    waiting, and be handed out again once their lease ran out.
+
+    It is placed after every other downloader middleware, so that its `process_exception` is the first to be called.
+    """
+
+    def process_exception(self, request, exception, spider):
+        fingerprint = request.meta.get('frontier_fingerprint')
+        frontier = getattr(spider, 'frontier', None)
+        if fingerprint is not None and frontier is not None:
+            frontier.done(fingerprint)
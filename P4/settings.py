@@ -26,6 +26,7 @@ ROBOTSTXT_OBEY = True
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
+# With the adaptive throttle enabled (below), these are only the starting delay and concurrency for each host
 DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
@@ -54,18 +55,114 @@ CONCURRENT_REQUESTS_PER_DOMAIN = 1
 #DOWNLOADER_MIDDLEWARES = {
 #    "P4.middlewares.P4DownloaderMiddleware": 543,
 #}
+DOWNLOADER_MIDDLEWARES = {
+    "P4.middlewares.ConditionalRequestMiddleware": 560,
+    # Below the HttpCompressionMiddleware (590), so that its process_response sees decompressed bodies
+    "P4.middlewares.ResponseFilterMiddleware": 580,
+    # After the RetryMiddleware, so that it sees 429/503 responses before they are retried
+    "P4.middlewares.AdaptiveThrottleMiddleware": 810,
+    # Last, so that it records responses exactly as they were downloaded, and replays them in place of the download
+    "P4.middlewares.ArchiveMiddleware": 950,
+    # After the ArchiveMiddleware, so that it's the first to see the requests the other middlewares drop
+    "P4.scheduler.FrontierLeaseMiddleware": 960,
+}
+
+# Record the crawl to a WARC archive ('record'), or replay a recorded crawl from one without the network ('replay').
+# None crawls the live site as usual. In replay mode, each response is served after ARCHIVE_REPLAY_LATENCY seconds
+ARCHIVE_MODE = None
+ARCHIVE_PATH = "crawl_state/crawl.warc.gz"
+ARCHIVE_REPLAY_LATENCY = 0.0
+
+# Reject responses before they are parsed, on their URL, Content-Type, size and language (see P4/middlewares.py)
+RESPONSE_FILTER_ENABLED = True
+RESPONSE_FILTER_URL_BLOCKLIST = [r"\.(pdf|docx?|xlsx?|pptx?|zip|jpe?g|png|gif|mp[34])$", r"/fr/"]
+RESPONSE_FILTER_CONTENT_TYPES = ["text/html", "application/xhtml+xml"]
+RESPONSE_FILTER_MAX_SIZE = 5 * 1024 * 1024
+RESPONSE_FILTER_LANGUAGES = ["en"]
+# How sure the trigram language guess must be before rejecting a page without a lang attribute
+RESPONSE_FILTER_LANGID_CONFIDENCE = 0.6
+
+# Adapt each host's delay and concurrency to its latency and error rate (see P4/middlewares.py). The minimum delay and
+# maximum concurrency are the ceiling on the load put on each host. By default they are DOWNLOAD_DELAY and one
+# request at a time, so the throttle only ever slows down. To let it crawl a host faster, lower the minimum delay
+# and/or raise the maximum concurrency, e.g. to 0.5 and 4
+ADAPTIVE_THROTTLE_ENABLED = True
+#ADAPTIVE_THROTTLE_MIN_DELAY = 0.5
+ADAPTIVE_THROTTLE_MAX_DELAY = 60
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0
+ADAPTIVE_THROTTLE_ERROR_RATE = 0.1
+ADAPTIVE_THROTTLE_WINDOW = 10
+# How often, in seconds, to record throughput to the `adaptive_throttle/timeline` stat
+ADAPTIVE_THROTTLE_TIMELINE_INTERVAL = 60
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+EXTENSIONS = {
+    "P4.extensions.MetricsExtension": 500,
+}
+
+# Record per-stage latency histograms (download, parse, extract, link filter, clean, write), bytes in and out, queue
+# depths and pages/sec (see P4/metrics.py). They are written as a Prometheus textfile every METRICS_INTERVAL seconds,
+# and as a JSON summary when the spider closes. Turn off to skip the instrumentation entirely
+METRICS_ENABLED = True
+METRICS_INTERVAL = 15
+METRICS_TEXTFILE = "crawl_state/metrics.prom"
+METRICS_JSON = "crawl_state/metrics.json"
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "P4.pipelines.P4Pipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "P4.pipelines.CleaningPipeline": 200,
+    "P4.pipelines.NearDuplicatePipeline": 250,
+    "P4.pipelines.P4Pipeline": 300,
+    "P4.pipelines.StreamingClusterPipeline": 400,
+}
+
+# Find pages that are near duplicates of a page already crawled (see P4/minhash.py): those whose words have an
+# estimated Jaccard similarity of at least NEAR_DUPLICATE_THRESHOLD with an earlier page's. NEAR_DUPLICATE_ACTION is
+# 'drop' to not save them, giving their file back to the budget, or 'tag' to save them anyway. Either way, they are
+# listed in NEAR_DUPLICATE_REPORT. With NEAR_DUPLICATE_PERSIST, the index is kept in NEAR_DUPLICATE_PATH across crawls.
+# Off by default, so every page is saved. Turned on by `crawl.py --near-duplicates drop` (or `tag`)
+NEAR_DUPLICATE_ENABLED = False
+NEAR_DUPLICATE_THRESHOLD = 0.9
+NEAR_DUPLICATE_NUM_PERM = 128
+NEAR_DUPLICATE_ACTION = "drop"
+NEAR_DUPLICATE_PERSIST = False
+NEAR_DUPLICATE_PATH = "crawl_state/near_duplicates/"
+NEAR_DUPLICATE_REPORT = "crawl_state/near_duplicates.tsv"
+
+# Cluster pages as they are crawled (see P4/pipelines.py), saving the top terms of each cluster and their sentiment
+# scores every STREAM_CLUSTER_SNAPSHOT_EVERY pages. Turned on by `crawl.py --live-clusters`
+STREAM_CLUSTER_ENABLED = False
+STREAM_CLUSTER_KS = [3, 6]
+STREAM_CLUSTER_BATCH_SIZE = 50
+STREAM_CLUSTER_SNAPSHOT_EVERY = 200
+STREAM_CLUSTER_QUEUE_SIZE = 500
+STREAM_CLUSTER_FOLDER = "clusters/"
+
+# The number of worker processes the CleaningPipeline cleans page text in. 0 cleans in the reactor thread instead.
+# Defaults to the number of CPUs
+#CLEANING_WORKERS = 4
+# The most pages that may be on the cleaning workers at once. Past that, pages wait in the CleaningPipeline for room
+CLEANING_MAX_PENDING = 32
+# Waiting pages keep their responses active in Scrapy's scraper, so this sets how many of them may wait: once the
+# responses being scraped add up to more than this many bytes, the crawl holds back until the workers catch up
+#SCRAPER_SLOT_MAX_ACTIVE_SIZE = 5_000_000
+# How the CleaningPipeline cleans each fragment of text: 'fast' (precompiled patterns, one pass over the tokens) or
+# 'nltk' (the original cleaning, with NLTK's word_tokenize). Both give the same text
+#CLEANING_NORMALIZER = 'fast'
+
+# Where the P4Pipeline saves the text of each page: 'files' saves one file per page in text_files/, 'segments' appends
+# them to a few large segment files in CORPUS_STORE_PATH, with an index from URL to segment, offset and length. 'none'
+# doesn't save them, e.g. when they are only clustered as they are crawled
+CORPUS_STORE = "files"
+CORPUS_STORE_PATH = "corpus"
+CORPUS_SEGMENT_SIZE = 64 * 1024 * 1024
+CORPUS_COMPRESS = False
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -92,3 +189,27 @@ CONCURRENT_REQUESTS_PER_DOMAIN = 1
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
+
+# Where the incremental crawl mode (`crawl.py --incremental`) remembers the validators, content hash and links of
+# every crawled page
+INCREMENTAL_CACHE_PATH = "crawl_state/pages.sqlite"
+
+# The shared frontier used when crawling with several workers (`crawl.py -w 4`, or `-f` on several machines). See
+# P4/frontier.py and P4/scheduler.py
+FRONTIER_BACKEND = "P4.frontier.SQLiteFrontier"
+FRONTIER_PATH = "crawl_state/frontier.sqlite"
+# How long, in seconds, a request may stay claimed by a worker before it is handed out again
+FRONTIER_LEASE_TIMEOUT = 300
+# How long, in seconds, an idle worker waits for other workers to add requests before closing
+FRONTIER_IDLE_GRACE = 10
+
+# Filter duplicate requests with a scalable Bloom filter of fingerprints instead of an in-memory set (see
+# P4/dupefilter.py). DUPEFILTER_ERROR_RATE is the target false-positive rate, i.e. the fraction of new URLs that may be
+# wrongly skipped. Set DUPEFILTER_PATH with DUPEFILTER_DISK to memory-map the filter there, and/or DUPEFILTER_PERSIST
+# to reload it on the next run (which resumes an interrupted crawl, so don't combine it with --incremental)
+DUPEFILTER_CLASS = "P4.dupefilter.BloomDupeFilter"
+DUPEFILTER_CAPACITY = 100_000
+DUPEFILTER_ERROR_RATE = 0.001
+#DUPEFILTER_PATH = "crawl_state/dupefilter"
+#DUPEFILTER_DISK = True
+#DUPEFILTER_PERSIST = True
@@ -1,82 +1,63 @@
 import logging
+import time
+from hashlib import sha1
 from pathlib import Path
 from urllib.parse import urljoin
-from re import sub
 
 import scrapy
 from scrapy.exceptions import CloseSpider
-from bs4 import BeautifulSoup
-from nltk import word_tokenize
-from nltk.corpus import stopwords
 
+from P4.corpus import open_store, text_file_name
+from P4.extraction import get_backend
+from P4.items import P4Item
+from P4.metrics import NULL_METRICS
+from P4.normalization import get_normalizer
+from P4.page_cache import CachedPage, PageCache
 
-# Get first 150 stopwords
-stopwords = list(stopwords.words('english'))[:150]
 
-
-def _clean(string: str) -> str:
+def _fill_page_text(*list_of_lists: list, normalizer: str = 'fast') -> str:
     """
-    Given a string, clean it according to some rules.
+    Turn the given list of lists of page elements into a single string representing the page's content.
 
-    :param string: The string to clean
-    :return: The cleaned string
+    :param list_of_lists: The list of lists of page elements
+    :param normalizer: The name of the normalizer cleaning each element. See `P4.normalization.NORMALIZERS`
+    :return: The single string representing the page's text
     """
 
-    # Remove punctuation and special characters
-    string = sub(r"[()<>{}\[\]!$=@&*-/|+.,:;`'?\"]+", ' ', string)
-
-    # Remove certain unicode control characters, as found in experiment
-    string = sub(r'\xa0|\x03|\x02|\x07|\x05|\xfc|\u007F', ' ', string)
-
-    # Remove multiple spaces
-    string = sub(r'\s{2,}', ' ', string)
+    clean = get_normalizer(normalizer)
 
-    # Tokenize string
-    tokenized = word_tokenize(string)
+    return ''.join(f" {clean(item)}" for ls in list_of_lists for item in ls)
 
-    # Remove stopwords
-    no_stopwords = [t for t in tokenized if t not in stopwords]
 
-    # Remove numbers
-    no_nums = [t for t in no_stopwords if not t.isnumeric()]
-
-    # Lowercase
-    lowercase = [t.lower() for t in no_nums]
-
-    # Remove tokens that are of length 1
-    no_len_1 = [t for t in lowercase if len(t) != 1]
-
-    # Remove duplicates
-    no_dupes = {t for t in no_len_1}
-
-    # Join into single string
-    to_return = ' '.join(t for t in no_dupes)
+def _is_unchanged(response, cached: CachedPage, content_hash: str, store) -> bool:
+    """
+    Check whether a page is unchanged since it was last crawled, and its saved text (if any) is still there.
 
-    # Remove surrounding spaces
-    to_return = to_return.strip()
+    :param response: The response from the internet
+    :param cached: What was remembered about the page
+    :param content_hash: The hash of the response body
+    :param store: The document store the page's text was saved to
+    :return: Whether the page can be skipped
+    """
 
-    # Ensure 1 space at the end
-    to_return = f"{to_return} "
+    if cached.filename is not None and not store.exists(cached.url, cached.filename):
+        return False
 
-    return to_return
+    return response.status == 304 or cached.content_hash == content_hash
 
 
-def _fill_page_text(*list_of_lists: list) -> str:
+def _header(response, name: str):
     """
-    Turn the given list of lists of page elements into a single string representing the page's content.
+    Get a response header as a string.
 
-    :param list_of_lists: The list of lists of page elements
-    :return: The single string representing the page's text
+    :param response: The response from the internet
+    :param name: The name of the header
+    :return: The header's value, or None if it wasn't sent
     """
 
-    page_text = ""
-
-    for ls in list_of_lists:
-        for item in ls:
-            item = _clean(item)
-            page_text += f" {item}"
+    value = response.headers.get(name)
 
-    return page_text
+    return value.decode('latin-1') if value is not None else None
 
 
 class MainSpider(scrapy.Spider):
@@ -88,6 +69,41 @@ class MainSpider(scrapy.Spider):
     max_files = None
     num_files = 0
 
+    # The frontier shared with other crawler processes, when crawling with the `SharedFrontierScheduler`.
+    # The file budget is then global, rather than per process
+    frontier = None
+
+    # The extraction backend used to pull text and links out of each page. See `P4.extraction.BACKENDS`
+    backend = 'bs4'
+
+    # Whether to re-crawl incrementally, skipping pages that haven't changed since the last crawl
+    incremental = False
+    page_cache = None
+
+    # Where the text of each page is saved. See `P4.corpus.open_store`
+    store = None
+
+    # Where the time spent in each stage is recorded. Replaced by the MetricsExtension when metrics are enabled
+    metrics = NULL_METRICS
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """
+        Create the spider, opening the document store, and the persistent page cache if crawling incrementally.
+
+        :param crawler: The crawler the spider belongs to
+        :return: The spider
+        """
+
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        spider.store = open_store(crawler.settings)
+
+        if spider.incremental:
+            spider.page_cache = PageCache(crawler.settings.get('INCREMENTAL_CACHE_PATH'))
+
+        return spider
+
     @classmethod
     def update_settings(cls, settings):
         """
@@ -115,65 +131,55 @@ class MainSpider(scrapy.Spider):
         """
 
         # First, check to see if we've reached the file download limit. If so, stop the crawler
-        if self.num_files >= self.max_files:
+        if self._budget_reached():
             self.log(f"Reached maximum files to save: {self.max_files}", level=logging.INFO)
             raise CloseSpider(f"Reached maximum files to save: {self.max_files}")
 
-        # If we receive a 404, don't bother with parsing this link
-        if response.status == 404:
+        # If we receive a 404, don't bother with parsing this link. If it was crawled before, it has disappeared
+        if response.status in (404, 410):
+            self._forget_page(response.url)
             return
 
-        # Parse the response body
-        contents = BeautifulSoup(response.body, features="html.parser", from_encoding='utf-8')
-
-        # Only bother with English pages
-        if contents.html['lang'] != "fr":
-            # Get the actual page name, removing 'https://', replacing '/' characters for '-' characters.
-            # This helps with file saving
-            page = response.url.split('//')[-1].replace('/', '-')
+        content_hash = sha1(response.body).hexdigest()
 
-            # Replace invalid characters with a '-'
-            page = sub(r'[\\/:*?\"<>|]', '-', page)
+        # When crawling incrementally, don't re-parse or re-save pages that haven't changed since the last crawl
+        if self.page_cache is not None:
+            cached = self.page_cache.get(response.url)
+            if cached is not None and _is_unchanged(response, cached, content_hash, self.store):
+                yield from self._follow_cached(response, cached)
+                return
 
-            # Set the filename to save
-            filename = f"text_files/{page}.txt"
-
-            # Set a list of valid HTML to tags to parse. This narrows the scope of the text
-            valid_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
-
-            # Get all paragraph text
-            paragraphs = [p.text for p in contents.body.find_all('p')]
-
-            # Get all headings by type
-            headings_lists = [contents.body.find_all(h) for h in valid_tags[1:]]
-
-            # Flatten the headings list, keeping only the text of each heading
-            headings = [item.text for sublist in headings_lists for item in sublist]
+        # A 304 for a page we know nothing about has nothing to parse
+        if response.status == 304:
+            return
 
-            # Get all divs with the 'body' class
-            div_bodies = [d.text for d in contents.body.find_all('div', {'class': 'body'})]
+        # Parse the response body, pulling out the text and links in one go
+        start = time.perf_counter()
+        contents = get_backend(self.backend)(response.body, self.metrics)
 
-            # Get all list items
-            list_items = [li.text for li in contents.body.find_all('li')]
+        # Keep track of the parse cost, from which the ResponseFilterMiddleware estimates the time it saves
+        self.crawler.stats.inc_value('parse/seconds', time.perf_counter() - start)
+        self.crawler.stats.inc_value('parse/bytes', len(response.body))
 
-            page_text = _fill_page_text(paragraphs, headings, div_bodies, list_items)
+        # Only bother with English pages
+        if contents.lang != "fr":
+            # Set the filename to save
+            filename = text_file_name(response.url)
 
-            # Ensure the required directory exists and write the HTML for the page into the file
-            Path('text_files').mkdir(exist_ok=True, parents=True)
-            with open(filename, 'wt', encoding='utf-8') as f:
-                f.writelines(page_text)
-            self.log(f"Saved file: {filename}")
-            self.num_files += 1
+            # Hand the raw text over to the item pipelines, which clean it off the reactor thread and save it
+            self._reserve_file()
+            yield P4Item(url=response.url, filename=filename,
+                         fragments=[contents.paragraphs, contents.headings, contents.div_bodies, contents.list_items])
 
             # Get all links on this page
-            links = [l['href'] for l in contents.body.find_all('a', href=True)]
-            # links = response.css('a::attr(href)').getall()
-            self.log(f"On {page}, found {len(links)} links in total", level=logging.INFO)
+            links = contents.links
+            self.log(f"On {filename}, found {len(links)} links in total", level=logging.INFO)
 
             # TLDs must be in this list
             allowed_TLDs = ['.html', '.htm', '.ca']
 
             # From these links, get all links that follow certain rules
+            link_filter_start = time.perf_counter()
             valid_links = [urljoin(response.url, link) for link in links if
 
                            # If this link starts with '/' then it is an endpoint of Concordia. Keep
@@ -198,7 +204,104 @@ class MainSpider(scrapy.Spider):
 
                            # If this link has an allowed TLD, Keep
                            and Path(link).suffix in allowed_TLDs]
-            self.log(f"From all links found on {page}, found {len(valid_links)} valid links", level=logging.INFO)
+            self.metrics.observe('link_filter', time.perf_counter() - link_filter_start)
+            self.log(f"From all links found on {filename}, found {len(valid_links)} valid links", level=logging.INFO)
+
+            if self.page_cache is not None:
+                self.page_cache.update(response.url, _header(response, 'ETag'), _header(response, 'Last-Modified'),
+                                       content_hash, filename, valid_links)
 
             # Recursively follow all valid links using this method
             yield from response.follow_all(valid_links, callback=self.parse)
+
+        elif self.page_cache is not None:
+            # Remember non-English pages too, so they can be skipped cheaply next time
+            self.page_cache.update(response.url, _header(response, 'ETag'), _header(response, 'Last-Modified'),
+                                   content_hash, None, [])
+
+    def _follow_cached(self, response, cached: CachedPage):
+        """
+        Handle a page that hasn't changed since the last crawl: keep its saved file as it is, and follow the
+        links that were found on it last time.
+
+        :param response: The response from the internet. Either a 304 or a 200 with the same content as before
+        :param cached: What was remembered about the page
+        """
+
+        self.page_cache.mark_seen(response.url, _header(response, 'ETag'), _header(response, 'Last-Modified'))
+
+        # Non-English pages were never saved, and have no links to follow
+        if cached.filename is None:
+            return
+
+        self.log(f"Unchanged since last crawl: {cached.filename}")
+        self._reserve_file()
+
+        yield from response.follow_all(cached.links, callback=self.parse)
+
+    def _budget_reached(self) -> bool:
+        """
+        Check whether the maximum number of files to save has been reached, across all workers if the frontier is
+        shared.
+
+        :return: Whether the budget is spent
+        """
+
+        used = self.frontier.files_used() if self.frontier is not None else self.num_files
+
+        return used >= self.max_files
+
+    def _reserve_file(self) -> None:
+        """
+        Count a page towards the maximum number of files to save. With a shared frontier, the file is reserved from
+        the global budget, and the spider closes if another worker took the last one.
+        """
+
+        if self.frontier is not None and not self.frontier.claim_file(self.max_files):
+            self.log(f"Reached maximum files to save: {self.max_files}", level=logging.INFO)
+            raise CloseSpider(f"Reached maximum files to save: {self.max_files}")
+
+        self.num_files += 1
+
+    def _release_file(self) -> None:
+        """
+        Give back a file counted by `_reserve_file`, for a page that ended up not being saved.
+        """
+
+        if self.frontier is not None:
+            self.frontier.release_file()
+
+        self.num_files -= 1
+
+    def _forget_page(self, url: str) -> None:
+        """
+        Forget a page that no longer exists, deleting its saved text.
+
+        :param url: The URL of the page
+        """
+
+        if self.page_cache is None:
+            return
+
+        page = self.page_cache.remove(url)
+        if page is not None and page.filename is not None:
+            self.store.delete(page.url, page.filename)
+            self.log(f"Removed disappeared page: {page.filename}", level=logging.INFO)
+
+    def closed(self, reason: str) -> None:
+        """
+        Called when the spider closes. When crawling incrementally, and the crawl ran to completion, delete the
+        saved text of pages that weren't reached anymore.
+
+        :param reason: Why the spider closed
+        """
+
+        if self.page_cache is not None:
+            # If the crawl was cut short (e.g. by the file limit), unseen pages may simply not have been reached yet
+            if reason == 'finished':
+                for page in self.page_cache.unseen():
+                    self._forget_page(page.url)
+
+            self.page_cache.close()
+
+        self.store.close()
@@ -0,0 +1,379 @@
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.random_projection import SparseRandomProjection
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Split an iterable into lists of at most `size` items.
+
+    :param iterable: The iterable to split
+    :param size: The size of each chunk
+    :return: A generator of the chunks
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StreamingTfidf:
+    """
+    A TF-IDF vectorizer that learns its document frequencies from a stream of chunks, instead of from the whole corpus
+    at once like `TfidfVectorizer`.
+
+    Terms are hashed into `n_features` buckets, so no vocabulary has to be kept while counting. Once every chunk has
+    been counted (`partial_fit`, then `finish`), the buckets outside `min_df` and `max_df` are dropped, the same way
+    `TfidfVectorizer` prunes its vocabulary, and chunks can be transformed into TF-IDF rows over the kept buckets.
+    Each kept bucket is named after the most frequent term hashed into it, for showing the top terms of clusters.
+
+    The documents are analyzed (lowercased, accent-stripped, tokenized, stopwords removed) exactly like
+    `TfidfVectorizer` would, with the same parameters.
+    """
+
+    def __init__(self, n_features: int = 2 ** 20, max_df: float = 0.5, min_df: float = 0.1,
+                 stop_words: Optional[List[str]] = None, strip_accents: Optional[str] = 'unicode'):
+        """
+        :param n_features: The number of hash buckets. More buckets mean fewer terms sharing one
+        :param max_df: Drop terms found in more than this share of the documents
+        :param min_df: Drop terms found in less than this share of the documents
+        :param stop_words: The stopwords to remove
+        :param strip_accents: How to strip accents, as for `TfidfVectorizer`
+        """
+
+        self.n_features = n_features
+        self.max_df = max_df
+        self.min_df = min_df
+
+        self.analyzer = TfidfVectorizer(stop_words=stop_words, strip_accents=strip_accents).build_analyzer()
+        self.hasher = FeatureHasher(n_features=n_features, input_type='string', alternate_sign=False)
+
+        self.n_documents = 0
+        self.df = np.zeros(n_features, dtype=np.int64)
+
+        # Set by `finish`
+        self.kept = None
+        self.idf = None
+
+        # The term counts of each kept bucket, to name it after its most frequent term
+        self._term_counts = {}
+
+    def partial_fit(self, documents: List[str]) -> 'StreamingTfidf':
+        """
+        Count the document frequencies of a chunk of documents.
+
+        :param documents: The text of each document
+        :return: This vectorizer
+        """
+
+        counts = self._hash(documents)
+
+        # Each document counts once per bucket it has a term in
+        self.df += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_documents += counts.shape[0]
+
+        return self
+
+    def finish(self) -> 'StreamingTfidf':
+        """
+        Choose the buckets to keep, and compute their IDF, once all chunks have been counted.
+
+        :return: This vectorizer
+        """
+
+        self.kept = self._prune()
+        if len(self.kept) == 0:
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+        self.idf = self._idf(self.kept)
+
+        return self
+
+    def partial_fit_transform(self, documents: List[str]) -> sparse.csr_matrix:
+        """
+        Count the document frequencies of a chunk of documents, then turn it into L2-normalized TF-IDF rows over every
+        bucket, weighted with the frequencies counted so far. This is for clustering documents as they arrive: buckets
+        currently outside `min_df` and `max_df` get a weight of 0, and the columns stay the same as more documents are
+        counted. `finish` doesn't need to be called.
+
+        :param documents: The text of each document
+        :return: The TF-IDF matrix of the chunk, with one column per bucket
+        """
+
+        tokens = [self.analyzer(document) for document in documents]
+        counts = self.hasher.transform(tokens)
+
+        self.df += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_documents += counts.shape[0]
+
+        self.kept = self._prune()
+        self._count_terms(tokens)
+
+        weights = np.zeros(self.n_features)
+        weights[self.kept] = self._idf(self.kept)
+
+        return normalize(counts.multiply(weights).tocsr(), copy=False)
+
+    def transform(self, documents: List[str]) -> sparse.csr_matrix:
+        """
+        Turn a chunk of documents into L2-normalized TF-IDF rows over the kept buckets.
+
+        :param documents: The text of each document
+        :return: The TF-IDF matrix of the chunk, with one column per kept bucket
+        """
+
+        tokens = [self.analyzer(document) for document in documents]
+        self._count_terms(tokens)
+
+        counts = self.hasher.transform(tokens)[:, self.kept]
+
+        return normalize(counts.multiply(self.idf).tocsr(), copy=False)
+
+    def get_feature_names_out(self) -> np.ndarray:
+        """
+        :return: The name of each kept bucket: the most frequent term hashed into it among the documents transformed
+                 so far
+        """
+
+        names = []
+        for bucket in self.kept:
+            counts = self._term_counts.get(bucket)
+            names.append(max(counts, key=counts.get) if counts else f'#{bucket}')
+
+        return np.array(names, dtype=object)
+
+    def _prune(self) -> np.ndarray:
+        """
+        :return: The buckets within `min_df` and `max_df`, given the documents counted so far
+        """
+
+        low = self.min_df * self.n_documents if isinstance(self.min_df, float) else self.min_df
+        high = self.max_df * self.n_documents if isinstance(self.max_df, float) else self.max_df
+
+        return np.flatnonzero((self.df >= max(low, 1)) & (self.df <= high))
+
+    def _idf(self, buckets: np.ndarray) -> np.ndarray:
+        # Smoothed IDF, as in TfidfTransformer
+        return np.log((1 + self.n_documents) / (1 + self.df[buckets])) + 1
+
+    def _hash(self, documents: List[str]) -> sparse.csr_matrix:
+        return self.hasher.transform(self.analyzer(document) for document in documents)
+
+    def _count_terms(self, tokens: List[List[str]]) -> None:
+        """
+        Count how often each term of the kept buckets appears, to name the buckets.
+
+        :param tokens: The analyzed tokens of each document of a chunk
+        """
+
+        terms, frequencies = np.unique(np.array([t for doc in tokens for t in doc], dtype=object),
+                                       return_counts=True)
+        if len(terms) == 0:
+            return
+
+        # Hash each distinct term on its own, to find its bucket
+        buckets = self.hasher.transform([[term] for term in terms]).indices
+
+        kept = np.isin(buckets, self.kept)
+        for term, bucket, frequency in zip(terms[kept], buckets[kept], frequencies[kept]):
+            counts = self._term_counts.setdefault(bucket, {})
+            counts[term] = counts.get(term, 0) + frequency
+
+
+class IncrementalLSA:
+    """
+    LSA dimensionality reduction fitted a chunk at a time, in place of `TruncatedSVD` on the whole TF-IDF matrix.
+
+    Chunks are projected down to at most `projection_dim` dense columns with a sparse random projection (if they have
+    more columns than that), and an `IncrementalPCA` is fitted on them. Transformed rows are L2-normalized, like the
+    `Normalizer` after the SVD in the in-memory path.
+    """
+
+    def __init__(self, n_components: int = 100, projection_dim: int = 1024, batch_size: int = 1000,
+                 random_state: int = 0):
+        """
+        :param n_components: The number of LSA components
+        :param projection_dim: The most columns to fit the PCA on. Wider TF-IDF matrices are randomly projected first
+        :param batch_size: How many rows to gather before each `IncrementalPCA.partial_fit`
+        :param random_state: The seed of the random projection
+        """
+
+        self.n_components = n_components
+        self.projection_dim = projection_dim
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+        self.projection = None
+        self.pca = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def partial_fit(self, X: sparse.csr_matrix) -> 'IncrementalLSA':
+        """
+        Fit on a chunk of TF-IDF rows.
+
+        Rows are gathered until there are `batch_size` of them, since each `IncrementalPCA` step needs at least
+        `n_components` rows.
+
+        :param X: The TF-IDF rows
+        :return: This reducer
+        """
+
+        if self.pca is None:
+            self._start(X.shape[1])
+
+        self._pending.append(self._project(X))
+        self._pending_rows += X.shape[0]
+
+        if self._pending_rows >= max(self.batch_size, self.pca.n_components):
+            self._fit_pending()
+
+        return self
+
+    def finish(self) -> 'IncrementalLSA':
+        """
+        Fit on the rows still gathered, once all chunks have been seen. If there are fewer than `n_components` of
+        them (and the PCA was already fitted on earlier batches), they are left out.
+
+        :return: This reducer
+        """
+
+        if self._pending_rows >= self.pca.n_components or not hasattr(self.pca, 'components_'):
+            self._fit_pending()
+        self._pending, self._pending_rows = [], 0
+
+        return self
+
+    def transform(self, X: sparse.csr_matrix) -> np.ndarray:
+        """
+        :param X: TF-IDF rows
+        :return: Their L2-normalized LSA coordinates
+        """
+
+        return normalize(self.pca.transform(self._project(X)), copy=False)
+
+    def inverse_transform(self, X: np.ndarray) -> np.ndarray:
+        """
+        Map LSA coordinates (e.g. cluster centroids) back to the TF-IDF columns, to find their top terms.
+
+        A random projection can't be inverted exactly. Its transpose is used instead, which approximately preserves
+        the relative weights of the columns.
+
+        :param X: LSA coordinates
+        :return: Their weight for each TF-IDF column
+        """
+
+        X = self.pca.inverse_transform(X)
+        if self.projection is not None:
+            X = np.asarray(self.projection.components_.T @ X.T).T
+
+        return X
+
+    @property
+    def explained_variance_ratio_(self) -> np.ndarray:
+        return self.pca.explained_variance_ratio_
+
+    def _start(self, n_columns: int) -> None:
+        if n_columns > self.projection_dim:
+            self.projection = SparseRandomProjection(self.projection_dim, dense_output=True,
+                                                     random_state=self.random_state)
+            self.projection.fit(sparse.csr_matrix((1, n_columns)))
+            n_columns = self.projection_dim
+
+        self.pca = IncrementalPCA(n_components=min(self.n_components, n_columns))
+
+    def _project(self, X: sparse.csr_matrix) -> np.ndarray:
+        if self.projection is None:
+            return X.toarray()
+
+        return self.projection.transform(X)
+
+    def _fit_pending(self) -> None:
+        if self._pending:
+            self.pca.partial_fit(np.vstack(self._pending))
+        self._pending, self._pending_rows = [], 0
+
+
+class OnlineClusterer:
+    """
+    Cluster documents as they arrive, for live results while a crawl runs.
+
+    Each batch of documents updates the document frequencies of a `StreamingTfidf`, is weighted with the frequencies
+    counted so far, and takes one `MiniBatchKMeans.partial_fit` step for each k. There is no LSA step, since an SVD
+    can't be updated a batch at a time on sparse rows; the clusters are fitted on the L2-normalized TF-IDF rows
+    directly. The top terms of each cluster can be read at any time.
+    """
+
+    def __init__(self, ks: Iterable[int] = (3, 6), n_features: int = 2 ** 18, max_df: float = 0.5,
+                 min_df: float = 0.1, stop_words: Optional[List[str]] = None):
+        """
+        :param ks: The numbers of clusters to fit
+        :param n_features: The number of hash buckets
+        :param max_df: Ignore terms found in more than this share of the documents
+        :param min_df: Ignore terms found in fewer than this share of the documents
+        :param stop_words: The stopwords to remove
+        """
+
+        self.tfidf = StreamingTfidf(n_features=n_features, max_df=max_df, min_df=min_df, stop_words=stop_words)
+        self.models: Dict[int, MiniBatchKMeans] = {k: MiniBatchKMeans(n_clusters=k, random_state=k, n_init=1)
+                                                   for k in ks}
+        self.sizes = {k: np.zeros(k, dtype=int) for k in ks}
+
+        # Documents waiting for there to be enough of them to start the clusters
+        self._pending = []
+
+    @property
+    def n_documents(self) -> int:
+        return self.tfidf.n_documents
+
+    @property
+    def fitted(self) -> bool:
+        return all(hasattr(model, 'cluster_centers_') for model in self.models.values())
+
+    def partial_fit(self, documents: List[str]) -> 'OnlineClusterer':
+        """
+        Update the clusters with a batch of documents.
+
+        The first step of each K-Means needs at least k documents, so documents are held back until there are enough.
+
+        :param documents: The text of each document
+        :return: This clusterer
+        """
+
+        self._pending.extend(documents)
+        if len(self._pending) < max(self.models):
+            return self
+
+        documents, self._pending = self._pending, []
+
+        X = self.tfidf.partial_fit_transform(documents)
+
+        for k, model in self.models.items():
+            model.partial_fit(X)
+            self.sizes[k] += np.bincount(model.predict(X), minlength=k)
+
+        return self
+
+    def top_terms(self, k: int, n: int = 20) -> List[List[str]]:
+        """
+        :param k: The number of clusters
+        :param n: The number of terms per cluster
+        :return: The `n` terms with the highest weight in each cluster's centroid, among the buckets currently kept
+        """
+
+        kept = self.tfidf.kept
+        names = self.tfidf.get_feature_names_out()
+        centers = self.models[k].cluster_centers_[:, kept]
+
+        return [list(names[np.argsort(center)[::-1][:n]]) for center in centers]
@@ -0,0 +1,231 @@
+import json
+import shutil
+from hashlib import sha1
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+# The most shards to keep before they are merged into one
+MAX_SHARDS = 16
+
+
+class TermCountCache:
+    """
+    A cache of each document's term counts, keyed by the hash of its content, so that a document is only tokenized
+    again when it changes.
+
+    The counts are kept as sparse CSR rows in `.npz` shards, one shard per run that counted new documents. Each shard
+    has a `.keys` file with the content hash of each of its rows. Terms are numbered in the order they were first
+    seen, in `vocabulary.txt`. Once there are more than `MAX_SHARDS` shards, the rows still in use are merged into one.
+
+    The counts depend on how documents are analyzed (stopwords, accents, etc.), so the cache is emptied if the analyzer
+    settings change.
+    """
+
+    def __init__(self, folder: str, stop_words: List[str], strip_accents: str = 'unicode'):
+        """
+        :param folder: The folder of the cache
+        :param stop_words: The stopwords removed when analyzing the documents
+        :param strip_accents: How accents are stripped when analyzing the documents, as for `TfidfVectorizer`
+        """
+
+        self.folder = Path(folder)
+        self.analyzer = TfidfVectorizer(stop_words=stop_words, strip_accents=strip_accents).build_analyzer()
+
+        fingerprint = sha1(json.dumps([sorted(stop_words), strip_accents]).encode('utf-8')).hexdigest()
+        meta_path = self.folder / 'meta.json'
+        if meta_path.exists() and json.loads(meta_path.read_text())['fingerprint'] != fingerprint:
+            shutil.rmtree(self.folder)
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        meta_path.write_text(json.dumps({'fingerprint': fingerprint}))
+
+        self.vocabulary = {}
+        vocabulary_path = self.folder / 'vocabulary.txt'
+        if vocabulary_path.exists():
+            with open(vocabulary_path, 'rt', encoding='utf-8') as f:
+                self.vocabulary = {term.rstrip('\n'): i for i, term in enumerate(f)}
+        self._saved_terms = len(self.vocabulary)
+
+        # Content hash -> (shard, row)
+        self.index = {}
+        for keys_path in sorted(self.folder.glob('shard-*.keys')):
+            shard = int(keys_path.stem.split('-')[1])
+            for row, content_hash in enumerate(keys_path.read_text().split()):
+                self.index[content_hash] = (shard, row)
+
+        self.hits = 0
+        self.misses = 0
+
+    def count_matrix(self, documents: Iterable[str]) -> sparse.csr_matrix:
+        """
+        Get the term counts of documents, from the cache where possible. The counts of new documents are added to the
+        cache as a new shard.
+
+        :param documents: The text of each document
+        :return: The term counts, one row per document, with one column per term of `vocabulary`
+        """
+
+        hashes = []
+        new_rows = {}
+        for text in documents:
+            content_hash = sha1(text.encode('utf-8')).hexdigest()
+            hashes.append(content_hash)
+
+            if content_hash in self.index or content_hash in new_rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+                new_rows[content_hash] = self._count(text)
+
+        if new_rows:
+            self._write_shard(list(new_rows), sparse.vstack(
+                [self._widen(row) for row in new_rows.values()], format='csr'))
+            self._save_vocabulary()
+
+        counts = self._load_rows(hashes)
+
+        if len(list(self.folder.glob('shard-*.npz'))) > MAX_SHARDS:
+            self._compact(hashes, counts)
+
+        return counts
+
+    def _count(self, text: str) -> sparse.csr_matrix:
+        """
+        Tokenize a document and count its terms, adding new terms to the vocabulary.
+
+        :param text: The text of the document
+        :return: A single row of term counts
+        """
+
+        terms, counts = np.unique(np.array(self.analyzer(text), dtype=object), return_counts=True)
+        columns = [self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms]
+
+        return sparse.csr_matrix((counts.astype(np.int64), (np.zeros(len(columns), dtype=int), columns)),
+                                 shape=(1, len(self.vocabulary)))
+
+    def _widen(self, rows: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Widen rows counted with an older, smaller vocabulary to the current one. New terms only get new columns, so the
+        existing columns stay as they are.
+
+        :param rows: The rows
+        :return: The rows, with one column per term of the current vocabulary
+        """
+
+        rows = rows.tocsr()
+        return sparse.csr_matrix((rows.data, rows.indices, rows.indptr), shape=(rows.shape[0], len(self.vocabulary)))
+
+    def _load_rows(self, hashes: List[str]) -> sparse.csr_matrix:
+        """
+        Load the cached rows of documents, loading each shard only once.
+
+        :param hashes: The content hash of each document
+        :return: Their term counts, in the same order
+        """
+
+        by_shard = {}
+        for position, content_hash in enumerate(hashes):
+            shard, row = self.index[content_hash]
+            by_shard.setdefault(shard, ([], []))
+            by_shard[shard][0].append(position)
+            by_shard[shard][1].append(row)
+
+        positions = []
+        blocks = []
+        for shard, (shard_positions, rows) in sorted(by_shard.items()):
+            matrix = sparse.load_npz(self.folder / f'shard-{shard:05d}.npz')
+            blocks.append(self._widen(matrix[rows]))
+            positions.extend(shard_positions)
+
+        if not blocks:
+            return sparse.csr_matrix((0, len(self.vocabulary)), dtype=np.int64)
+
+        # Put the rows back in the order of the documents
+        stacked = sparse.vstack(blocks, format='csr')
+        order = np.empty(len(positions), dtype=int)
+        order[positions] = np.arange(len(positions))
+
+        return stacked[order]
+
+    def _write_shard(self, hashes: List[str], rows: sparse.csr_matrix) -> None:
+        shards = [int(path.stem.split('-')[1]) for path in self.folder.glob('shard-*.npz')]
+        shard = max(shards, default=0) + 1
+
+        sparse.save_npz(self.folder / f'shard-{shard:05d}.npz', rows)
+        (self.folder / f'shard-{shard:05d}.keys').write_text('\n'.join(hashes) + '\n')
+
+        for row, content_hash in enumerate(hashes):
+            self.index[content_hash] = (shard, row)
+
+    def _save_vocabulary(self) -> None:
+        # The vocabulary only ever grows, so only the new terms need to be appended
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)[self._saved_terms:]
+        with open(self.folder / 'vocabulary.txt', 'at', encoding='utf-8') as f:
+            f.writelines(f"{term}\n" for term in terms)
+        self._saved_terms = len(self.vocabulary)
+
+    def _compact(self, hashes: List[str], counts: sparse.csr_matrix) -> None:
+        """
+        Replace every shard by a single one, holding only the rows of the documents of this run.
+
+        :param hashes: The content hash of each document of this run
+        :param counts: Their term counts
+        """
+
+        unique = {}
+        for row, content_hash in enumerate(hashes):
+            unique.setdefault(content_hash, row)
+
+        for path in [*self.folder.glob('shard-*.npz'), *self.folder.glob('shard-*.keys')]:
+            path.unlink()
+        self.index = {}
+
+        self._write_shard(list(unique), counts[list(unique.values())])
+
+
+def tfidf_from_counts(counts: sparse.csr_matrix, vocabulary: dict, max_df: float, min_df: float,
+                      stop_words: List[str], strip_accents: str = 'unicode') -> Tuple[sparse.csr_matrix, TfidfVectorizer]:
+    """
+    Build the TF-IDF matrix of documents from their term counts, the same way `TfidfVectorizer.fit_transform` would
+    from their text: terms outside `max_df`/`min_df` are dropped, the remaining terms are sorted alphabetically, and
+    the counts are weighted by smoothed IDF and L2-normalized.
+
+    :param counts: The term counts, one row per document
+    :param vocabulary: The column of each term in `counts`
+    :param max_df: Drop terms found in more than this share (or number, if an int) of the documents
+    :param min_df: Drop terms found in fewer than this share (or number, if an int) of the documents
+    :param stop_words: The stopwords the counts were made without, for the returned vectorizer
+    :param strip_accents: How accents were stripped, for the returned vectorizer
+    :return: The TF-IDF matrix, and a vectorizer fitted with the same vocabulary and IDF, to transform new documents
+    """
+
+    n_documents = counts.shape[0]
+    high = max_df if isinstance(max_df, int) else max_df * n_documents
+    low = min_df if isinstance(min_df, int) else min_df * n_documents
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    kept = np.flatnonzero((df <= high) & (df >= low))
+    if len(kept) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    # Sort the kept terms alphabetically, like the TfidfVectorizer does
+    kept = set(kept.tolist())
+    terms = sorted(term for term, column in vocabulary.items() if column in kept)
+    columns = [vocabulary[term] for term in terms]
+
+    transformer = TfidfTransformer()
+    X_tfidf = transformer.fit_transform(counts[:, columns].astype(np.float64))
+
+    vectorizer = TfidfVectorizer(stop_words=stop_words, strip_accents=strip_accents, vocabulary=terms,
+                                 encoding='utf-8')
+    # With a fixed vocabulary, fitting only sets the vectorizer up. The IDF is then replaced with the real one
+    vectorizer.fit([''])
+    vectorizer.idf_ = transformer.idf_
+
+    return X_tfidf, vectorizer
@@ -0,0 +1,93 @@
+"""
+Recall-vs-latency benchmark of the similar-page index, against exact (brute-force) cosine search.
+
+Benchmark the index saved by the latest run of cluster.py:
+
+    $ python -m benchmarks.ann
+
+Or an index of synthetic vectors, to see how it behaves at scale:
+
+    $ python -m benchmarks.ann --synthetic 500000
+
+For each number of probed lists, it reports the mean latency of a query and its recall@k: the share of the true k
+nearest pages it finds.
+"""
+
+import json
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from P4.ann import IVFIndex, benchmark
+from P4.cluster_model import ClusterModel
+
+parser = ArgumentParser(description="Similar Pages Benchmark")
+parser.add_argument('--synthetic', type=int,
+                    help="Benchmark an index of this many synthetic vectors, instead of the saved one", required=False)
+parser.add_argument('--dimensions', type=int,
+                    help="With --synthetic, the number of dimensions of the vectors", default=100, required=False)
+parser.add_argument('--queries', '-q', type=int,
+                    help="The number of queries to run", default=200, required=False)
+parser.add_argument('--top', '-k', type=int,
+                    help="The number of similar pages each query returns", default=10, required=False)
+parser.add_argument('--save',
+                    help="Save the results to this JSON file", default=None, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        vectors = _synthetic_vectors(args.synthetic, args.dimensions)
+
+        start = time.perf_counter()
+        index = IVFIndex.build([str(i) for i in range(len(vectors))], vectors)
+        print(f"\nBuilt an index of {len(index)} synthetic vectors in {time.perf_counter() - start:.2f}s")
+    else:
+        model = ClusterModel.load()
+        if model is None or model.index is None:
+            print("\nThere is no saved index of the pages. Run cluster.py --save-model first, or use --synthetic\n")
+            sys.exit(2)
+
+        index = model.index
+        print(f"\nIndex of model v{model.manifest['version']}: {len(index)} pages")
+
+    # Query with indexed vectors, like looking up the pages similar to a crawled page
+    generator = np.random.RandomState(0)
+    queries = index.vectors[generator.choice(len(index), min(args.queries, len(index)), replace=False)]
+
+    results = benchmark(index, queries, args.top)
+
+    print(f"\n--- Recall@{args.top} vs Latency ({len(index.centroids)} lists, {results['queries']} queries) ---\n")
+    print(f"{'exact':>10}: recall 1.000, {results['exact_ms']:8.3f} ms")
+    for n_probe, result in results['probes'].items():
+        print(f"{f'{n_probe} probes':>10}: recall {result['recall']:.3f}, {result['ms']:8.3f} ms "
+              f"({results['exact_ms'] / result['ms']:.1f}x faster)")
+
+    if args.save is not None:
+        with open(args.save, 'wt') as f:
+            json.dump({'documents': len(index), 'lists': len(index.centroids), **results}, f, indent=2)
+        print(f"\nSaved the results to {args.save}")
+
+
+def _synthetic_vectors(n: int, dimensions: int) -> np.ndarray:
+    """
+    Generate unit-length vectors grouped around random topics, like the LSA vectors of pages.
+
+    :param n: The number of vectors
+    :param dimensions: The number of dimensions
+    :return: The vectors, one row each
+    """
+
+    generator = np.random.RandomState(0)
+    topics = generator.randn(max(1, n // 1000), dimensions).astype(np.float32)
+
+    vectors = topics[generator.randint(len(topics), size=n)] + generator.randn(n, dimensions).astype(np.float32)
+
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+if __name__ == '__main__':
+    main()
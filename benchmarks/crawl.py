@@ -0,0 +1,125 @@
+"""
+End-to-end crawl benchmark, replaying a recorded crawl so it runs offline and sees the same pages every time.
+
+Record a crawl of the live site once with:
+
+    $ python crawl.py -n 100 --record crawl_state/crawl.warc.gz
+
+Then replay it, saving the crawl's output as the reference:
+
+    $ python -m benchmarks.crawl crawl_state/crawl.warc.gz -n 100 --save reference.json
+
+And after changing the crawler, replay it again and check that the output is the same:
+
+    $ python -m benchmarks.crawl crawl_state/crawl.warc.gz -n 100 --expected reference.json
+
+The exit status is non-zero when the output differs from the reference, so this can run in CI.
+"""
+
+import json
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from hashlib import sha1
+from pathlib import Path
+
+from scrapy.utils.project import get_project_settings
+
+from P4.corpus import CorpusReader
+
+parser = ArgumentParser(description="Crawl Replay Benchmark")
+parser.add_argument('archive', help="The WARC archive of a recorded crawl")
+parser.add_argument('--num-files', '-n', type=int, help="The number of files to process", default=100, required=False)
+parser.add_argument('--latency', type=float, help="How many seconds each replayed response takes to arrive",
+                    default=0.0, required=False)
+parser.add_argument('--save', help="Save the results and the crawl's output to this JSON file, as a reference",
+                    default=None, required=False)
+parser.add_argument('--expected', help="Check the crawl's output against a reference saved with --save",
+                    default=None, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    if not Path(args.archive).exists():
+        print(f"\nNo archive at {args.archive}. Record one with: python crawl.py --record {args.archive}\n")
+        sys.exit(2)
+
+    print(f"\n--- Crawl Benchmark ({args.archive}, {args.num_files} files, {args.latency}s latency) ---\n")
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'crawl.py', '-n', str(args.num_files), '--replay', args.archive,
+                    '--latency', str(args.latency)], check=True)
+    elapsed = time.perf_counter() - start
+
+    settings = get_project_settings()
+    with open(settings.get('METRICS_JSON'), 'rt') as f:
+        metrics = json.load(f)
+
+    output = _output_signature(settings)
+
+    print(f"\n{'wall time':>14}: {elapsed:.2f}s")
+    print(f"{'pages saved':>14}: {len(output)}")
+    print(f"{'pages/sec':>14}: {metrics['pages_per_second']:.2f}")
+    for stage, summary in metrics['stages'].items():
+        print(f"{stage:>14}: {summary['mean_seconds'] * 1000:8.3f} ms mean, {summary['total_seconds']:.3f}s total")
+
+    if args.save is not None:
+        results = {'wall_seconds': elapsed, 'metrics': metrics, 'output': output}
+        with open(args.save, 'wt') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved the results to {args.save}")
+
+    if args.expected is not None:
+        with open(args.expected, 'rt') as f:
+            expected = json.load(f)['output']
+
+        if not _compare(expected, output):
+            sys.exit(1)
+
+
+def _output_signature(settings) -> dict:
+    """
+    Summarize the crawl's output as a digest of each saved document.
+
+    The cleaned text of a page is made of de-duplicated sets of words, whose order changes from one run to the next.
+    So each document is digested as its sorted words, which is all the clustering sees anyway.
+
+    :param settings: The project settings, to find where the documents were saved
+    :return: A map from each document's file name (or URL, for a segment corpus) to its digest
+    """
+
+    if settings.get('CORPUS_STORE') == 'segments':
+        documents = CorpusReader(settings.get('CORPUS_STORE_PATH')).iter_documents()
+    else:
+        documents = ((path.name, path.read_text(encoding='utf-8')) for path in Path('text_files/').glob('*'))
+
+    return {name: sha1(' '.join(sorted(text.split())).encode('utf-8')).hexdigest()
+            for name, text in sorted(documents)}
+
+
+def _compare(expected: dict, output: dict) -> bool:
+    """
+    Compare the crawl's output with the reference, printing the differences.
+
+    :param expected: The reference output
+    :param output: This crawl's output
+    :return: Whether they are the same
+    """
+
+    missing = sorted(expected.keys() - output.keys())
+    extra = sorted(output.keys() - expected.keys())
+    changed = sorted(name for name in expected.keys() & output.keys() if expected[name] != output[name])
+
+    print("\n--- Equivalence With The Reference ---\n")
+    print(f"{len(expected) - len(missing) - len(changed)}/{len(expected)} documents identical")
+    for label, names in (('missing', missing), ('extra', extra), ('changed', changed)):
+        for name in names:
+            print(f"    {label}: {name}")
+
+    return not (missing or extra or changed)
+
+
+if __name__ == '__main__':
+    main()
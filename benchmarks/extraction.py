@@ -0,0 +1,95 @@
+"""
+Side-by-side benchmark of the HTML extraction backends in `P4.extraction`.
+
+Run it over a folder of saved pages with:
+
+    $ python -m benchmarks.extraction "saved_pages/*.html"
+"""
+
+import glob
+import time
+from argparse import ArgumentParser
+
+from P4.extraction import BACKENDS, PageContent
+
+parser = ArgumentParser(description="Extraction Backend Benchmark")
+parser.add_argument('pages', help="A glob pattern matching the saved HTML pages to parse")
+parser.add_argument('--repeat', '-r', type=int, help="How many times to parse each page", default=3, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(args.pages))
+    if not files:
+        print(f"\nNo pages match {args.pages}\n")
+        return
+
+    bodies = []
+    for file in files:
+        with open(file, 'rb') as f:
+            bodies.append(f.read())
+
+    print(f"\n--- Extraction Benchmark ({len(bodies)} pages, {args.repeat} repeats) ---\n")
+
+    results = {}
+    for name, backend in BACKENDS.items():
+        pages_per_sec, results[name] = _time_backend(backend, bodies, args.repeat)
+        print(f"{name:>6}: {pages_per_sec:10.1f} pages/sec")
+
+    print("\n--- Equivalence With 'bs4' ---\n")
+
+    reference = results['bs4']
+    for name, contents in results.items():
+        if name == 'bs4':
+            continue
+
+        mismatches = [files[i] for i, (a, b) in enumerate(zip(reference, contents)) if not _same_text(a, b)]
+        print(f"{name:>6}: {len(bodies) - len(mismatches)}/{len(bodies)} pages identical")
+        for file in mismatches:
+            print(f"        differs: {file}")
+
+
+def _time_backend(backend, bodies: list, repeat: int) -> tuple:
+    """
+    Time how fast a backend parses all the given pages.
+
+    :param backend: The extraction function to time
+    :param bodies: The raw bytes of each page
+    :param repeat: How many times to parse each page
+    :return: The pages per second, and the extracted content of each page from the last repeat
+    """
+
+    contents = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        contents = [backend(body) for body in bodies]
+    elapsed = time.perf_counter() - start
+
+    return len(bodies) * repeat / elapsed, contents
+
+
+def _same_text(a: PageContent, b: PageContent) -> bool:
+    """
+    Check whether two extractions would produce the same page text and links.
+
+    Whitespace is normalized before comparing, since `_clean` collapses it anyway.
+
+    :param a: The first extraction
+    :param b: The second extraction
+    :return: Whether they are equivalent
+    """
+
+    def normalize(fragments):
+        return [' '.join(f.split()) for f in fragments]
+
+    return (a.lang == b.lang
+            and normalize(a.paragraphs) == normalize(b.paragraphs)
+            and normalize(a.headings) == normalize(b.headings)
+            and normalize(a.div_bodies) == normalize(b.div_bodies)
+            and normalize(a.list_items) == normalize(b.list_items)
+            and a.links == b.links)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Deterministic generator of Concordia-like pages and text corpora, for the benchmarks.
+
+Generate 1,000 HTML pages (as a crawl would download them) with:
+
+    $ python -m benchmarks.generate html 1000 saved_pages/
+
+Or 100,000 cleaned documents (as `crawl.py` would save them to `text_files/`) with:
+
+    $ python -m benchmarks.generate text 100000 text_files/
+
+Document i is always the same, whatever the number of documents generated, so corpora of different sizes are
+prefixes of one another.
+"""
+
+import random
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Iterator, Tuple
+
+# The topics pages are about, each with its own vocabulary. Pages mostly use words of one topic
+TOPICS = {
+    'engineering': ['engineering', 'software', 'computer', 'algorithms', 'circuits', 'electrical', 'mechanical',
+                    'robotics', 'network', 'systems', 'design', 'programming', 'aerospace', 'civil', 'building'],
+    'arts': ['art', 'music', 'theatre', 'dance', 'film', 'painting', 'sculpture', 'gallery', 'studio', 'concert',
+             'exhibition', 'performance', 'cinema', 'creative', 'design'],
+    'health': ['health', 'biology', 'chemistry', 'medicine', 'nutrition', 'exercise', 'wellness', 'clinical',
+               'laboratory', 'research', 'science', 'kinesiology', 'psychology', 'neuroscience', 'genetics'],
+    'business': ['business', 'finance', 'accounting', 'marketing', 'management', 'economics', 'investment',
+                 'entrepreneurship', 'career', 'supply', 'chain', 'analytics', 'leadership', 'commerce', 'strategy'],
+    'student life': ['student', 'students', 'campus', 'residence', 'library', 'tuition', 'scholarship', 'admission',
+                     'orientation', 'housing', 'clubs', 'athletics', 'stingers', 'hockey', 'volunteer'],
+}
+
+# Words found on every kind of page
+COMMON = ['concordia', 'university', 'montreal', 'faculty', 'program', 'event', 'news', 'graduate', 'undergraduate',
+          'department', 'course', 'degree', 'apply', 'contact', 'information', 'research', 'community', 'learn']
+
+# Filler that the cleaning should strip: stopwords, numbers, single letters and punctuation
+FILLER = ['the', 'and', 'of', 'to', 'in', 'for', 'with', 'on', 'our', 'your', 'is', 'are', 'a', '2023', '514',
+          '848-2424', 'a.m.', '&', '-', '(', ')', '!', '?', '...']
+
+# Words with an AFINN score, so sentiment scoring has something to score
+SENTIMENT = ['good', 'great', 'happy', 'excellent', 'best', 'support', 'win', 'award', 'bad', 'crisis', 'problem',
+             'cancelled', 'risk', 'loss', 'fail']
+
+FRENCH = ['bienvenue', 'étudiants', 'université', 'recherche', 'programme', 'inscription', 'études', 'cours']
+
+# The share of pages in French, which the spider skips
+FRENCH_SHARE = 0.1
+
+parser = ArgumentParser(description="Synthetic Corpus Generator")
+parser.add_argument('kind', choices=['html', 'text'], help="Generate HTML pages, or cleaned text documents")
+parser.add_argument('count', type=int, help="The number of documents to generate")
+parser.add_argument('folder', help="The folder to write them to")
+parser.add_argument('--seed', type=int, help="The seed of the generator", default=479, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    folder = Path(args.folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    if args.kind == 'html':
+        for url, body in html_pages(args.count, args.seed):
+            (folder / page_file_name(url)).write_bytes(body)
+    else:
+        for name, text in text_documents(args.count, args.seed):
+            (folder / name).write_text(text, encoding='utf-8')
+
+    print(f"\nGenerated {args.count} {args.kind} documents in {folder}")
+
+
+def html_pages(count: int, seed: int = 479) -> Iterator[Tuple[str, bytes]]:
+    """
+    Generate Concordia-like HTML pages, with headings, paragraphs, list items, body divs and links to other pages.
+
+    :param count: The number of pages
+    :param seed: The seed of the generator
+    :return: A generator of each page's URL and body
+    """
+
+    for i in range(count):
+        yield page_url(i), html_page(i, count, seed)
+
+
+def html_page(i: int, count: int, seed: int = 479) -> bytes:
+    """
+    :param i: The number of the page
+    :param count: The number of pages it may link to
+    :param seed: The seed of the generator
+    :return: The body of page i
+    """
+
+    rng = random.Random(f"{seed}-html-{i}")
+
+    if rng.random() < FRENCH_SHARE:
+        lang, words = 'fr', FRENCH
+    else:
+        lang, words = 'en', _vocabulary(rng)
+
+    def sentence(n):
+        return ' '.join(rng.choice(words) for _ in range(n)).capitalize() + '.'
+
+    levels = [rng.randint(1, 3) for _ in range(rng.randint(1, 4))]
+    headings = ''.join(f"<h{level}>{sentence(rng.randint(2, 6))}</h{level}>" for level in levels)
+    paragraphs = ''.join(f"<p>{' '.join(sentence(rng.randint(8, 20)) for _ in range(rng.randint(1, 4)))}</p>"
+                         for _ in range(rng.randint(2, 10)))
+    items = ''.join(f"<li>{sentence(rng.randint(2, 8))}</li>" for _ in range(rng.randint(0, 12)))
+    body = ''.join(f'<div class="body">{sentence(rng.randint(5, 30))}</div>' for _ in range(rng.randint(0, 3)))
+    links = ''.join(f'<a href="{_link(rng, count)}">{sentence(2)}</a>' for _ in range(rng.randint(5, 40)))
+
+    return (f'<!DOCTYPE html><html lang="{lang}"><head><title>{sentence(3)}</title>'
+            f'<script>var analytics = {{"page": {i}}};</script></head>'
+            f'<body><nav>{links}</nav><main>{headings}{paragraphs}<ul>{items}</ul>{body}</main>'
+            f'<footer><p>Concordia University, 1455 De Maisonneuve Blvd. W., Montreal</p></footer></body></html>'
+            ).encode('utf-8')
+
+
+def text_documents(count: int, seed: int = 479) -> Iterator[Tuple[str, str]]:
+    """
+    Generate documents like the cleaned text `crawl.py` saves: lowercased, de-duplicated words.
+
+    :param count: The number of documents
+    :param seed: The seed of the generator
+    :return: A generator of each document's file name and text
+    """
+
+    for i in range(count):
+        rng = random.Random(f"{seed}-text-{i}")
+        words = _vocabulary(rng, filler=False)
+        text = ' '.join({rng.choice(words) for _ in range(rng.randint(20, 200))})
+
+        yield f"doc{i}.txt", f" {text} "
+
+
+def page_url(i: int) -> str:
+    """
+    :param i: The number of a page
+    :return: Its URL
+    """
+
+    return 'https://www.concordia.ca/' if i == 0 else f'https://www.concordia.ca/en/page-{i}.html'
+
+
+def page_file_name(url: str) -> str:
+    """
+    :param url: The URL of a generated page
+    :return: The file it is written to by `main`
+    """
+
+    return url.split('//')[-1].replace('/', '-') + ('.html' if url.endswith('/') else '')
+
+
+def _vocabulary(rng: random.Random, filler: bool = True) -> list:
+    """
+    :param rng: The page's random generator
+    :param filler: Whether to include the filler the cleaning strips
+    :return: The words a page may use: mostly one topic's, plus common words, filler and some sentiment words
+    """
+
+    topic = rng.choice(list(TOPICS))
+    return TOPICS[topic] * 4 + COMMON * 2 + (FILLER * 2 if filler else []) + SENTIMENT
+
+
+def _link(rng: random.Random, count: int) -> str:
+    """
+    :param rng: The page's random generator
+    :param count: The number of pages
+    :return: A link like those found on the site: mostly to other pages, some the spider should filter out
+    """
+
+    roll = rng.random()
+    if roll < 0.75:
+        return f"/en/page-{rng.randrange(1, max(2, count))}.html"
+    if roll < 0.85:
+        return f"#section-{rng.randint(1, 5)}"
+    if roll < 0.9:
+        return f"/fr/page-{rng.randrange(1, max(2, count))}.html"
+    if roll < 0.95:
+        return f"/en/search.html?q={rng.choice(COMMON)}"
+
+    return f"https://www.example.com/{rng.choice(COMMON)}"
+
+
+if __name__ == '__main__':
+    main()
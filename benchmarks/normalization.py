@@ -0,0 +1,69 @@
+"""
+Per-page benchmark of the text normalizers in `P4.normalization`.
+
+Time every normalizer on generated pages:
+
+    $ python -m benchmarks.normalization --synthetic 1000
+
+Or on a folder of saved pages:
+
+    $ python -m benchmarks.normalization "saved_pages/*.html"
+
+That they all clean text exactly like the original `nltk` one is tested in `tests/test_normalization.py`.
+"""
+
+import glob
+import time
+from argparse import ArgumentParser
+
+from benchmarks.generate import html_pages
+from P4.extraction import get_backend
+from P4.normalization import NORMALIZERS
+
+parser = ArgumentParser(description="Text Normalizer Benchmark")
+parser.add_argument('pages', nargs='?', help="A glob pattern matching the saved HTML pages to clean", default=None)
+parser.add_argument('--synthetic', type=int,
+                    help="Clean this many generated pages instead of saved ones", default=500, required=False)
+parser.add_argument('--repeat', '-r', type=int, help="How many times to clean each page", default=3, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.pages is not None:
+        files = sorted(glob.glob(args.pages))
+        if not files:
+            print(f"\nNo pages match {args.pages}\n")
+            return
+
+        bodies = []
+        for file in files:
+            with open(file, 'rb') as f:
+                bodies.append(f.read())
+    else:
+        bodies = [body for _, body in html_pages(args.synthetic)]
+
+    # Clean the same fragments the spider would, page by page
+    extract = get_backend('lxml')
+    pages = []
+    for body in bodies:
+        content = extract(body)
+        pages.append(content.paragraphs + content.headings + content.div_bodies + content.list_items)
+
+    print(f"\n--- Per-Page Speed ({len(pages)} pages, {args.repeat} repeats) ---\n")
+
+    times = {}
+    for name, normalizer in NORMALIZERS.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for page in pages:
+                for fragment in page:
+                    normalizer(fragment)
+        times[name] = (time.perf_counter() - start) / (len(pages) * args.repeat)
+
+    for name, seconds in times.items():
+        print(f"{name:>6}: {seconds * 1000:8.3f} ms/page  ({times['nltk'] / seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Cold-start benchmark of the entry points: how long each script takes to start in a fresh interpreter, before it does
+any work.
+
+Each script is run with `--help`, which exits as soon as its imports are done and its arguments are parsed:
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.startup cluster.py sentiment.py --repeat 20 --imports 10
+
+The scripts run in an empty working folder, deleted afterwards. The first run of each script also builds whatever it
+needs of the resource bundle (see `P4/resources.py`), so it is reported on its own. The slowest of the modules the
+script imports itself are listed from `python -X importtime`.
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List, Tuple
+
+# The root of the repository, where the entry points and AFINN-111.txt are
+ROOT = Path(__file__).resolve().parent.parent
+
+SCRIPTS = ['crawl.py', 'cluster.py', 'sentiment.py', 'similar.py', 'pipeline.py']
+
+parser = ArgumentParser(description="Startup Benchmark")
+parser.add_argument('scripts', nargs='*', help="The entry points to start", default=SCRIPTS)
+parser.add_argument('--repeat', '-r', type=int, help="How many times to start each script", default=10,
+                    required=False)
+parser.add_argument('--imports', type=int, help="How many of the slowest imports of each script to list", default=5,
+                    required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='startup-'))
+    shutil.copy(ROOT / 'AFINN-111.txt', workdir)
+
+    print(f"\n--- Startup Time ({args.repeat} runs each) ---\n")
+
+    try:
+        timings = {script: time_startup(script, args.repeat, workdir) for script in args.scripts}
+
+        for script, timing in timings.items():
+            print(f"{script:>14}: median {statistics.median(timing['runs']) * 1000:7.1f} ms, "
+                  f"min {min(timing['runs']) * 1000:7.1f} ms, first run {timing['first'] * 1000:7.1f} ms")
+
+        if args.imports:
+            print(f"\n--- Slowest Imports ---")
+
+            for script in args.scripts:
+                print(f"\n{script}:")
+                for module, seconds in slowest_imports(script, args.imports, workdir):
+                    print(f"{module:>40}: {seconds * 1000:7.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _start(script: str, workdir: Path, *options: str) -> subprocess.CompletedProcess:
+    """
+    Start a script with `--help` in a fresh interpreter, like it's started from the root of the repository.
+
+    :param script: The script, relative to the root of the repository
+    :param workdir: The working folder
+    :param options: Options for the interpreter
+    :return: The finished process
+    """
+
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(ROOT), os.environ.get('PYTHONPATH', '')]),
+           'SCRAPY_SETTINGS_MODULE': 'P4.settings'}
+
+    process = subprocess.run([sys.executable, *options, str(ROOT / script), '--help'], cwd=workdir, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{script} failed to start:\n{process.stderr}")
+
+    return process
+
+
+def time_startup(script: str, repeat: int, workdir: Path) -> dict:
+    """
+    :param script: The script, relative to the root of the repository
+    :param repeat: How many times to start it, after the first run
+    :param workdir: The working folder
+    :return: The seconds the first run took, and the seconds of each later run
+    """
+
+    runs = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        _start(script, workdir)
+        runs.append(time.perf_counter() - start)
+
+    return {'first': runs[0], 'runs': runs[1:]}
+
+
+def slowest_imports(script: str, n: int, workdir: Path) -> List[Tuple[str, float]]:
+    """
+    :param script: The script, relative to the root of the repository
+    :param n: The number of imports to list
+    :param workdir: The working folder
+    :return: The modules the script imports itself (not those imported by other modules, nor by Python's startup),
+             and the seconds each one took, including its own imports, slowest first
+    """
+
+    stderr = _start(script, workdir, '-X', 'importtime').stderr
+
+    # Each line is "import time: <self us> | <cumulative us> | <name>", the name indented by how deeply it's nested
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+        imports.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1e6))
+
+    # Python's own startup imports come before the script's, so only the top-level imports after `site` are kept
+    names = [name for _, name, _ in imports]
+    start = names.index('site') + 1 if 'site' in names else 0
+    top = [(name, seconds) for depth, name, seconds in imports[start:] if depth == 1]
+
+    return sorted(top, key=lambda pair: pair[1], reverse=True)[:n]
+
+
+if __name__ == '__main__':
+    main()
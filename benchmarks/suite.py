@@ -0,0 +1,454 @@
+"""
+Benchmark suite covering every stage, on a synthetic corpus (see `benchmarks/generate.py`).
+
+Run every benchmark, saving the results:
+
+    $ python -m benchmarks.suite run --size 10000 --out results.json
+
+Micro-benchmarks time the hot functions (the text normalizers, `_fill_page_text`, the extraction backends,
+`MainSpider.parse`, the clustering pipeline and the sentiment scoring) on `--sample` documents. Macro-benchmarks run each entry point
+(`crawl.py`, replaying `--size` generated pages, then `cluster.py` and `sentiment.py` on `--size` generated documents)
+as its own process. Startup benchmarks time how long each entry point takes to start and parse `--help` (see
+`benchmarks/startup.py`). Each result records the time taken and the peak memory: the memory allocated by Python during
+a run for micro-benchmarks, and the peak RSS of the process for macro-benchmarks.
+
+Save the results of a known-good version as a baseline, then compare later results against it:
+
+    $ python -m benchmarks.suite compare baseline.json results.json
+
+The exit status is non-zero when a benchmark got slower (or used more memory) than the thresholds allow, so this can
+run in CI.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.generate import html_pages, page_url, text_documents
+from benchmarks.startup import SCRIPTS, time_startup
+
+# The root of the repository, where the entry points and AFINN-111.txt are
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs an entry point, then writes its peak RSS (in KB) to the file named by BENCHMARK_PEAK_FILE. The peak has to be
+# read by the entry point's own process: the one the kernel reports for a child starts from the RSS of its parent
+_PEAK_WRAPPER = '''
+import os, runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    peak = ''
+    if os.path.exists('/proc/self/status'):
+        peak = next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM:'))
+    elif sys.platform != 'win32':
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+    with open(os.environ['BENCHMARK_PEAK_FILE'], 'wt') as f:
+        f.write(str(peak))
+'''
+
+parser = ArgumentParser(description="Benchmark Suite")
+commands = parser.add_subparsers(dest='command', required=True)
+
+run_parser = commands.add_parser('run', help="Run the benchmarks")
+run_parser.add_argument('--size', type=int,
+                        help="The number of documents for the macro-benchmarks", default=1000, required=False)
+run_parser.add_argument('--sample', type=int,
+                        help="The number of documents for the micro-benchmarks", default=500, required=False)
+run_parser.add_argument('--repeat', '-r', type=int,
+                        help="How many times to run each micro-benchmark", default=5, required=False)
+run_parser.add_argument('--only', nargs='+',
+                        help="Only run the benchmarks whose name starts with one of these, e.g. micro/clean macro",
+                        required=False)
+run_parser.add_argument('--out', '-o',
+                        help="Save the results to this JSON file", default='benchmark-results.json', required=False)
+run_parser.add_argument('--workdir',
+                        help="Generate the corpora and run the entry points in this folder, instead of a temporary "
+                             "one that is deleted afterwards", required=False)
+
+compare_parser = commands.add_parser('compare', help="Compare results against a baseline")
+compare_parser.add_argument('baseline', help="The results of the baseline, saved by `run`")
+compare_parser.add_argument('results', help="The results to check, saved by `run`")
+compare_parser.add_argument('--threshold', type=float,
+                            help="Flag benchmarks more than this share slower than the baseline", default=0.10,
+                            required=False)
+compare_parser.add_argument('--memory-threshold', type=float,
+                            help="Flag benchmarks using more than this share more peak memory than the baseline",
+                            default=0.20, required=False)
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        _run(args)
+    elif not compare(args.baseline, args.results, args.threshold, args.memory_threshold):
+        sys.exit(1)
+
+
+def _run(args) -> None:
+    """
+    Run the selected benchmarks in a working folder, and save their results.
+
+    :param args: The parsed command-line arguments of `run`
+    """
+
+    out = Path(args.out).resolve()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='benchmarks-')).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    # The entry points read and write relative to the working directory, like they do in the repository
+    shutil.copy(ROOT / 'AFINN-111.txt', workdir)
+    os.chdir(workdir)
+
+    benchmarks = {**{f"micro/{name}": (function, args.sample, args.repeat) for name, function in MICRO.items()},
+                  **{f"macro/{name}": (function, args.size, 1) for name, function in MACRO.items()},
+                  **{f"startup/{name}": (function, 1, args.repeat) for name, function in STARTUP.items()}}
+    if args.only:
+        benchmarks = {name: b for name, b in benchmarks.items() if any(name.startswith(p) for p in args.only)}
+
+    results = {'meta': _meta(args), 'benchmarks': {}}
+
+    print(f"\n--- Benchmarks ({args.sample} documents per micro-benchmark, {args.size} per macro-benchmark) ---\n")
+
+    try:
+        for name, (function, size, repeat) in benchmarks.items():
+            result = function(size, repeat)
+            results['benchmarks'][name] = result
+
+            peak = f"{result['peak_mb']:9.1f} MB" if result['peak_mb'] is not None else f"{'n/a':>12}"
+            print(f"{name:>26}: {result['seconds']:9.3f}s  {result['items'] / result['seconds']:12.1f} items/s  {peak}")
+    finally:
+        if args.workdir is None:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(out, 'wt') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nSaved the results to {out}")
+
+
+def compare(baseline_path: str, results_path: str, threshold: float, memory_threshold: float) -> bool:
+    """
+    Compare benchmark results against a baseline, printing the change of each benchmark.
+
+    :param baseline_path: The JSON file of the baseline's results
+    :param results_path: The JSON file of the results to check
+    :param threshold: The largest share a benchmark may get slower by
+    :param memory_threshold: The largest share a benchmark's peak memory may grow by
+    :return: Whether no benchmark regressed
+    """
+
+    with open(baseline_path, 'rt') as f:
+        baseline = json.load(f)
+    with open(results_path, 'rt') as f:
+        results = json.load(f)
+
+    for key in ('size', 'sample'):
+        if baseline['meta'][key] != results['meta'][key]:
+            print(f"\nWarning: the baseline was run with {key}={baseline['meta'][key]}, "
+                  f"these results with {key}={results['meta'][key]}")
+
+    print(f"\n--- Comparison With {baseline_path} ---\n")
+
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print(f"{name:>26}: new")
+            continue
+
+        reference = baseline['benchmarks'][name]
+        time_change = result['seconds'] / reference['seconds'] - 1
+
+        memory_change = None
+        if result['peak_mb'] is not None and reference['peak_mb']:
+            memory_change = result['peak_mb'] / reference['peak_mb'] - 1
+
+        flags = []
+        if time_change > threshold:
+            flags.append('SLOWER')
+        if memory_change is not None and memory_change > memory_threshold:
+            flags.append('MORE MEMORY')
+        if flags:
+            regressions.append(name)
+
+        memory = f"{memory_change:+7.1%}" if memory_change is not None else f"{'n/a':>7}"
+        print(f"{name:>26}: time {time_change:+7.1%}, memory {memory}  {' '.join(flags)}")
+
+    print(f"\n{len(regressions)} regressions" + (f": {', '.join(regressions)}" if regressions else ""))
+
+    return not regressions
+
+
+def _meta(args) -> dict:
+    """
+    :param args: The parsed command-line arguments of `run`
+    :return: What the results were measured on
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'size': args.size,
+        'sample': args.sample,
+    }
+
+
+def _measure(function, items: int, repeat: int) -> dict:
+    """
+    Time a function over several runs, then measure its peak memory in one more run.
+
+    Memory is traced with `tracemalloc`, which slows the code down, so it isn't traced during the timed runs.
+
+    :param function: The function to benchmark, taking no arguments
+    :param items: The number of items (documents, pages, etc.) each run processes
+    :param repeat: The number of timed runs
+    :return: The median and minimum seconds of a run, the number of items, and the peak memory in MB
+    """
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': statistics.median(runs), 'min_seconds': min(runs), 'runs': runs, 'items': items,
+            'peak_mb': peak / 2 ** 20}
+
+
+def _run_entry_point(command: list, items: int) -> dict:
+    """
+    Run an entry point as its own process, timing it and measuring its peak memory. The memory of the processes it
+    starts itself (e.g. the cleaning workers of a crawl) isn't counted.
+
+    :param command: The script and its arguments
+    :param items: The number of items (documents, pages, etc.) it processes
+    :return: The seconds it took, the number of items, and its peak memory in MB (None where it can't be measured)
+    """
+
+    peak_file = Path('peak.txt')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(ROOT), os.environ.get('PYTHONPATH', '')]),
+           'SCRAPY_SETTINGS_MODULE': 'P4.settings', 'BENCHMARK_PEAK_FILE': str(peak_file.resolve())}
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', _PEAK_WRAPPER, str(ROOT / command[0]), *command[1:]], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed with exit status {process.returncode}")
+
+    peak = peak_file.read_text().strip()
+    peak_file.unlink()
+
+    return {'seconds': elapsed, 'min_seconds': elapsed, 'runs': [elapsed], 'items': items,
+            'peak_mb': int(peak) / 2 ** 10 if peak else None}
+
+
+def _pages(n: int) -> list:
+    return [body for _, body in html_pages(n)]
+
+
+def _texts(n: int) -> list:
+    return [text for _, text in text_documents(n)]
+
+
+def _micro_clean(normalizer: str):
+    def benchmark(n: int, repeat: int) -> dict:
+        from P4.extraction import get_backend
+        from P4.normalization import get_normalizer
+
+        clean = get_normalizer(normalizer)
+        contents = [get_backend('lxml')(body) for body in _pages(n)]
+        fragments = [f for c in contents for f in c.paragraphs + c.headings + c.div_bodies + c.list_items]
+
+        return _measure(lambda: [clean(f) for f in fragments], len(fragments), repeat)
+
+    return benchmark
+
+
+def _micro_fill_page_text(n: int, repeat: int) -> dict:
+    from P4.extraction import get_backend
+    from P4.spiders.MainSpider import _fill_page_text
+
+    contents = [get_backend('lxml')(body) for body in _pages(n)]
+    pages = [[c.paragraphs, c.headings, c.div_bodies, c.list_items] for c in contents]
+
+    return _measure(lambda: [_fill_page_text(*page) for page in pages], len(pages), repeat)
+
+
+def _micro_extract(backend: str):
+    def benchmark(n: int, repeat: int) -> dict:
+        from P4.extraction import get_backend
+
+        extract = get_backend(backend)
+        bodies = _pages(n)
+
+        return _measure(lambda: [extract(body) for body in bodies], len(bodies), repeat)
+
+    return benchmark
+
+
+def _micro_parse(n: int, repeat: int) -> dict:
+    import warnings
+
+    from scrapy.exceptions import ScrapyDeprecationWarning
+    from scrapy.http import HtmlResponse
+    from scrapy.utils.test import get_crawler
+
+    from P4.spiders.MainSpider import MainSpider
+
+    # The spider logs through Spider.log, which Scrapy warns about on every call
+    warnings.filterwarnings('ignore', category=ScrapyDeprecationWarning)
+
+    crawler = get_crawler(MainSpider, {'CORPUS_STORE': 'none'})
+    responses = [HtmlResponse(url, body=body, encoding='utf-8') for url, body in html_pages(n)]
+
+    def parse():
+        spider = MainSpider.from_crawler(crawler, max_files=len(responses) + 1)
+        for response in responses:
+            for _ in spider.parse(response):
+                pass
+
+    return _measure(parse, len(responses), repeat)
+
+
+def _micro_cluster_pipeline(n: int, repeat: int) -> dict:
+    import numpy as np
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+
+    from cluster import clustering_stopwords
+    from P4.low_memory import top_terms
+
+    texts = _texts(n)
+    stopwords = clustering_stopwords()
+
+    def pipeline():
+        # The same steps and parameters as cluster.py
+        vectorizer = TfidfVectorizer(max_df=0.5, min_df=0.1, stop_words=stopwords, strip_accents='unicode')
+        X_tfidf = vectorizer.fit_transform(texts)
+
+        n_features = X_tfidf.shape[1]
+        lsa = make_pipeline(TruncatedSVD(n_components=n_features if n_features < 100 else 100, random_state=0),
+                            Normalizer(copy=False))
+        X_lsa = lsa.fit_transform(X_tfidf)
+
+        for k in (3, 6):
+            kmeans = KMeans(max_iter=100, n_clusters=k, random_state=k, n_init=1).fit(X_lsa)
+            np.unique(kmeans.labels_, return_counts=True)
+            top_terms(lsa[0], kmeans.cluster_centers_)
+
+    return _measure(pipeline, len(texts), repeat)
+
+
+def _micro_sentiment(n: int, repeat: int) -> dict:
+    import random
+
+    from benchmarks.generate import SENTIMENT, TOPICS
+    from sentiment import _score_cluster_manual
+
+    # Clusters of 20 top terms, as cluster.py saves them
+    rng = random.Random(479)
+    words = [w for topic in TOPICS.values() for w in topic] + SENTIMENT
+    clusters = [rng.sample(words, 20) for _ in range(n)]
+
+    return _measure(lambda: [_score_cluster_manual(cluster) for cluster in clusters], len(clusters), repeat)
+
+
+def _startup(script: str):
+    def benchmark(n: int, repeat: int) -> dict:
+        runs = time_startup(script, repeat, Path.cwd())['runs']
+        return {'seconds': statistics.median(runs), 'min_seconds': min(runs), 'runs': runs, 'items': n,
+                'peak_mb': None}
+
+    return benchmark
+
+
+def _macro_crawl(n: int, repeat: int) -> dict:
+    from P4.archive import ArchiveWriter
+
+    # Record the generated pages as a crawl archive, then replay it, so the crawl runs offline
+    archive = Path('benchmark.warc.gz')
+    if not archive.exists():
+        writer = ArchiveWriter(str(archive))
+        writer.write(page_url(0) + 'robots.txt', 200, [(b'Content-Type', b'text/plain')], b'User-agent: *\n')
+        for url, body in html_pages(n):
+            writer.write(url, 200, [(b'Content-Type', b'text/html; charset=utf-8')], body)
+        writer.close()
+
+    return _run_entry_point(['crawl.py', '-n', str(n), '--replay', str(archive)], n)
+
+
+def _macro_cluster(n: int, repeat: int) -> dict:
+    folder = Path('text_files')
+    shutil.rmtree(folder, ignore_errors=True)
+    folder.mkdir()
+    for name, text in text_documents(n):
+        (folder / name).write_text(text, encoding='utf-8')
+
+    return _run_entry_point(['cluster.py'], n)
+
+
+def _macro_sentiment(n: int, repeat: int) -> dict:
+    # Scores the clusters saved by the cluster.py macro-benchmark, or by an earlier run in the working folder
+    if not Path('clusters/k6').exists():
+        _macro_cluster(n, repeat)
+
+    return _run_entry_point(['sentiment.py'], 6)
+
+
+# Each benchmark takes the number of documents and of timed runs, and returns its result
+MICRO = {
+    'clean': _micro_clean('fast'),
+    'clean_nltk': _micro_clean('nltk'),
+    'fill_page_text': _micro_fill_page_text,
+    'extract_lxml': _micro_extract('lxml'),
+    'extract_bs4': _micro_extract('bs4'),
+    'parse': _micro_parse,
+    'cluster_pipeline': _micro_cluster_pipeline,
+    'sentiment': _micro_sentiment,
+}
+
+MACRO = {
+    'crawl': _macro_crawl,
+    'cluster': _macro_cluster,
+    'sentiment': _macro_sentiment,
+}
+
+STARTUP = {Path(script).stem: _startup(script) for script in SCRIPTS}
+
+
+if __name__ == '__main__':
+    main()
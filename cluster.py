@@ -1,30 +1,82 @@
 import glob
+import json
 import sys
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.decomposition import TruncatedSVD
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import Normalizer
-from nltk.corpus import stopwords
+
+from P4.resources import get_stopwords
+
+if TYPE_CHECKING:
+    from P4.cluster_artifact import ClusterArtifact
+    from P4.low_memory import MemoryReport
 
 # Create an argument parser to let user decide how many downloaded files to process
 parser = ArgumentParser(description="Concordia Clusterer")
 parser.add_argument('--num-files', '-n', type=int,
                     help="The number of files to process", required=False)
+parser.add_argument('--corpus', '-c',
+                    help="Read the documents from this segment corpus instead of text_files/", required=False)
+parser.add_argument('--max-df', type=float,
+                    help="Ignore terms found in more than this share of the documents", default=0.5, required=False)
+parser.add_argument('--min-df', type=float,
+                    help="Ignore terms found in fewer than this share of the documents", default=0.1, required=False)
+parser.add_argument('--cache', action='store_true',
+                    help="Cache the term counts of each document in term_cache/, and only tokenize new or changed ones")
+parser.add_argument('--assign', '-a', action='store_true',
+                    help="Assign new and changed documents to the clusters of the saved model, instead of refitting")
+parser.add_argument('--save-model', action='store_true',
+                    help="Save the fitted model as a new version in models/, to assign new documents to it later with "
+                         "--assign, or find similar pages with similar.py. Skipped if the latest version was fitted "
+                         "on the same documents with the same parameters")
+parser.add_argument('--keep-models', type=int,
+                    help="Once a model is saved, only keep this many of the latest versions in models/. 0 keeps every "
+                         "version", default=5, required=False)
+parser.add_argument('--max-drift', type=float,
+                    help="With --assign, refit when more than this share of the new documents fit no cluster",
+                    default=0.2, required=False)
+parser.add_argument('--sweep', type=int, nargs=2, metavar=('MIN_K', 'MAX_K'),
+                    help="Try every k from MIN_K to MAX_K in parallel, and save the clusters of the best one",
+                    required=False)
+parser.add_argument('--seeds', type=int,
+                    help="With --sweep, the number of seeds to try for each k", default=3, required=False)
+parser.add_argument('--workers', '-w', type=int,
+                    help="With --sweep, the number of worker processes. Defaults to the number of CPUs", required=False)
+parser.add_argument('--save-k', type=int, nargs='+',
+                    help="With --sweep, save the clusters of these k instead of the best one", required=False)
+parser.add_argument('--silhouette-sample', type=int,
+                    help="With --sweep, the number of documents to compute the silhouette on", default=5000,
+                    required=False)
+parser.add_argument('--k', type=int, nargs='+',
+                    help="The numbers of clusters to fit", default=[3, 6], required=False)
+parser.add_argument('--low-memory', action='store_true',
+                    help="Cluster a large corpus within --memory-budget: float32 throughout, the vocabulary pruned "
+                         "before the matrix is built, and the peak memory of each stage reported")
+parser.add_argument('--memory-budget', type=float,
+                    help="With --low-memory, the memory available for clustering, in GB", default=16.0, required=False)
+parser.add_argument('--stream', action='store_true',
+                    help="Cluster out-of-core, reading the documents in chunks, for corpora that don't fit in memory")
+parser.add_argument('--chunk-size', type=int,
+                    help="With --stream, the number of documents to hold in memory at once", default=10_000,
+                    required=False)
+parser.add_argument('--epochs', type=int,
+                    help="With --stream, the number of passes Mini-Batch K-Means makes over the documents", default=3,
+                    required=False)
+
+def clustering_stopwords() -> list:
+    """
+    Get the stopwords removed before clustering, from the resource bundle. They are only loaded on first use, so that
+    importing this module doesn't build the bundle.
 
-# Create a custom stopwords list composed of all English and French stopwords, plus a list of other
-# stopwords found in experiment
-stopwords = (
-        stopwords.words('english') +
-        stopwords.words('french') +
-        ['etaient', 'etais', 'etait', 'etant', 'etante', 'etantes',
-         'etants', 'ete', 'etee', 'etees', 'etes', 'etiez', 'etions',
-         'eumes', 'eutes', 'fumes', 'futes', 'meme', 'co', 'ca', 'cu', 'el']
-)
+    :return: A custom stopwords list composed of all English and French stopwords, plus a list of other stopwords
+             found in experiment (see P4/resources.py)
+    """
+
+    return list(get_stopwords('clustering'))
 
 
 def main():
@@ -38,28 +90,79 @@ def main():
     # Parse the command-line arguments passed to this script, if any
     args = parser.parse_args()
 
+    # Scikit-learn takes over a second to import, so it's only imported by the functions that use it, once the
+    # arguments are parsed
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics import pairwise_distances_argmin_min
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+
+    from P4.cluster_artifact import ClusterArtifact
+    from P4.low_memory import MemoryReport, current_rss, svd_parameters
+    from P4.term_cache import TermCountCache, tfidf_from_counts
+
+    if args.stream:
+        _stream_clusters(args.num_files, args.corpus, args.chunk_size, args.epochs, args.max_df, args.min_df,
+                         args.k)
+        return
+
+    # Only refit when the saved model no longer fits the documents
+    if args.assign and not _assign(args.num_files, args.corpus, args.max_drift, args.keep_models):
+        return
+
+    if args.low_memory and args.cache:
+        print("\n--low-memory prunes the vocabulary before counting terms, so it can't be used with --cache\n")
+        return
+
+    # The silhouette of a fit needs at least 2 clusters
+    if args.sweep is not None and not 2 <= args.sweep[0] <= args.sweep[1]:
+        print(f"\nSWEEP ERROR: the range of k must satisfy 2 <= MIN_K <= MAX_K, "
+              f"got {args.sweep[0]}..{args.sweep[1]} \n")
+        return
+
+    memory = MemoryReport(enabled=args.low_memory)
+    budget = args.memory_budget * 2 ** 30
+    stopwords = clustering_stopwords()
+
     print("\n--- Vectorization ---")
 
+    # Get the documents to process, and how the vectorizer should read them
+    documents, input_type = _get_documents(args.num_files, args.corpus)
+
     # Create a TF-IDF vectorizer
     try:
-        vectorizer = TfidfVectorizer(max_df=0.5, min_df=0.1, stop_words=stopwords, strip_accents='unicode',
-                                     input='filename', encoding="utf-8")
+        vectorizer = TfidfVectorizer(max_df=args.max_df, min_df=args.min_df, stop_words=stopwords,
+                                     strip_accents='unicode', input=input_type, encoding="utf-8")
     except ValueError as e:
         tb = sys.exc_info()[2]
         print(f"\nVECTORIZATION ERROR: {e.with_traceback(tb)} \n")
         return
 
-    # Get the number of files to process
-    ALL_FILES = glob.glob('text_files/*')
-    if args.num_files is None or args.num_files > len(ALL_FILES):
-        print(
-            f"\nYou entered {args.num_files} files, but {len(ALL_FILES)} are present. Will process all of them\n")
-        num_files = len(ALL_FILES)
+    # Vectorize the documents, either from scratch, or from their cached term counts
+    if args.cache:
+        cache = TermCountCache('term_cache/', stopwords, strip_accents='unicode')
+        if input_type == 'filename':
+            documents = (Path(file).read_text(encoding='utf-8') for file in documents)
+
+        try:
+            X_tfidf, vectorizer = tfidf_from_counts(cache.count_matrix(documents), cache.vocabulary, args.max_df,
+                                                    args.min_df, stopwords, strip_accents='unicode')
+        except ValueError as e:
+            print(f"\nVECTORIZATION ERROR: {e} \n")
+            return
+
+        print(f"\nTerm counts: {cache.hits} documents from the cache, {cache.misses} tokenized")
+    elif args.low_memory:
+        try:
+            X_tfidf, vectorizer = _low_memory_tfidf(_document_stream(args.num_files, args.corpus, documents),
+                                                    args.max_df, args.min_df, budget, memory)
+        except (ValueError, MemoryError) as e:
+            print(f"\nVECTORIZATION ERROR: {e} \n")
+            return
     else:
-        num_files = args.num_files
-
-    # Vectorize the text files
-    X_tfidf = vectorizer.fit_transform(ALL_FILES[:num_files])
+        X_tfidf = vectorizer.fit_transform(documents)
 
     n_samples = X_tfidf.shape[0]
     n_features = X_tfidf.shape[1]
@@ -69,17 +172,25 @@ def main():
 
     print("\n--- LSA Dimensionality Reduction ---")
 
+    n_components = n_features if n_features < 100 else 100
+    if args.low_memory:
+        # Leave the SVD whatever the budget has left once the TF-IDF matrix is built
+        parameters = svd_parameters(n_samples, n_features, n_components, budget - (current_rss() or 0))
+        print(f"\nSVD: {parameters}")
+    else:
+        parameters = {'n_components': n_components}
+
     # Perform LSA dimensionality reduction
     try:
-        lsa = make_pipeline(TruncatedSVD(n_components=n_features if n_features < 100 else 100),
-                            Normalizer(copy=False))
+        lsa = make_pipeline(TruncatedSVD(**parameters), Normalizer(copy=False))
     except ValueError as e:
         tb = sys.exc_info()[2]
         print(f"\nLSA PIPELINE ERROR: {e.with_traceback(tb)} \n")
         return
 
     try:
-        X_lsa = lsa.fit_transform(X_tfidf)
+        with memory.stage('LSA'):
+            X_lsa = lsa.fit_transform(X_tfidf)
     except ValueError as e:
         tb = sys.exc_info()[2]
         print(f"\nLSA FIT TRANSFORM ERROR:  {e.with_traceback(tb)} \n")
@@ -89,41 +200,605 @@ def main():
 
     print(f"\nExplained variance of the SVD step: {explained_variance * 100:.1f}%")
 
-    print("\n--- K-Means (k=3) ---")
+    terms = vectorizer.get_feature_names_out()
 
-    # Perform K-Means where k=3
-    kmeans_3 = KMeans(max_iter=100, n_clusters=3, random_state=3, n_init=1).fit(X_lsa)
+    # Keep the cluster of each document, and its distance to the centroid, along with the top terms
+    artifact = ClusterArtifact(_document_names(args.num_files, args.corpus))
 
-    cluster_ids, cluster_sizes = np.unique(kmeans_3.labels_, return_counts=True)
+    if args.sweep is not None:
+        # ...and fewer clusters than documents
+        if args.sweep[1] >= n_samples:
+            print(f"\nSWEEP ERROR: MAX_K must be less than the number of documents ({n_samples}), "
+                  f"got {args.sweep[1]} \n")
+            return
 
-    print(f"\nNumber of elements assigned to each cluster (KMEANS 3): {cluster_sizes}")
+        _sweep(X_lsa, lsa[0], terms, range(args.sweep[0], args.sweep[1] + 1), args.seeds, args.workers,
+               args.save_k, args.silhouette_sample, artifact)
+        return
 
-    # Compute top terms per cluster, when k=3
-    print("\nTop terms per cluster, when k=3:\n")
-    original_space_centroids = lsa[0].inverse_transform(kmeans_3.cluster_centers_)
-    order_centroids = original_space_centroids.argsort()[:, ::-1]
-    terms = vectorizer.get_feature_names_out()
+    # Perform K-Means where k=3, then where k=6 (or for the k values given with --k)
+    models = {}
+    for k in args.k:
+        print(f"\n--- K-Means (k={k}) ---")
+
+        with memory.stage(f'K-Means (k={k})'):
+            kmeans = KMeans(max_iter=100, n_clusters=k, random_state=k, n_init=1).fit(X_lsa)
+
+        cluster_ids, cluster_sizes = np.unique(kmeans.labels_, return_counts=True)
+
+        print(f"\nNumber of elements assigned to each cluster (KMEANS {k}): {cluster_sizes}")
+
+        artifact.add(k, *pairwise_distances_argmin_min(X_lsa, kmeans.cluster_centers_),
+                     *_save_top_terms(lsa[0], kmeans.cluster_centers_, terms, k))
+
+        models[k] = kmeans
+
+    _save_artifact(artifact)
+
+    # Only save the model when asked, or when refitting the one --assign found no longer fits the documents
+    if args.save_model or args.assign:
+        parameters = {'k': args.k, 'max_df': args.max_df, 'min_df': args.min_df, 'low_memory': args.low_memory}
+        _save_model(vectorizer, lsa, models, X_lsa, args.num_files, args.corpus, parameters, args.keep_models)
+
+
+def _low_memory_tfidf(stream, max_df: float, min_df: float, budget: float, memory: 'MemoryReport'):
+    """
+    Build the TF-IDF matrix of a large corpus in float32, pruning the vocabulary before the matrix is built.
+
+    `TfidfVectorizer.fit_transform` counts every term of every document before dropping those outside `max_df` and
+    `min_df`, so its peak memory grows with the whole vocabulary. Instead, the documents are read twice: once to count
+    document frequencies one document at a time, then once more to count only the kept terms. The document frequencies
+    also give the exact size of the matrix ahead of time, so a corpus that won't fit in the budget is caught before
+    any of it is built.
+
+    :param stream: A function returning a new generator of the documents' text each time it is called
+    :param max_df: Ignore terms found in more than this share of the documents
+    :param min_df: Ignore terms found in fewer than this share of the documents
+    :param budget: The memory available, in bytes
+    :param memory: The report of the peak memory of each stage
+    :return: The TF-IDF matrix, and the fitted vectorizer
+    """
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from P4.low_memory import document_frequencies, prune_vocabulary
+
+    stopwords = clustering_stopwords()
+    analyzer = TfidfVectorizer(stop_words=stopwords, strip_accents='unicode').build_analyzer()
+
+    with memory.stage('document frequencies'):
+        df, n_documents = document_frequencies(stream(), analyzer)
+        terms = prune_vocabulary(df, n_documents, max_df, min_df)
+
+    # A float32 CSR matrix takes 4 bytes per value and 4 per column index, plus 8 per row
+    matrix_bytes = 8 * sum(df[term] for term in terms) + 8 * (n_documents + 1)
+    del df
+
+    print(f"\nPruned vocabulary: {len(terms)} terms, TF-IDF matrix of {matrix_bytes / 2 ** 20:,.0f} MB")
+    if matrix_bytes > budget / 2:
+        raise MemoryError(f"The TF-IDF matrix would take more than half the {budget / 2 ** 30:.1f} GB budget. "
+                          f"Raise --memory-budget, or cluster with --stream")
+
+    vectorizer = TfidfVectorizer(stop_words=stopwords, strip_accents='unicode', vocabulary=terms, dtype=np.float32,
+                                 encoding='utf-8')
+    with memory.stage('TF-IDF matrix'):
+        X_tfidf = vectorizer.fit_transform(stream())
+
+    return X_tfidf, vectorizer
+
+
+def _save_model(vectorizer, lsa, models: dict, X_lsa, num_files, corpus, parameters: dict, keep: int) -> None:
+    """
+    Save the fitted vectorizer, LSA pipeline and K-Means models as a new version of the clustering model, along with
+    the cluster of each document, so that new documents can later be assigned with `--assign`, and an index of their
+    LSA vectors, so that similar documents can be looked up with `similar.py`.
+
+    Nothing is saved if the latest version was fitted on the same documents with the same parameters. Otherwise, only
+    the latest `keep` versions are kept once the new one is saved.
+
+    :param vectorizer: The fitted TF-IDF vectorizer
+    :param lsa: The fitted LSA pipeline
+    :param models: The fitted K-Means model of each k
+    :param X_lsa: The documents, in the LSA space
+    :param num_files: The number of documents processed. All of them if None
+    :param corpus: The folder of the segment corpus, or None if `text_files/` was used
+    :param parameters: The parameters of the fit
+    :param keep: The number of versions to keep. 0 keeps every version
+    """
+
+    from P4.ann import IVFIndex
+    from P4.cluster_model import ClusterModel, load_manifest
+
+    # The documents are read in the same order as they were vectorized, so each one lines up with its row of X_lsa
+    hashes = _content_hashes(num_files, corpus)
+
+    # A version made by --assign wasn't fitted on its documents, so a refit is always saved over it
+    fingerprint = _fingerprint(hashes, parameters)
+    latest = load_manifest()
+    if latest is not None and latest.get('fingerprint') == fingerprint and 'assigned_from' not in latest:
+        print(f"\nThe latest model, v{latest['version']}, was fitted on the same documents with the same parameters. "
+              f"It isn't saved again")
+        return
+
+    documents = {name: (content_hash, [int(models[k].labels_[i]) for k in sorted(models)])
+                 for i, (name, content_hash) in enumerate(hashes.items())}
+
+    # Keep the documents' LSA vectors, to look up similar documents later with similar.py
+    index = IVFIndex.build(list(documents), X_lsa)
+
+    model = ClusterModel(vectorizer, lsa, models, ClusterModel.fit_thresholds(models, X_lsa), documents,
+                         index=index)
+    folder = model.save(parameters=parameters, fingerprint=fingerprint)
+
+    print(f"\nSaved the model to {folder}")
+
+    _prune_models(keep)
+
+
+def _fingerprint(hashes: dict, parameters: dict) -> str:
+    """
+    :param hashes: The content hash of each document, in the order they are vectorized
+    :param parameters: The parameters of the fit
+    :return: A digest of what a model is fitted on. Fits with the same digest give the same model
+    """
+
+    return sha1(json.dumps([parameters, list(hashes.items())]).encode('utf-8')).hexdigest()
+
+
+def _prune_models(keep: int) -> None:
+    """
+    Delete all but the latest `keep` versions of the model.
+
+    :param keep: The number of versions to keep. 0 keeps every version
+    """
+
+    from P4.cluster_model import prune_versions
+
+    deleted = prune_versions(keep=keep)
+    if deleted:
+        print(f"\nDeleted {len(deleted)} older model versions, keeping the latest {keep}")
+
+
+def _assign(num_files, corpus, max_drift: float, keep: int) -> bool:
+    """
+    Assign the new and changed documents to the clusters of the latest saved model, without refitting it, and save
+    the result as a new version. `clusters/` is then updated to match it.
+
+    If too many of them are far from every centroid, the clusters no longer fit the documents, and nothing is
+    assigned.
+
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :param max_drift: The largest share of the new documents allowed to be far from every centroid
+    :param keep: The number of versions to keep once the new one is saved. 0 keeps every version
+    :return: Whether the model needs a full refit
+    """
+
+    from P4.cluster_model import ClusterModel
+    from P4.corpus import CorpusReader
+
+    model = ClusterModel.load()
+    if model is None:
+        print("\nThere is no saved model to assign documents to. Fitting one\n")
+        return True
+
+    print(f"\n--- Assignment (model v{model.manifest['version']}) ---")
+
+    hashes = _content_hashes(num_files, corpus)
+    changed = [name for name, content_hash in hashes.items() if model.documents.get(name, (None,))[0] != content_hash]
+    removed = model.documents.keys() - hashes.keys()
+
+    print(f"\n{len(changed)} new or changed documents, {len(removed)} removed")
+
+    if not changed and not removed:
+        print("\nThe model is up to date")
+        return False
+
+    for name in removed:
+        del model.documents[name]
+
+    if changed:
+        if corpus is None:
+            X_lsa = model.transform(changed, 'filename')
+        else:
+            reader = CorpusReader(corpus)
+            X_lsa = model.transform([reader.get(url) for url in changed], 'content')
+
+        predictions = model.predict(X_lsa)
+        drift = model.drift(predictions)
+
+        print(f"\nDrift: {drift * 100:.1f}% of them are far from every centroid (limit: {max_drift * 100:.1f}%)")
+
+        if drift > max_drift:
+            print("\nThe clusters no longer fit the documents. Refitting\n")
+            return True
+
+        for i, name in enumerate(changed):
+            model.documents[name] = hashes[name], [int(predictions[k][0][i]) for k in model.ks]
+
+        if model.index is not None:
+            model.index.add(changed, X_lsa)
+
+    if model.index is not None:
+        model.index.remove(list(removed))
+
+    for k, cluster_sizes in model.cluster_sizes().items():
+        print(f"\nNumber of elements assigned to each cluster (KMEANS {k}): {cluster_sizes}")
+
+    # The version assigned to is left as it was saved
+    parent = model.manifest
+    folder = model.save(parameters=parent.get('parameters'), assigned_from=parent['version'])
+
+    print(f"\nSaved the model to {folder}")
+
+    _prune_models(keep)
+    _refresh_clusters(model)
+
+    return False
+
+
+def _refresh_clusters(model) -> None:
+    """
+    Save the clusters of a model's documents to `clusters/`, once documents have been assigned to it, so that
+    `clusters/clusters.npz` covers the same documents as the model. The top terms don't change, since the centroids
+    don't.
+
+    :param model: The model
+    """
+
+    from P4.cluster_artifact import ClusterArtifact
+
+    # The distances to the centroids are computed from the documents' LSA vectors, which only the index keeps
+    if model.index is None:
+        print("\nThe model has no index of the documents' LSA vectors, so clusters/ can't be updated. Refit it to "
+              "update them")
+        return
+
+    names = model.index.names
+    terms = model.vectorizer.get_feature_names_out()
+
+    artifact = ClusterArtifact(names)
+    for i, k in enumerate(model.ks):
+        kmeans = model.kmeans[k]
+        labels = np.array([model.documents[name][1][i] for name in names], dtype=int)
+        distances = kmeans.transform(model.index.vectors)[np.arange(len(names)), labels]
+
+        artifact.add(k, labels, distances, *_save_top_terms(model.lsa[0], kmeans.cluster_centers_, terms, k))
+
+    _save_artifact(artifact)
+
+
+def _content_hashes(num_files, corpus) -> dict:
+    """
+    Hash the content of each document, to tell which ones are new or changed since the model was fitted.
+
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :return: A map from each document's name (its file name, or its URL in a segment corpus) to its content hash,
+             in the order the documents are vectorized
+    """
+
+    if corpus is None:
+        return {file: sha1(Path(file).read_bytes()).hexdigest() for file in glob.glob('text_files/*')[:num_files]}
+
+    from P4.corpus import CorpusReader
+
+    reader = CorpusReader(corpus)
+    return {url: sha1(text.encode('utf-8')).hexdigest() for url, text in reader.iter_documents(limit=num_files)}
+
+
+def _save_top_terms(svd, cluster_centers, terms, k: int) -> tuple:
+    """
+    Map cluster centroids from the LSA space back to the terms, and save the top terms of each cluster.
+
+    :param svd: The SVD step of the LSA reduction
+    :param cluster_centers: The centroids, in the LSA space
+    :param terms: The terms of the vectorizer
+    :param k: The number of clusters
+    :return: The top terms of each cluster, best first, and their weights
+    """
+
+    from P4.low_memory import top_terms
+
+    # Compute top terms per cluster, mapping the centroids back a block of terms at a time
+    print(f"\nTop terms per cluster, when k={k}:\n")
+    order_centroids, weights = top_terms(svd, cluster_centers, return_weights=True)
 
     # Print most representative terms for each cluster
-    _save_clusters(order_centroids, terms, folder='clusters/k3/', k=3)
+    _save_clusters(order_centroids, terms, folder=f'clusters/k{k}/', k=k)
+
+    return np.asarray(terms)[order_centroids], weights
+
+
+def _save_artifact(artifact: 'ClusterArtifact') -> None:
+    """
+    Save the cluster of each document, its distance to the centroid, the cluster sizes and the top terms of every k
+    to `clusters/clusters.npz`.
+
+    :param artifact: The clusters of every k
+    """
+
+    artifact.save('clusters/clusters.npz')
+
+    print(f"\nSaved the clusters of {len(artifact.names)} documents to clusters/clusters.npz")
+
+
+def _document_names(num_files, corpus) -> list:
+    """
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :return: The name of each document (its file name, or its URL in a segment corpus), in the order they are
+             vectorized
+    """
+
+    if corpus is None:
+        return glob.glob('text_files/*')[:num_files]
+
+    from P4.corpus import CorpusReader
+
+    return CorpusReader(corpus).urls()[:num_files]
+
 
-    print("\n--- K-Means (k=6) ---")
+# The LSA matrix shared by the k-sweep workers. Set in each worker by `_init_sweep_worker`
+_X_LSA = None
 
-    # Perform K-Means where k=3
-    kmeans_6 = KMeans(max_iter=100, n_clusters=6, random_state=6, n_init=1).fit(X_lsa)
 
-    cluster_ids, cluster_sizes = np.unique(kmeans_6.labels_, return_counts=True)
+def _sweep(X_lsa, svd, terms, ks, seeds: int, workers, save_ks, silhouette_sample: int,
+           artifact: 'ClusterArtifact') -> None:
+    """
+    Fit K-Means for every k of a range, with several seeds each, in parallel, and save the clusters of the best k
+    (or of the requested ones).
+
+    `X_lsa` is written once to a memory-mapped file, `clusters/X_lsa.npy`, which every worker maps read-only, rather
+    than it being pickled and sent along with each fit. Each fit is scored by its inertia and by its silhouette on a
+    sample of the documents. For each k, the seed with the lowest inertia is kept. Then the k with the highest
+    silhouette is chosen. The scores are saved to `clusters/sweep.json`.
+
+    :param X_lsa: The documents, in the LSA space
+    :param svd: The SVD step of the LSA reduction
+    :param terms: The terms of the vectorizer
+    :param ks: The values of k to try
+    :param seeds: The number of seeds to try for each k
+    :param workers: The number of worker processes. The number of CPUs if None
+    :param save_ks: The values of k to save the clusters of. The chosen k if None
+    :param silhouette_sample: The number of documents to compute the silhouette on
+    :param artifact: The artifact to add the clusters of the saved k values to
+    """
+
+    from sklearn.metrics import pairwise_distances_argmin_min
+
+    Path('clusters/').mkdir(parents=True, exist_ok=True)
+    np.save('clusters/X_lsa.npy', X_lsa)
+
+    configurations = [(k, seed) for k in ks for seed in range(seeds)]
+
+    print(f"\n--- K-Means Sweep (k={ks.start}..{ks.stop - 1}, {seeds} seeds, {len(configurations)} fits) ---\n")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker,
+                             initargs=('clusters/X_lsa.npy',)) as executor:
+        fits = list(executor.map(_fit_sweep, configurations, [silhouette_sample] * len(configurations)))
+
+    # For each k, keep the seed with the lowest inertia
+    best = {}
+    for fit in fits:
+        if fit['k'] not in best or fit['inertia'] < best[fit['k']]['inertia']:
+            best[fit['k']] = fit
+
+    for k, fit in best.items():
+        print(f"k={k:>3}: inertia {fit['inertia']:10.2f}, silhouette {fit['silhouette']:.4f} (seed {fit['seed']})")
+
+    chosen = max(best, key=lambda k: best[k]['silhouette'])
+    print(f"\nBest k by silhouette: {chosen}")
+
+    with open('clusters/sweep.json', 'wt') as f:
+        json.dump({'chosen_k': chosen,
+                   'fits': [{key: value for key, value in fit.items() if key != 'centers'} for fit in fits]},
+                  f, indent=2)
+
+    for k in save_ks or [chosen]:
+        if k not in best:
+            print(f"\nk={k} wasn't part of the sweep, so its clusters can't be saved")
+            continue
+
+        print(f"\n--- K-Means (k={k}) ---")
+        print(f"\nNumber of elements assigned to each cluster (KMEANS {k}): {best[k]['sizes']}")
+
+        centers = np.array(best[k]['centers'])
+        artifact.add(k, *pairwise_distances_argmin_min(X_lsa, centers), *_save_top_terms(svd, centers, terms, k))
 
-    print(f"\nNumber of elements assigned to each cluster (KMEANS 6): {cluster_sizes}")
+    _save_artifact(artifact)
+
+
+def _init_sweep_worker(path: str) -> None:
+    """
+    Map the shared LSA matrix in a k-sweep worker.
+
+    :param path: The `.npy` file of the matrix
+    """
+
+    from threadpoolctl import threadpool_limits
+
+    global _X_LSA
+    _X_LSA = np.load(path, mmap_mode='r')
+
+    # Each worker fits on a single thread, so that the workers don't compete for the CPUs
+    threadpool_limits(1)
+
+
+def _fit_sweep(configuration: tuple, silhouette_sample: int) -> dict:
+    """
+    Fit and score K-Means for one (k, seed) pair of a k-sweep, in a worker.
+
+    :param configuration: The number of clusters, and the seed
+    :param silhouette_sample: The number of documents to compute the silhouette on
+    :return: The k, seed, inertia, silhouette, cluster sizes and centroids of the fit
+    """
+
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    k, seed = configuration
+    kmeans = KMeans(max_iter=100, n_clusters=k, random_state=seed, n_init=1).fit(_X_LSA)
+
+    n_samples = _X_LSA.shape[0]
+    silhouette = silhouette_score(_X_LSA, kmeans.labels_, sample_size=min(silhouette_sample, n_samples),
+                                  random_state=seed)
+
+    return {
+        'k': k,
+        'seed': seed,
+        'inertia': float(kmeans.inertia_),
+        'silhouette': float(silhouette),
+        'sizes': np.bincount(kmeans.labels_, minlength=k).tolist(),
+        'centers': kmeans.cluster_centers_.tolist(),
+    }
+
+
+def _get_documents(num_files, corpus):
+    """
+    Get the documents to vectorize, either the files in `text_files/`, or the documents of a segment corpus.
+
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :return: The documents, and the matching `input` parameter for the vectorizer
+    """
+
+    if corpus is None:
+        ALL_FILES = glob.glob('text_files/*')
+        total = len(ALL_FILES)
+    else:
+        from P4.corpus import CorpusReader
+
+        reader = CorpusReader(corpus)
+        total = len(reader)
+
+    # Get the number of files to process
+    if num_files is None or num_files > total:
+        print(f"\nYou entered {num_files} files, but {total} are present. Will process all of them\n")
+        num_files = total
+
+    if corpus is None:
+        return ALL_FILES[:num_files], 'filename'
+
+    # Stream the documents out of the segments, rather than loading them all up front
+    return (text for _, text in reader.iter_documents(limit=num_files)), 'content'
+
+
+def _document_stream(num_files, corpus, documents=None):
+    """
+    Get the documents to vectorize as a stream that can be read more than once, for the streaming mode.
+
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :param documents: The documents already returned by `_get_documents`, if any
+    :return: A function returning a new generator of the documents' text each time it is called
+    """
+
+    if documents is None:
+        documents, _ = _get_documents(num_files, corpus)
+
+    if corpus is None:
+        return lambda: (Path(file).read_text(encoding='utf-8') for file in documents)
+
+    from P4.corpus import CorpusReader
+
+    reader = CorpusReader(corpus)
+    return lambda: (text for _, text in reader.iter_documents(limit=num_files))
+
+
+def _stream_clusters(num_files, corpus, chunk_size: int, epochs: int, max_df: float, min_df: float,
+                     ks=(3, 6)) -> None:
+    """
+    Cluster the documents out-of-core, holding only `chunk_size` documents in memory at a time, and save the same
+    top terms per cluster as the in-memory path.
+
+    The documents are read several times: once to count document frequencies, once to fit the LSA reduction, then
+    `epochs` times to fit Mini-Batch K-Means for every k together, and once more to assign each document to its
+    cluster.
+
+    :param num_files: The number of documents to process. All of them if None
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :param chunk_size: The number of documents to hold in memory at once
+    :param epochs: The number of passes Mini-Batch K-Means makes over the documents
+    :param max_df: Ignore terms found in more than this share of the documents
+    :param min_df: Ignore terms found in fewer than this share of the documents
+    :param ks: The numbers of clusters to fit
+    """
+
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import pairwise_distances_argmin_min
+
+    from P4.cluster_artifact import ClusterArtifact
+    from P4.low_memory import largest
+    from P4.streaming import IncrementalLSA, StreamingTfidf, chunked
+
+    stream = _document_stream(num_files, corpus)
+
+    print("\n--- Streaming Vectorization ---")
+
+    # Count the document frequencies of hashed terms, then prune them like the TfidfVectorizer does
+    vectorizer = StreamingTfidf(max_df=max_df, min_df=min_df, stop_words=clustering_stopwords(),
+                                 strip_accents='unicode')
+    for chunk in chunked(stream(), chunk_size):
+        vectorizer.partial_fit(chunk)
+
+    try:
+        vectorizer.finish()
+    except ValueError as e:
+        print(f"\nVECTORIZATION ERROR: {e} \n")
+        return
+
+    n_samples = vectorizer.n_documents
+    n_features = len(vectorizer.kept)
+    print(f"\nn_samples: {n_samples}, n_features: {n_features}")
+
+    print("\n--- Incremental LSA Dimensionality Reduction ---")
+
+    lsa = IncrementalLSA(n_components=min(100, n_samples), batch_size=chunk_size)
+    for chunk in chunked(stream(), chunk_size):
+        lsa.partial_fit(vectorizer.transform(chunk))
+    lsa.finish()
+
+    print(f"\nExplained variance of the incremental PCA step: {lsa.explained_variance_ratio_.sum() * 100:.1f}%")
+
+    models = {k: MiniBatchKMeans(n_clusters=k, random_state=k, n_init=1) for k in ks}
+
+    print(f"\n--- Mini-Batch K-Means (k={', '.join(map(str, ks))}, {epochs} epochs) ---")
+
+    for _ in range(epochs):
+        for chunk in chunked(stream(), chunk_size):
+            X_lsa = lsa.transform(vectorizer.transform(chunk))
+
+            # Take several mini-batch steps per chunk, rather than one step on the whole chunk
+            for batch in range(0, X_lsa.shape[0], 1024):
+                for kmeans in models.values():
+                    kmeans.partial_fit(X_lsa[batch:batch + 1024])
+
+    # Assign every document to its cluster, a chunk at a time
+    assignments = {k: ([], []) for k in ks}
+    for chunk in chunked(stream(), chunk_size):
+        X_lsa = lsa.transform(vectorizer.transform(chunk))
+        for k, kmeans in models.items():
+            labels, distances = pairwise_distances_argmin_min(X_lsa, kmeans.cluster_centers_)
+            assignments[k][0].append(labels)
+            assignments[k][1].append(distances)
 
-    # Compute top terms per cluster, when k=6
-    print("\nTop terms per cluster, when k=6:\n")
-    original_space_centroids = lsa[0].inverse_transform(kmeans_6.cluster_centers_)
-    order_centroids = original_space_centroids.argsort()[:, ::-1]
     terms = vectorizer.get_feature_names_out()
+    artifact = ClusterArtifact(_document_names(num_files, corpus))
 
-    # Print most representative terms for each cluster
-    _save_clusters(order_centroids, terms, folder='clusters/k6/', k=6)
+    for k, kmeans in models.items():
+        labels, distances = np.concatenate(assignments[k][0]), np.concatenate(assignments[k][1])
+        print(f"\nNumber of elements assigned to each cluster (KMEANS {k}): {np.bincount(labels, minlength=k)}")
+
+        # Compute top terms per cluster, only sorting the best of each centroid
+        print(f"\nTop terms per cluster, when k={k}:\n")
+        order_centroids, weights = largest(lsa.inverse_transform(kmeans.cluster_centers_), 20)
+
+        _save_clusters(order_centroids, terms, folder=f'clusters/k{k}/', k=k)
+
+        artifact.add(k, labels, distances, terms[order_centroids], weights)
+
+    _save_artifact(artifact)
 
 
 def _save_clusters(order_centroids: list, terms: list, folder: str, k: int) -> None:
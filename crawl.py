@@ -1,40 +1,172 @@
+import multiprocessing
 from argparse import ArgumentParser
 from pathlib import Path
 
-from scrapy.crawler import CrawlerProcess
-
-from P4.spiders.MainSpider import MainSpider
+from P4.extraction import BACKENDS
 
 # Create an argument parser to let user decide how many files to download
 parser = ArgumentParser(description="Concordia Scraper")
 parser.add_argument('--num-files', '-n', type=int,
                     help="The number of files to process", default=100, required=False)
+parser.add_argument('--backend', '-b', choices=list(BACKENDS),
+                    help="The HTML extraction backend to use", default='bs4', required=False)
+parser.add_argument('--incremental', '-i', action='store_true',
+                    help="Re-crawl incrementally, keeping the files of pages that haven't changed since the last crawl")
+parser.add_argument('--store', '-s', choices=['files', 'segments', 'none'],
+                    help="Save each page to its own file, to a few large segment files, or not at all", default=None,
+                    required=False)
+parser.add_argument('--compress', action='store_true',
+                    help="Compress each page saved to the segment files")
+parser.add_argument('--workers', '-w', type=int,
+                    help="The number of crawler processes to run on this machine, sharing one frontier", default=1,
+                    required=False)
+parser.add_argument('--frontier', '-f',
+                    help="Crawl with a shared frontier database at this path, e.g. on storage shared between machines",
+                    default=None, required=False)
+parser.add_argument('--join', '-j', action='store_true',
+                    help="Join the crawl already running on the shared frontier, instead of starting a new one")
+archive = parser.add_mutually_exclusive_group()
+archive.add_argument('--record', nargs='?', const='', metavar='ARCHIVE',
+                     help="Record the crawl's responses to a WARC archive (by default, ARCHIVE_PATH in the settings)")
+archive.add_argument('--replay', nargs='?', const='', metavar='ARCHIVE',
+                     help="Replay a recorded crawl from a WARC archive, without the network")
+parser.add_argument('--live-clusters', '-l', action='store_true',
+                    help="Cluster the pages as they are crawled, saving snapshots of the clusters as the crawl goes")
+parser.add_argument('--near-duplicates', choices=['drop', 'tag'],
+                    help="Find pages that are near duplicates of one already crawled, and drop them, or save them "
+                         "tagged with the page they duplicate", default=None, required=False)
+parser.add_argument('--keep-clusters', action='store_true',
+                    help="Keep the outputs of cluster.py and sentiment.py in clusters/, e.g. when pipeline.py tracks "
+                         "whether they are still up to date")
+parser.add_argument('--latency', type=float,
+                    help="When replaying, how many seconds each response takes to arrive", default=None,
+                    required=False)
 
 
 def main():
     # Parse the command-line arguments passed to this script, if any
     args = parser.parse_args()
 
-    # Clear the file folder(s)
-    _clear_folder()
+    # Settings given on the command line, on top of the project settings (P4/settings.py)
+    overrides = {}
+    if args.store is not None:
+        overrides['CORPUS_STORE'] = args.store
+    if args.compress:
+        overrides['CORPUS_COMPRESS'] = True
+    for mode in ('record', 'replay'):
+        path = getattr(args, mode)
+        if path is not None:
+            overrides['ARCHIVE_MODE'] = mode
+            if path:
+                overrides['ARCHIVE_PATH'] = path
+    if args.latency is not None:
+        overrides['ARCHIVE_REPLAY_LATENCY'] = args.latency
+    if args.live_clusters:
+        overrides['STREAM_CLUSTER_ENABLED'] = True
+    if args.near_duplicates is not None:
+        overrides['NEAR_DUPLICATE_ENABLED'] = True
+        overrides['NEAR_DUPLICATE_ACTION'] = args.near_duplicates
+
+    # Scrapy is only imported once the arguments are parsed, so that --help and mistyped arguments answer right away
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    settings.setdict(overrides, priority='cmdline')
+
+    spider_kwargs = {'max_files': args.num_files, 'backend': args.backend, 'incremental': args.incremental}
+
+    shared = args.workers > 1 or args.frontier is not None
+    if shared:
+        if args.incremental or settings.get('CORPUS_STORE') == 'segments':
+            print("\nA crawl with a shared frontier can't be incremental or save to segment files\n")
+            return
+        if args.live_clusters:
+            print("\nA crawl with a shared frontier can't cluster live, since each worker would only see its own pages\n")
+            return
+        if args.record is not None:
+            print("\nA crawl with a shared frontier can't be recorded, since each worker would overwrite the archive\n")
+            return
+        if args.replay is not None:
+            print("\nA crawl with a shared frontier can't be replayed, since a recording only holds one worker's pages\n")
+            return
+
+        frontier_path = args.frontier or settings.get('FRONTIER_PATH')
+        overrides['SCHEDULER'] = 'P4.scheduler.SharedFrontierScheduler'
+        overrides['FRONTIER_PATH'] = frontier_path
+
+    # Clear the file folder(s). When crawling incrementally, or joining a running crawl, the existing files are kept
+    if not args.join:
+        _clear_folder(keep_text_files=args.incremental, corpus_folder=settings.get('CORPUS_STORE_PATH'),
+                      keep_clusters=args.keep_clusters)
+        if shared:
+            _clear_frontier(frontier_path)
 
     print("\n--- Web Crawling ---\n")
 
+    if args.workers == 1:
+        _run_crawler(overrides, spider_kwargs)
+        return
+
+    # Each worker is its own process with its own reactor. They coordinate through the shared frontier
+    workers = [multiprocessing.Process(target=_run_crawler, args=(overrides, spider_kwargs))
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def _run_crawler(overrides: dict, spider_kwargs: dict):
+    """
+    Run the spider to completion in this process.
+
+    :param overrides: Settings to apply on top of the project settings
+    :param spider_kwargs: Keyword arguments for the spider
+    """
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from P4.spiders.MainSpider import MainSpider
+
+    # The project settings (P4/settings.py) are loaded so that its middlewares and politeness settings apply
+    settings = get_project_settings()
+    settings.setdict(overrides, priority='cmdline')
+
     # Create and run a CrawlerProcess based on the spider. Inspired by: https://stackoverflow.com/a/31374345
     # Using Scrapy version 2.8.0 https://github.com/scrapy/scrapy
-    process = CrawlerProcess()
-    process.crawl(MainSpider, max_files=args.num_files)
+    process = CrawlerProcess(settings)
+    process.crawl(MainSpider, **spider_kwargs)
     process.start()
 
 
-def _clear_folder():
+def _clear_frontier(path: str):
+    """
+    Delete the shared frontier database, and its SQLite journal files, to start a new crawl.
+
+    :param path: The path to the frontier database
+    """
+
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def _clear_folder(keep_text_files: bool = False, corpus_folder: str = 'corpus', keep_clusters: bool = False):
     """
     Delete the contents of necessary folders when starting the app.
+
+    :param keep_text_files: Whether to keep the previously crawled text files and segment corpus
+    :param corpus_folder: The folder of the segment corpus
+    :param keep_clusters: Whether to keep the files in clusters/
     """
 
-    for path in Path('text_files/').glob('*'):
-        if path.is_file():
-            path.unlink()
+    if not keep_text_files:
+        for path in [*Path('text_files/').glob('*'), *Path(corpus_folder).glob('*')]:
+            if path.is_file():
+                path.unlink()
+
+    if keep_clusters:
+        return
 
     for path in Path('clusters/').glob('*'):
         if path.is_file():
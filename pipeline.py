@@ -0,0 +1,110 @@
+from argparse import ArgumentParser
+from pathlib import Path
+
+from P4.extraction import BACKENDS
+from P4.resources import AFINN_111, afinn_165
+from P4.orchestrator import Pipeline, Stage
+
+# The folder of the entry points, which the stages run
+ROOT = Path(__file__).resolve().parent
+
+# The code each stage runs: its script, and the modules of P4 the script uses. A stage runs again when any of them
+# changes
+CLUSTER_CODE = [ROOT / 'cluster.py', *(ROOT / 'P4' / module for module in (
+    'cluster_artifact.py', 'cluster_model.py', 'low_memory.py', 'resources.py', 'streaming.py', 'term_cache.py'))]
+SENTIMENT_CODE = [ROOT / 'sentiment.py', *(ROOT / 'P4' / module for module in (
+    'cluster_artifact.py', 'corpus.py', 'lexicon.py', 'resources.py'))]
+
+parser = ArgumentParser(description="Concordia Pipeline")
+parser.add_argument('--num-files', '-n', type=int,
+                    help="The number of files to crawl", default=100, required=False)
+parser.add_argument('--backend', '-b', choices=list(BACKENDS),
+                    help="The HTML extraction backend of the crawl", default='bs4', required=False)
+parser.add_argument('--k', type=int, nargs='+',
+                    help="The numbers of clusters to fit", default=[3, 6], required=False)
+parser.add_argument('--max-df', type=float,
+                    help="Ignore terms found in more than this share of the documents", default=0.5, required=False)
+parser.add_argument('--min-df', type=float,
+                    help="Ignore terms found in fewer than this share of the documents", default=0.1, required=False)
+parser.add_argument('--lexicon', choices=['111', '165'],
+                    help="The AFINN lexicon to score with. By default, AFINN-111 for my algorithm and AFINN-en-165 for "
+                         "the library's", default=None, required=False)
+parser.add_argument('--documents', '-d', action='store_true',
+                    help="Also score every document, and summarize the scores of each cluster")
+parser.add_argument('--jobs', '-j', type=int,
+                    help="The most stages to run at once. Defaults to the number of CPUs", required=False)
+parser.add_argument('--force', '-f', nargs='+', default=[],
+                    help="Run these stages even if they are up to date ('all' for every stage), e.g. 'crawl' to crawl "
+                         "the site again", required=False)
+parser.add_argument('--verbose', '-v', action='store_true',
+                    help="Print the output of each stage once it finishes")
+
+
+def main():
+    # Parse the command-line arguments passed to this script, if any
+    args = parser.parse_args()
+
+    print("\n--- Pipeline ---\n")
+
+    try:
+        stages = _stages(args)
+    except FileNotFoundError as e:
+        print(f"{e}\n")
+        raise SystemExit(1)
+
+    pipeline = Pipeline(stages, jobs=args.jobs)
+    results = pipeline.run(force=args.force, verbose=args.verbose)
+
+    print("\n--- Stage Timings ---\n")
+
+    for result in results:
+        print(f"{result['stage']:>28}: {result['status']:>7} {result['seconds']:8.1f}s")
+    print(f"{'total':>28}: {'':>7} {sum(result['seconds'] for result in results):8.1f}s")
+
+    if any(result['status'] in ('failed', 'blocked') for result in results):
+        raise SystemExit(1)
+
+
+def _stages(args) -> list:
+    """
+    The DAG of the pipeline: crawl, then cluster, then the sentiment analysis of each k with each method, which all
+    run concurrently.
+
+    :param args: The command-line arguments
+    :return: The stages
+    """
+
+    # The crawl only depends on its settings. Use --force crawl to fetch the pages again
+    stages = [
+        Stage('crawl', [ROOT / 'crawl.py', '-n', args.num_files, '-b', args.backend, '--keep-clusters'],
+              params={'num_files': args.num_files, 'backend': args.backend}, outputs=['text_files/*']),
+        Stage('cluster', [ROOT / 'cluster.py', '--k', *args.k, '--max-df', args.max_df, '--min-df', args.min_df],
+              inputs=list(map(str, CLUSTER_CODE)), manifests=['text_files/*'],
+              outputs=['clusters/clusters.npz', *(f'clusters/k{k}/cluster-*.txt' for k in args.k)], after=['crawl']),
+    ]
+
+    # Each method is only given --lexicon when it isn't the one it uses by default, so its stages stay up to date
+    # when --lexicon only changes the other method's
+    lexicon_option = ['--lexicon', args.lexicon] if args.lexicon else []
+    lexicons = {'manual': (afinn_165(), lexicon_option) if args.lexicon == '165' else (AFINN_111, []),
+                'library': (AFINN_111, lexicon_option) if args.lexicon == '111' else (afinn_165(), [])}
+
+    for k in args.k:
+        for method, (lexicon, option) in lexicons.items():
+            stages.append(Stage(f'sentiment-k{k}-{method}',
+                                [ROOT / 'sentiment.py', '--k', k, '--method', method, *option],
+                                inputs=[f'clusters/k{k}/cluster-*.txt', *map(str, SENTIMENT_CODE), lexicon],
+                                after=['cluster']))
+
+    if args.documents:
+        # Documents are scored with the same lexicon as my algorithm
+        lexicon, option = lexicons['manual']
+        stages.append(Stage('sentiment-documents', [ROOT / 'sentiment.py', '--documents', *option],
+                            inputs=['clusters/clusters.npz', *map(str, SENTIMENT_CODE), lexicon],
+                            manifests=['text_files/*'], outputs=['clusters/sentiment.npz'], after=['cluster']))
+
+    return stages
+
+
+if __name__ == '__main__':
+    main()
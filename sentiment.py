@@ -1,21 +1,75 @@
 import glob
-
-from afinn import Afinn
+import json
+import os
+from collections import deque
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from P4.cluster_artifact import ClusterArtifact
+from P4.corpus import CorpusReader
+from P4.lexicon import AFINN_111, afinn_165, get_lexicon
+
+parser = ArgumentParser(description="Concordia Sentiment Analysis")
+parser.add_argument('--documents', '-d', action='store_true',
+                    help="Score every clustered document, and summarize the scores of each cluster for every k, "
+                         "instead of scoring the clusters' top terms")
+parser.add_argument('--corpus', '-c',
+                    help="With --documents, read the documents from this segment corpus instead of text_files/",
+                    required=False)
+parser.add_argument('--k', type=int,
+                    help="Score the top terms of the clusters of this k", default=6, required=False)
+parser.add_argument('--method', choices=['manual', 'library', 'both'],
+                    help="Score the top terms with my algorithm, the library's, or both", default='both',
+                    required=False)
+parser.add_argument('--lexicon', choices=['111', '165'],
+                    help="The AFINN lexicon to score with. By default, AFINN-111 for my algorithm and --documents, "
+                         "and AFINN-en-165 for the library's", default=None, required=False)
+parser.add_argument('--workers', '-w', type=int,
+                    help="With --documents, the number of worker processes. Defaults to the number of CPUs",
+                    required=False)
+parser.add_argument('--batch-size', type=int,
+                    help="With --documents, the number of documents each worker scores at once", default=2000,
+                    required=False)
+
+# The bins of the distribution of document scores reported for each cluster. Scores are sums of whole AFINN weights,
+# and each bin holds the scores from its lower edge up to, but not including, its upper edge, so that the negative
+# bins mirror the positive ones
+SCORE_BINS = [-np.inf, -9, 0, 1, 10, np.inf]
+SCORE_BIN_NAMES = ['<= -10', '-9..-1', 'neutral', '1..9', '>= 10']
 
 
 def main():
+    # Parse the command-line arguments passed to this script, if any
+    args = parser.parse_args()
+
+    if args.documents:
+        try:
+            lexicon = afinn_165() if args.lexicon == '165' else AFINN_111
+        except FileNotFoundError as e:
+            print(f"\n{e}\n")
+            return
+
+        document_sentiment(args.corpus, lexicon, args.workers, args.batch_size)
+        return
+
     print('\n--- AFINN Sentiment Analysis ---\n')
 
     # Get all clusters from the files
-    clusters = _get_clusters()
+    clusters = _get_clusters(args.k)
 
-    print('\n~~~ Manual AFINN ~~~\n')
+    if args.method in ('manual', 'both'):
+        print('\n~~~ Manual AFINN ~~~\n')
 
-    manual_AFINN(clusters)
+        manual_AFINN(clusters, use_165=args.lexicon == '165')
 
-    print('\n~~~ Library AFINN ~~~\n')
+    if args.method in ('library', 'both'):
+        print('\n~~~ Library AFINN ~~~\n')
 
-    library_AFINN(clusters)
+        library_AFINN(clusters, use_111=args.lexicon == '111')
 
 
 def library_AFINN(clusters, use_111: bool = False):
@@ -28,6 +82,9 @@ def library_AFINN(clusters, use_111: bool = False):
     :param use_111: Whether to use `AFINN-111.txt` instead of the libraries default `AFINN-en-165.txt`
     """
 
+    # Only imported when the library's algorithm is used
+    from afinn import Afinn
+
     # Define the AFINN object from the library. I use the latest version from https://github.com/fnielsen/afinn
     afinn_lib = Afinn()
 
@@ -46,86 +103,205 @@ def library_AFINN(clusters, use_111: bool = False):
         print(f"Cluster {i}: {cluster}  |  Score: {score}\n")
 
 
-def manual_AFINN(clusters):
+def manual_AFINN(clusters, use_165: bool = False):
     """
     Given a list of clusters, score the manually using a custom algorithm
 
     :param clusters: The list of clusters to score
+    :param use_165: Whether to use the library's `AFINN-en-165.txt` instead of `AFINN-111.txt`
     """
 
-    for i, cluster in enumerate(clusters):
-        print(f"Cluster {i}: {cluster}  |  Score: {_score_cluster_manual(cluster)}\n")
+    # Score every cluster at once with the compiled lexicon (see P4/lexicon.py)
+    lexicon = get_lexicon(afinn_165() if use_165 else AFINN_111)
+    scores = lexicon.score_many(' '.join(cluster) for cluster in clusters)
+
+    for i, (cluster, score) in enumerate(zip(clusters, scores)):
+        print(f"Cluster {i}: {cluster}  |  Score: {float(score)}\n")
 
 
 def _score_cluster_manual(cluster: list) -> float:
     """
     Score a given cluster manually, using a custom algorithm
 
+    The words of the cluster are looked up in the AFINN-111 lexicon, compiled once per process. Phrases of the
+    lexicon, like "does not work", are matched too when their words follow each other in the cluster.
+
     :param cluster: The cluster to give a sentiment score to. Negative numbers are negative and vice-versa
     :return: The score for the cluster
     """
 
-    # Get the AFINN dict from AFINN-111.txt
-    AFINN = get_AFINN()
+    return get_lexicon(AFINN_111).score(' '.join(cluster))
 
-    # The score for a cluster starts at 0, neutral sentiment
-    cluster_score = 0
 
-    for word in cluster:
-        # Try to find the word in the lexicon. If not found, score is 0
-        word_score = float(AFINN.get(word, 0.0))
+def document_sentiment(corpus, lexicon: str, workers, batch_size: int) -> None:
+    """
+    Score every document clustered by the latest run of `cluster.py`, then summarize the scores of each cluster, for
+    every k that was run: their mean, variance, quartiles, and how many documents fall in each of `SCORE_BINS`.
 
-        # Modify the overall cluster score by the score for this word
-        cluster_score += word_score
+    The documents are scored in batches by a pool of worker processes, each scoring a whole batch at once with the
+    compiled lexicon. The scores are saved to `clusters/sentiment.npz`, and the summary to `clusters/sentiment.json`.
 
-    return cluster_score
+    :param corpus: The folder of the segment corpus, or None to use `text_files/`
+    :param lexicon: The lexicon file to score with
+    :param workers: The number of worker processes. The number of CPUs if None
+    :param batch_size: The number of documents each worker scores at once
+    """
 
+    artifact = ClusterArtifact.load('clusters/clusters.npz')
+    if artifact is None:
+        print("\nThere are no document clusters in clusters/clusters.npz. Run cluster.py first\n")
+        return
 
-def _get_clusters():
-    """
-    Get all clusters from the files
+    # Compile the lexicon here first, so that a missing lexicon is reported before any worker starts
+    try:
+        get_lexicon(lexicon)
+    except FileNotFoundError:
+        print(f"\nThe lexicon {lexicon} can't be found\n")
+        return
 
-    :return: The clusters
+    names = artifact.names.tolist()
+
+    print(f"\n--- Document Sentiment ({len(names)} documents, {Path(lexicon).name}) ---")
+
+    workers = workers or os.cpu_count()
+    scores = np.full(len(names), np.nan)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # The positions of the documents of each batch, and the future of their scores
+        pending = deque()
+
+        if corpus is None:
+            # Each worker reads its own batch of files
+            for start in range(0, len(names), batch_size):
+                pending.append((np.arange(start, min(start + batch_size, len(names))),
+                                executor.submit(_score_files, names[start:start + batch_size], lexicon)))
+        else:
+            # The segments are read sequentially here, and the texts sent to the workers a batch at a time. Only a few
+            # batches are kept waiting, so the corpus is never all in memory
+            positions = {name: i for i, name in enumerate(names)}
+            documents = ((url, text) for url, text in CorpusReader(corpus).iter_documents() if url in positions)
+
+            while batch := list(islice(documents, batch_size)):
+                pending.append(([positions[url] for url, _ in batch],
+                                executor.submit(_score_texts, [text for _, text in batch], lexicon)))
+
+                if len(pending) > 2 * workers:
+                    batch_positions, future = pending.popleft()
+                    scores[batch_positions] = future.result()
+
+        for batch_positions, future in pending:
+            scores[batch_positions] = future.result()
+
+    missing = int(np.isnan(scores).sum())
+    if missing:
+        print(f"\n{missing} documents were clustered but can't be found anymore. They are left out")
+
+    np.savez('clusters/sentiment.npz', names=artifact.names, scores=scores.astype(np.float32))
+
+    summary = {'lexicon': Path(lexicon).name, 'documents': len(names) - missing, 'bins': SCORE_BIN_NAMES, 'ks': {}}
+    for k in artifact.ks:
+        clusters = _cluster_sentiment(scores, artifact.clusters(k), k)
+        summary['ks'][str(k)] = clusters
+
+        print(f"\nWhen k={k}:\n")
+        for i, cluster in enumerate(clusters):
+            distribution = ', '.join(f"{name}: {count}" for name, count in zip(SCORE_BIN_NAMES, cluster['bins']))
+            print(f"Cluster {i} ({cluster['size']} documents): mean {cluster['mean']:.2f}, "
+                  f"variance {cluster['variance']:.2f}, median {cluster['quartiles'][1]:.1f}  |  {distribution}")
+
+    with open('clusters/sentiment.json', 'wt') as f:
+        json.dump(summary, f, indent=2)
+
+    print("\nSaved the scores to clusters/sentiment.npz, and the summary to clusters/sentiment.json")
+
+
+def _cluster_sentiment(scores: np.ndarray, labels: np.ndarray, k: int) -> list:
     """
+    :param scores: The score of each document. NaN for documents that couldn't be scored
+    :param labels: The cluster of each document
+    :param k: The number of clusters
+    :return: The size, mean, variance, quartiles and binned distribution of the scores of each cluster
+    """
+
+    found = ~np.isnan(scores)
+    scores, labels = scores[found], labels[found]
+
+    sizes = np.bincount(labels, minlength=k)
+    means = np.bincount(labels, weights=scores, minlength=k) / np.maximum(sizes, 1)
+    variances = np.bincount(labels, weights=scores ** 2, minlength=k) / np.maximum(sizes, 1) - means ** 2
+
+    # Sort the scores by cluster, so that each cluster's scores are a contiguous slice
+    order = np.argsort(labels, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    bins = np.digitize(scores, SCORE_BINS[1:-1], right=False)
 
     clusters = []
+    for i in range(k):
+        cluster_scores = scores[order[offsets[i]:offsets[i + 1]]]
+        quartiles = np.percentile(cluster_scores, [25, 50, 75]).tolist() if len(cluster_scores) else [0.0] * 3
+
+        clusters.append({
+            'size': int(sizes[i]),
+            'mean': float(means[i]),
+            'variance': float(max(variances[i], 0.0)),
+            'quartiles': quartiles,
+            'bins': np.bincount(bins[order[offsets[i]:offsets[i + 1]]], minlength=len(SCORE_BIN_NAMES)).tolist(),
+        })
+
+    return clusters
 
-    files = glob.glob('clusters/k6/*')
 
+def _score_files(files: list, lexicon: str) -> np.ndarray:
+    """
+    Score a batch of text files, in a worker.
+
+    :param files: The files
+    :param lexicon: The lexicon file to score with
+    :return: The score of each file. NaN for files that no longer exist
+    """
+
+    texts, found = [], []
     for file in files:
-        with open(file, 'rt') as f:
-            cluster = f.read().split(' ')
+        try:
+            texts.append(Path(file).read_text(encoding='utf-8'))
+            found.append(True)
+        except FileNotFoundError:
+            texts.append('')
+            found.append(False)
 
-            clusters.append(cluster)
+    return np.where(found, _score_texts(texts, lexicon), np.nan)
 
-    return clusters
 
+def _score_texts(texts: list, lexicon: str) -> np.ndarray:
+    """
+    Score a batch of texts, in a worker. The lexicon is compiled once per worker.
 
-def get_AFINN() -> dict:
+    :param texts: The texts
+    :param lexicon: The lexicon file to score with
+    :return: The score of each text
     """
-    Read the AFINN-111 lexicon and return the dict form of it
 
-    :return: The dict from of the AFINN-111 lexicon
+    return get_lexicon(lexicon).score_many(texts)
+
+
+def _get_clusters(k: int = 6):
     """
+    Get all clusters from the files
 
-    afinn = {}  # Create an AFINN dict to be filled
+    :param k: The k whose clusters to get
+    :return: The clusters
+    """
 
-    # Get the contents of the AFINN-111 file
-    with open('AFINN-111.txt', 'rt') as f:
-        contents = f.readlines()
+    clusters = []
 
-    # Go through each line in the file
-    for line in contents:
-        # Split the line based on the tab character
-        line = line.split('\t')
+    files = glob.glob(f'clusters/k{k}/*')
 
-        # Make the numeric portion no longer have a newline character
-        line[1] = line[1].strip()
+    for file in files:
+        with open(file, 'rt') as f:
+            cluster = f.read().split(' ')
 
-        # For the AFINN dictionary, set the key to be the term and the value to be its numeric score, as an int
-        afinn[line[0]] = int(line[1])
+            clusters.append(cluster)
 
-    return afinn
+    return clusters
 
 
 if __name__ == '__main__':
@@ -0,0 +1,73 @@
+import time
+from argparse import ArgumentParser
+
+from P4.cluster_model import ClusterModel
+from P4.corpus import text_file_name
+
+# Create an argument parser to let the user pick the page or text to find similar pages to
+parser = ArgumentParser(description="Concordia Similar Pages")
+parser.add_argument('page', nargs='?',
+                    help="The URL of a crawled page, or the name of its text file", default=None)
+parser.add_argument('--text', '-t',
+                    help="Find the pages most similar to this text, instead of to a page", required=False)
+parser.add_argument('--top', '-k', type=int,
+                    help="The number of similar pages to show", default=10, required=False)
+parser.add_argument('--probes', type=int,
+                    help="The number of lists of the index to scan. More is slower, but finds more of the true "
+                         "nearest pages", required=False)
+parser.add_argument('--version', type=int,
+                    help="The version of the clustering model to use. The latest one by default", required=False)
+
+
+def main():
+    """
+    Find the pages most similar to a crawled page, or to any text, from the LSA vectors saved by `cluster.py`.
+    """
+
+    # Parse the command-line arguments passed to this script, if any
+    args = parser.parse_args()
+
+    if (args.page is None) == (args.text is None):
+        parser.error("Give either a page or --text")
+
+    model = ClusterModel.load(version=args.version)
+    if model is None or model.index is None:
+        print("\nThere is no saved index of the pages. Run cluster.py --save-model first\n")
+        return
+
+    name = None
+    if args.page is not None:
+        name = _resolve(model, args.page)
+        if name is None:
+            print(f"\n{args.page} isn't in the index of model v{model.manifest['version']}\n")
+            return
+
+    start = time.perf_counter()
+    results = model.similar(name=name, text=args.text, k=args.top, n_probe=args.probes)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n--- Pages Most Similar To {name or repr(args.text)} ---\n")
+    for i, (similar, similarity) in enumerate(results, start=1):
+        print(f"{i:>3}. {similarity:.3f}  {similar}")
+
+    print(f"\nFound in {elapsed * 1000:.1f} ms, among {len(model.index)} pages")
+
+
+def _resolve(model, page: str):
+    """
+    Find the name a page is indexed under: its URL in a segment corpus, or its text file otherwise.
+
+    :param model: The clustering model
+    :param page: The URL of the page, or the name of its text file
+    :return: The name of the page in the index, or None if it isn't indexed
+    """
+
+    for name in (page, text_file_name(page)):
+        if name in model.index:
+            return name
+
+    return None
+
+
+if __name__ == '__main__':
+    main()
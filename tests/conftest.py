@@ -0,0 +1,8 @@
+"""
+Makes the repository's modules importable by the tests, however pytest is started.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
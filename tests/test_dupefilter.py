@@ -0,0 +1,95 @@
+"""
+Tests of the scalable Bloom filter behind the duplicate request filter.
+
+    $ python -m pytest tests
+"""
+
+import pytest
+
+from P4.dupefilter import ScalableBloomFilter
+
+# 3 filters: 1000, 2000 then 4000 keys
+KEYS = [f"https://www.concordia.ca/page-{i}.html".encode() for i in range(5000)]
+UNSEEN = [f"https://www.concordia.ca/other-{i}.html".encode() for i in range(20_000)]
+
+
+def filled(folder=None, keys=KEYS) -> ScalableBloomFilter:
+    bloom = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01, folder=folder)
+    for key in keys:
+        bloom.add(key)
+
+    return bloom
+
+
+def test_no_false_negatives():
+    bloom = filled()
+
+    assert all(key in bloom for key in KEYS)
+    assert not any(bloom.add(key) for key in KEYS)
+
+
+def test_add_tells_new_keys():
+    bloom = ScalableBloomFilter(initial_capacity=10, error_rate=0.01)
+
+    assert bloom.add(b'key')
+    assert not bloom.add(b'key')
+    assert len(bloom) == 1
+
+
+def test_grows_past_its_capacity():
+    bloom = filled()
+
+    assert [f.capacity for f in bloom.filters] == [1000, 2000, 4000]
+    assert len(bloom) <= len(KEYS)
+
+    # Each new filter is stricter than the last, so that their rates add up to at most the target
+    rates = [f.error_rate for f in bloom.filters]
+    assert rates == sorted(rates, reverse=True) and sum(rates) < 0.01
+
+
+def test_false_positive_rate():
+    bloom = filled()
+    false_positives = sum(key in bloom for key in UNSEEN) / len(UNSEEN)
+
+    assert bloom.estimated_fp_rate() < 0.01
+    assert false_positives < 0.01
+
+
+def test_empty():
+    bloom = ScalableBloomFilter()
+
+    assert b'key' not in bloom
+    assert len(bloom) == 0 and bloom.memory_bytes() == 0 and bloom.estimated_fp_rate() == 0
+
+
+@pytest.mark.parametrize('memory_mapped', [False, True])
+def test_save_and_load(tmp_path, memory_mapped):
+    saved = filled(keys=KEYS[:3000])
+    saved.save(tmp_path)
+    bloom = ScalableBloomFilter.load(tmp_path, memory_mapped=memory_mapped)
+
+    assert len(bloom) == len(saved)
+    assert all(key in bloom for key in KEYS[:3000])
+
+    # It carries on filling the last filter it was saved with
+    for key in KEYS[3000:]:
+        bloom.add(key)
+    assert [f.capacity for f in bloom.filters] == [1000, 2000, 4000]
+    assert all(key in bloom for key in KEYS)
+
+    bloom.close()
+
+
+def test_memory_mapped(tmp_path):
+    bloom = filled(tmp_path)
+    bloom.save(tmp_path)
+    bloom.close()
+
+    assert sorted(path.name for path in tmp_path.glob('*.bits')) == ['filter-0.bits', 'filter-1.bits', 'filter-2.bits']
+
+    # Reopened, the memory-mapped files hold every key added before
+    bloom = ScalableBloomFilter.load(tmp_path, memory_mapped=True)
+    assert all(key in bloom for key in KEYS)
+    assert bloom.memory_bytes() == sum(path.stat().st_size for path in tmp_path.glob('*.bits'))
+
+    bloom.close()
@@ -0,0 +1,60 @@
+"""
+Tests that the lxml extraction backend pulls the same content out of pages as the BeautifulSoup one.
+
+    $ python -m pytest tests
+"""
+
+import pytest
+
+from benchmarks.generate import html_pages
+from P4.extraction import extract_bs4, extract_lxml
+
+# Well-formed pages on which both backends must agree, each covering something the generated pages don't
+PAGES = {
+    'scripts and styles': b'<html><body><div class="body"><style>.a{color:red}</style>Text'
+                          b'<script>window.dataLayer=[]</script><noscript>enable js</noscript>'
+                          b'<template>tmpl</template></div><p>Before<script>x()</script> after</p></body></html>',
+    'head scripts': b'<html lang="en"><head><script>var a = "<p>not a paragraph</p>";</script>'
+                    b'<style>p { color: red }</style></head><body><p>Text</p></body></html>',
+    'no body': b'<p>No body here</p><a href="/page">Page</a>',
+    'no html': b'<body><h1>Title</h1><p>Text</p></body>',
+    'lang without body': b'<html lang="fr"><p>Bonjour</p></html>',
+    'comments': b'<html><body><p>Before<!-- a comment -->after</p><!-- <p>hidden</p> --></body></html>',
+    'entities': b'<html><body><p>Caf&eacute; &amp; th&#233;&nbsp;time</p><li>&lt;tag&gt;</li></body></html>',
+    'nested': b'<html><body><div class="body">Outer<div class="body">Inner</div>'
+              b'<ul><li>One<ul><li>Two</li></ul></li></ul><h2>Heading<span> part</span></h2></div></body></html>',
+    'classes': b'<html><body><div class="main body wide">One</div><div class="bodywork">Two</div>'
+               b'<div class="BODY">Three</div><div>Four</div></body></html>',
+    'heading order': b'<html><body><h3>Three</h3><h1>One</h1><h2>Two</h2><h1>Another one</h1><h6>Six</h6>'
+                     b'</body></html>',
+    'links': b'<html><body><a href="/a">A</a><a>No href</a><a href="">Empty</a><a name="x" href="#top">Top</a>'
+             b'<area href="/area"></body></html>',
+    'upper case': b'<HTML LANG="en"><BODY><P>Upper</P><DIV CLASS="body">Div</DIV><LI>Item</LI></BODY></HTML>',
+    'unicode': '<html><body><p>Université Concordia — « citation »</p></body></html>'.encode(),
+    'empty': b'',
+}
+
+
+def test_generated_pages():
+    for url, body in html_pages(300):
+        assert extract_lxml(body) == extract_bs4(body), url
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_pages(name):
+    assert extract_lxml(PAGES[name]) == extract_bs4(PAGES[name])
+
+
+def test_scripts_and_styles_are_left_out():
+    content = extract_lxml(PAGES['scripts and styles'])
+
+    assert content.div_bodies == ['Textenable js']
+    assert content.paragraphs == ['Before after']
+
+
+@pytest.mark.xfail(strict=True, reason="html.parser nests what follows an unclosed <p> or <li> inside it, lxml "
+                                       "closes it (see extract_lxml)")
+def test_unclosed_tags():
+    body = b'<html><body><p>one<p>two<div class="body">d</div><ul><li>a<li>b</ul></body></html>'
+
+    assert extract_lxml(body) == extract_bs4(body)
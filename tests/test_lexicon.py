@@ -0,0 +1,78 @@
+"""
+Tests that the compiled lexicon scores texts exactly like the `afinn` library, with both AFINN lexicons.
+
+    $ python -m pytest tests
+"""
+
+from pathlib import Path
+
+import pytest
+
+from benchmarks.generate import text_documents
+from P4.lexicon import AFINN_111, Lexicon, afinn_165
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Texts exercising what the library's regular expression does beyond matching single words: phrases, hyphenated and
+# apostrophized entries, entries found inside other words or split by spaces, and case
+PHRASES = [
+    "This does not work at all, and I can't stand it",
+    "cover-up cover - up coverup",
+    "GOOD good Good!! goodness not good",
+    "son-of-a-bitch n00b lol :) ;)",
+    "no fun, no-fun, some kind",
+    "don't like, dont like, don't  like",
+    "", "   ",
+]
+
+
+@pytest.fixture(params=['111', '165'])
+def lexicons(request):
+    afinn = pytest.importorskip('afinn')
+
+    path = str(ROOT / AFINN_111) if request.param == '111' else afinn_165()
+    library = afinn.Afinn()
+    library.setup_from_file(path)
+
+    return Lexicon.from_file(path), library
+
+
+def texts() -> list:
+    """
+    :return: The texts of generated documents, then the phrase cases
+    """
+
+    return [text for _, text in text_documents(200)] + PHRASES
+
+
+def test_scores_match_the_library(lexicons):
+    lexicon, library = lexicons
+
+    for text in texts():
+        assert lexicon.score(text) == library.score(text), text
+
+
+def test_entries_match_the_library(lexicons):
+    lexicon, library = lexicons
+
+    for text in PHRASES:
+        assert lexicon.find_all(text) == library.find_all(text), text
+
+
+def test_score_many(lexicons):
+    lexicon, _ = lexicons
+
+    assert lexicon.score_many(texts()).tolist() == [lexicon.score(text) for text in texts()]
+
+
+def test_save_and_load(lexicons, tmp_path):
+    lexicon, _ = lexicons
+    lexicon.save(tmp_path)
+    loaded = Lexicon.load(tmp_path)
+
+    assert len(loaded) == len(lexicon)
+    assert loaded.score_many(texts()).tolist() == lexicon.score_many(texts()).tolist()
+
+
+def test_load_missing(tmp_path):
+    assert Lexicon.load(tmp_path) is None
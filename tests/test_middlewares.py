@@ -0,0 +1,106 @@
+"""
+Tests of the downloader middlewares, crawling a small site served from this process.
+
+    $ python -m pytest tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ROBOTS = b"User-agent: *\nDisallow: /private\n"
+
+PAGES = {
+    '/robots.txt': ('text/plain', ROBOTS),
+    '/index.html': ('text/html; charset=utf-8',
+                    b'<html lang="en"><body><a href="/page.html">Page</a> <a href="/private.html">Private</a>'
+                    b'</body></html>'),
+    '/page.html': ('text/html; charset=utf-8', b'<html lang="en"><body><p>A page</p></body></html>'),
+    '/private.html': ('text/html; charset=utf-8', b'<html lang="en"><body><p>Private</p></body></html>'),
+}
+
+# Crawls the site with the project's settings, then saves the robots.txt body the spider got, and the pages it visited
+CRAWL = '''
+import json, sys
+import scrapy
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+site, out = sys.argv[1], sys.argv[2]
+seen = {'robots': None, 'visited': []}
+
+class Spider(scrapy.Spider):
+    name = 'test'
+    start_urls = [site + '/robots.txt', site + '/index.html']
+
+    def parse(self, response):
+        if response.url.endswith('/robots.txt'):
+            seen['robots'] = response.body.decode()
+            return
+
+        seen['visited'].append(response.url)
+        yield from response.follow_all(css='a')
+
+settings = get_project_settings()
+settings.setdict({'ROBOTSTXT_OBEY': True, 'DOWNLOAD_DELAY': 0, 'ITEM_PIPELINES': {}, 'LOG_LEVEL': 'WARNING',
+                  'STREAM_CLUSTER_ENABLED': False, 'ARCHIVE_MODE': None}, priority='cmdline')
+process = CrawlerProcess(settings)
+process.crawl(Spider)
+process.start()
+
+with open(out, 'wt') as f:
+    json.dump(seen, f)
+'''
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+
+        content_type, body = PAGES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_response_filter_keeps_plain_text_robots_txt(site, tmp_path):
+    out = tmp_path / 'seen.json'
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(ROOT), os.environ.get('PYTHONPATH', '')]),
+           'SCRAPY_SETTINGS_MODULE': 'P4.settings'}
+
+    subprocess.run([sys.executable, '-c', CRAWL, site, str(out)], cwd=tmp_path, env=env, check=True, timeout=120)
+
+    with open(out, 'rt') as f:
+        seen = json.load(f)
+
+    # The body of robots.txt arrives intact, so the RobotsTxtMiddleware obeys it
+    assert seen['robots'] == ROBOTS.decode()
+    assert f'{site}/page.html' in seen['visited']
+    assert f'{site}/private.html' not in seen['visited']
@@ -0,0 +1,125 @@
+"""
+Tests of the MinHash signatures and the LSH index behind the near-duplicate filter.
+
+    $ python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from P4.minhash import LSHIndex, MinHasher, _bands_for, similarity
+
+WORDS = [f"word{i}" for i in range(200)]
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b)
+
+
+def near_duplicate(words: list, changed: int) -> list:
+    """
+    :param words: A set of words, as a list
+    :param changed: How many of its words to replace
+    :return: The set with its first words replaced by new ones
+    """
+
+    return [f"new{i}" for i in range(changed)] + words[changed:]
+
+
+@pytest.mark.parametrize('shared', [40, 100, 160])
+def test_similarity_estimates_jaccard(shared):
+    hasher = MinHasher(num_perm=256)
+    a, b = set(WORDS), set(WORDS[:shared] + [f"other{i}" for i in range(200 - shared)])
+
+    assert similarity(hasher.signature(a), hasher.signature(b)) == pytest.approx(jaccard(a, b), abs=0.1)
+
+
+def test_identical_sets():
+    hasher = MinHasher()
+
+    # Duplicated words and their order don't change the set
+    assert similarity(hasher.signature(WORDS), hasher.signature(WORDS[::-1] + WORDS[:10])) == 1.0
+
+
+def test_signatures():
+    signature = MinHasher(num_perm=64).signature(WORDS)
+
+    assert signature.shape == (64,) and signature.dtype == np.uint32
+    assert np.array_equal(signature, MinHasher(num_perm=64).signature(WORDS))
+    assert not np.array_equal(signature, MinHasher(num_perm=64, seed=2).signature(WORDS))
+
+
+def test_empty_set():
+    hasher = MinHasher()
+
+    assert similarity(hasher.signature([]), hasher.signature(WORDS)) == 0.0
+    assert similarity(hasher.signature([]), hasher.signature(set())) == 1.0
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.9, 0.95])
+def test_bands_for(threshold):
+    bands, rows = _bands_for(threshold, 128)
+
+    assert bands * rows == 128
+    assert (1 / bands) ** (1 / rows) == pytest.approx(threshold, abs=0.1)
+
+
+@pytest.fixture
+def index():
+    hasher = MinHasher()
+    index = LSHIndex(threshold=0.9)
+    for i in range(50):
+        index.insert(f"page-{i}", hasher.signature([f"page{i}-{word}" for word in WORDS]))
+
+    return hasher, index
+
+
+def test_finds_near_duplicates(index):
+    hasher, index = index
+    words = [f"page7-{word}" for word in WORDS]
+
+    key, score = index.query(hasher.signature(near_duplicate(words, 5)))
+    assert key == 'page-7' and score >= 0.9
+
+    assert index.query(hasher.signature(words)) == ('page-7', 1.0)
+
+
+def test_ignores_dissimilar_sets(index):
+    hasher, index = index
+
+    assert index.query(hasher.signature(WORDS)) is None
+    assert index.query(hasher.signature(near_duplicate([f"page7-{word}" for word in WORDS], 60))) is None
+
+
+def test_exclude(index):
+    hasher, index = index
+    signature = hasher.signature([f"page7-{word}" for word in WORDS])
+
+    assert index.query(signature, exclude='page-7') is None
+
+    index.insert('copy-of-7', signature)
+    assert index.query(signature, exclude='page-7') == ('copy-of-7', 1.0)
+
+
+def test_insert_replaces(index):
+    hasher, index = index
+    old, new = [f"page7-{word}" for word in WORDS], [f"changed-{word}" for word in WORDS]
+
+    index.insert('page-7', hasher.signature(new))
+
+    assert len(index) == 50
+    assert index.query(hasher.signature(old)) is None
+    assert index.query(hasher.signature(new)) == ('page-7', 1.0)
+
+
+def test_save_and_load(index, tmp_path):
+    hasher, index = index
+    index.insert('page-7', hasher.signature(WORDS))
+    index.save(tmp_path)
+
+    loaded = LSHIndex.load(tmp_path)
+
+    assert (loaded.threshold, loaded.num_perm, len(loaded)) == (index.threshold, index.num_perm, 50)
+    assert loaded.query(hasher.signature(WORDS)) == ('page-7', 1.0)
+    assert loaded.query(hasher.signature([f"page7-{word}" for word in WORDS])) is None
+    assert loaded.query(hasher.signature([f"page3-{word}" for word in WORDS])) == ('page-3', 1.0)
@@ -0,0 +1,121 @@
+"""
+Tests that the fast normalizer cleans text exactly like the original NLTK one.
+
+The expected output, in `tests/data/normalization.json`, was made with `clean_nltk` from the fragments of generated
+pages and the edge cases below, along with the stopwords it was made with. The golden test uses those stopwords, so it
+runs without NLTK's data. To make it again, e.g. after changing the edge cases:
+
+    $ python -m tests.test_normalization
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from benchmarks.generate import html_pages
+from P4 import normalization
+from P4.extraction import extract_bs4
+
+GOLDEN = Path(__file__).resolve().parent / 'data' / 'normalization.json'
+
+# Fragments exercising what `word_tokenize` does beyond splitting on whitespace: contractions, quotes, dashes, '#'
+# and '%', along with the characters the cleaning replaces and the checks it makes before and after lowercasing
+EDGE_CASES = [
+    "I cannot attend, but you CanNot miss it. Gonna, gotta, gimme, lemme, wanna go!",
+    "wanna# wannabe x^cannot cannot_ gonna’ “Quoted” ‘single’ «guillemets» „low“",
+    "Fall 2023 – Winter 2024 — 100% of #students ‒ ―",
+    "Don't, can't, won't; d'ye more'n 'tis 'twas",
+    "The The THE the A a I i Is IS is",
+    "Naïve café München ½ ² ٣ 1st 2nd İstanbul ß",
+    "\xa0\x03\x02\x07\x05\x7f tab\tnew\nline   spaces",
+    "", "   ", "a", "$100.00 (CAD) [sic] {x} <y> @home & co. *star* a/b|c+d=e ~tilde^ back\\slash",
+]
+
+# The number of generated pages whose fragments are in the expected output
+PAGES = 20
+
+
+def sample_fragments() -> list:
+    """
+    :return: The fragments the spider would clean from the generated pages, then the edge cases
+    """
+
+    fragments = []
+    for _, body in html_pages(PAGES):
+        content = extract_bs4(body)
+        fragments += content.paragraphs + content.headings + content.div_bodies + content.list_items
+
+    return fragments + EDGE_CASES
+
+
+def words(cleaned: str) -> list:
+    """
+    :param cleaned: A cleaned string, whose words are in the order of a set, which changes from one process to another
+    :return: Its words, sorted
+    """
+
+    return sorted(cleaned.split())
+
+
+@pytest.fixture
+def golden(monkeypatch):
+    with open(GOLDEN, 'rt', encoding='utf-8') as f:
+        golden = json.load(f)
+
+    # Clean with the stopwords the expected output was made with, rather than those of the resource bundle
+    monkeypatch.setattr(normalization, 'get_stopwords', lambda name: tuple(golden['stopwords']))
+    normalization.stopword_set.cache_clear()
+    yield golden
+    normalization.stopword_set.cache_clear()
+
+
+@pytest.fixture
+def word_tokenize():
+    nltk = pytest.importorskip('nltk')
+    try:
+        nltk.word_tokenize('text')
+    except LookupError:
+        pytest.skip("NLTK's tokenizer data isn't installed")
+
+
+def test_golden_fragments_are_current(golden):
+    assert [fragment for fragment, _ in golden['fragments']] == sample_fragments()
+
+
+def test_clean_fast_matches_golden(golden):
+    for fragment, expected in golden['fragments']:
+        cleaned = normalization.clean_fast(fragment)
+
+        assert cleaned.endswith(' ') and '  ' not in cleaned.strip(), fragment
+        assert words(cleaned) == expected, fragment
+
+
+def test_clean_nltk_matches_golden(golden, word_tokenize):
+    for fragment, expected in golden['fragments']:
+        assert words(normalization.clean_nltk(fragment)) == expected, fragment
+
+
+def test_clean_fast_matches_clean_nltk(golden, word_tokenize):
+    # Within a process, both add the same words to their set in the same order, so even the order must match
+    for fragment, _ in golden['fragments']:
+        assert normalization.clean_fast(fragment) == normalization.clean_nltk(fragment), fragment
+
+
+def test_unknown_normalizer():
+    with pytest.raises(ValueError):
+        normalization.get_normalizer('unknown')
+
+
+if __name__ == '__main__':
+    stopwords = normalization.get_stopwords('cleaning')
+    fragments = [[fragment, words(normalization.clean_nltk(fragment))] for fragment in sample_fragments()]
+
+    # One fragment per line, so that changes to the expected output are easy to review
+    GOLDEN.parent.mkdir(parents=True, exist_ok=True)
+    with open(GOLDEN, 'wt', encoding='utf-8') as f:
+        f.write(f'{{"stopwords": {json.dumps(list(stopwords))},\n "fragments": [\n  ')
+        f.write(',\n  '.join(json.dumps(fragment, ensure_ascii=False) for fragment in fragments))
+        f.write('\n]}\n')
+
+    print(f"Saved the expected output to {GOLDEN}")
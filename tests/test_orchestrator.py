@@ -0,0 +1,140 @@
+"""
+Tests of the pipeline runner: which stages run, which are skipped as up to date, and which are blocked.
+
+    $ python -m pytest tests
+"""
+
+from pathlib import Path
+
+import pytest
+
+from P4.orchestrator import Pipeline, Stage
+
+
+def write(path: str, text: str = 'done') -> list:
+    """
+    :param path: The file the stage writes
+    :param text: What it writes to it
+    :return: The command of a stage that writes a file, after printing what it does
+    """
+
+    return ['-c', f"print('writing {path}'); open({path!r}, 'w').write({text!r})"]
+
+
+FAIL = ['-c', "import sys; print('failing'); sys.exit(3)"]
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Stages read and write relative to the working directory, like the scripts of the repository
+    monkeypatch.chdir(tmp_path)
+    Path('source.txt').write_text('source')
+
+
+def stages(second: list = None) -> list:
+    return [
+        Stage('first', write('first.txt'), inputs=['source.txt'], outputs=['first.txt']),
+        Stage('second', second or write('second.txt'), inputs=['first.txt'], outputs=['second.txt'],
+              after=['first']),
+        Stage('third', write('third.txt'), outputs=['third.txt'], after=['second']),
+        Stage('other', write('other.txt'), outputs=['other.txt']),
+    ]
+
+
+def statuses(results: list) -> dict:
+    return {result['stage']: result['status'] for result in results}
+
+
+def test_runs_every_stage(tmp_path):
+    results = Pipeline(stages(), state='state', jobs=2).run()
+
+    assert statuses(results) == {'first': 'ran', 'second': 'ran', 'third': 'ran', 'other': 'ran'}
+    assert [r['stage'] for r in results if r['stage'] != 'other'] == ['first', 'second', 'third']
+    assert Path('state/logs/first.log').read_text().strip() == 'writing first.txt'
+    assert (tmp_path / 'state' / 'report.json').exists()
+
+
+def test_skips_stages_up_to_date():
+    Pipeline(stages(), state='state').run()
+    results = Pipeline(stages(), state='state').run()
+
+    assert set(statuses(results).values()) == {'cached'}
+
+
+def test_reruns_stages_whose_inputs_changed():
+    Pipeline(stages(), state='state').run()
+
+    Path('source.txt').write_text('changed')
+    results = Pipeline(stages(), state='state').run()
+
+    # The first stage writes the same output again, so the stages after it are still up to date
+    assert statuses(results) == {'first': 'ran', 'second': 'cached', 'third': 'cached', 'other': 'cached'}
+
+
+def test_reruns_stages_whose_command_changed():
+    Pipeline(stages(), state='state').run()
+    results = Pipeline(stages(write('second.txt', 'changed')), state='state').run()
+
+    assert statuses(results) == {'first': 'cached', 'second': 'ran', 'third': 'cached', 'other': 'cached'}
+
+
+def test_reruns_stages_whose_outputs_are_missing():
+    Pipeline(stages(), state='state').run()
+
+    Path('third.txt').unlink()
+    results = Pipeline(stages(), state='state').run()
+
+    assert statuses(results) == {'first': 'cached', 'second': 'cached', 'third': 'ran', 'other': 'cached'}
+
+
+def test_force():
+    Pipeline(stages(), state='state').run()
+
+    assert statuses(Pipeline(stages(), state='state').run(force=['second']))['second'] == 'ran'
+    assert set(statuses(Pipeline(stages(), state='state').run(force=['all'])).values()) == {'ran'}
+
+
+def test_failed_stages_block_those_after_them():
+    results = Pipeline(stages(FAIL), state='state').run()
+
+    assert statuses(results) == {'first': 'ran', 'second': 'failed', 'third': 'blocked', 'other': 'ran'}
+    assert not Path('third.txt').exists()
+    assert Path('state/logs/second.log').read_text().strip() == 'failing'
+
+    # A failed stage runs again next time, even though nothing changed
+    results = Pipeline(stages(FAIL), state='state').run()
+    assert statuses(results) == {'first': 'cached', 'second': 'failed', 'third': 'blocked', 'other': 'cached'}
+
+
+def test_stages_without_their_outputs_fail():
+    results = Pipeline(stages(write('elsewhere.txt')), state='state').run()
+
+    assert statuses(results) == {'first': 'ran', 'second': 'failed', 'third': 'blocked', 'other': 'ran'}
+
+
+def test_fingerprint():
+    stage = Stage('first', write('first.txt'), params={'k': 3}, inputs=['source.txt'], manifests=['*.txt'])
+    fingerprint = stage.fingerprint()
+
+    assert Stage('first', write('first.txt'), params={'k': 3}, inputs=['source.txt'],
+                 manifests=['*.txt']).fingerprint() == fingerprint
+    assert Stage('first', write('first.txt'), params={'k': 4}, inputs=['source.txt'],
+                 manifests=['*.txt']).fingerprint() != fingerprint
+
+    Path('new.txt').write_text('new')
+    assert stage.fingerprint() != fingerprint
+
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError, match='unknown stages: missing'):
+        Pipeline([Stage('first', write('first.txt'), after=['missing'])])
+
+
+def test_cycle():
+    with pytest.raises(ValueError, match='cycle'):
+        Pipeline([
+            Stage('start', write('start.txt')),
+            Stage('first', write('first.txt'), after=['start', 'third']),
+            Stage('second', write('second.txt'), after=['first']),
+            Stage('third', write('third.txt'), after=['second']),
+        ])
@@ -0,0 +1,115 @@
+"""
+Tests that the TF-IDF matrices built from cached term counts, and the vocabulary pruned one document at a time, are
+the same as those of `TfidfVectorizer`.
+
+    $ python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from benchmarks.generate import text_documents
+from P4.low_memory import document_frequencies, prune_vocabulary
+from P4.term_cache import TermCountCache, tfidf_from_counts
+
+# A few stopwords, so that the tests don't need NLTK's data
+STOPWORDS = ['the', 'a', 'and', 'of', 'to', 'in', 'for', 'le', 'la', 'et']
+
+# The max_df and min_df of cluster.py, then integer ones
+DF_LIMITS = [(0.5, 0.1), (0.9, 0.01), (150, 3)]
+
+
+def documents(count: int = 300, seed: int = 479) -> list:
+    return [text for _, text in text_documents(count, seed)]
+
+
+def fit(texts: list, max_df, min_df):
+    vectorizer = TfidfVectorizer(max_df=max_df, min_df=min_df, stop_words=STOPWORDS, strip_accents='unicode')
+    return vectorizer.fit_transform(texts), vectorizer
+
+
+def assert_same(X_tfidf, vectorizer, texts: list, max_df, min_df):
+    expected, expected_vectorizer = fit(texts, max_df, min_df)
+
+    assert vectorizer.get_feature_names_out().tolist() == expected_vectorizer.get_feature_names_out().tolist()
+    assert np.allclose(X_tfidf.toarray(), expected.toarray())
+    assert np.allclose(vectorizer.idf_, expected_vectorizer.idf_)
+
+
+@pytest.mark.parametrize('max_df, min_df', DF_LIMITS)
+def test_tfidf_from_counts(tmp_path, max_df, min_df):
+    texts = documents()
+    cache = TermCountCache(tmp_path, STOPWORDS)
+    counts = cache.count_matrix(texts)
+
+    X_tfidf, vectorizer = tfidf_from_counts(counts, cache.vocabulary, max_df, min_df, STOPWORDS)
+
+    assert_same(X_tfidf, vectorizer, texts, max_df, min_df)
+
+
+def test_vectorizer_transforms_new_documents(tmp_path):
+    texts, new = documents(), documents(20, seed=1)
+    cache = TermCountCache(tmp_path, STOPWORDS)
+
+    _, vectorizer = tfidf_from_counts(cache.count_matrix(texts), cache.vocabulary, 0.5, 0.1, STOPWORDS)
+    _, expected = fit(texts, 0.5, 0.1)
+
+    assert np.allclose(vectorizer.transform(new).toarray(), expected.transform(new).toarray())
+
+
+def test_cached_counts(tmp_path):
+    texts = documents()
+    first = TermCountCache(tmp_path, STOPWORDS).count_matrix(texts[:200])
+
+    # Reopened, the cache only counts the new documents, and gives the same rows for the others in any order
+    cache = TermCountCache(tmp_path, STOPWORDS)
+    changed = texts[100:][::-1] + ['an edited document']
+    counts = cache.count_matrix(changed)
+
+    assert (cache.hits, cache.misses) == (100, 101)
+    assert (counts[-101:-1, :first.shape[1]] != first[100:200][::-1]).nnz == 0
+
+    X_tfidf, vectorizer = tfidf_from_counts(counts, cache.vocabulary, 0.5, 0.1, STOPWORDS)
+    assert_same(X_tfidf, vectorizer, changed, 0.5, 0.1)
+
+
+def test_cache_emptied_when_the_stopwords_change(tmp_path):
+    TermCountCache(tmp_path, STOPWORDS).count_matrix(documents(50))
+    cache = TermCountCache(tmp_path, STOPWORDS[:3])
+
+    assert cache.vocabulary == {} and cache.index == {}
+
+
+def test_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr('P4.term_cache.MAX_SHARDS', 2)
+    texts = documents(40)
+
+    for end in range(10, 50, 10):
+        cache = TermCountCache(tmp_path, STOPWORDS)
+        counts = cache.count_matrix(texts[:end])
+
+    assert len(list(tmp_path.glob('shard-*.npz'))) <= 2
+    X_tfidf, vectorizer = tfidf_from_counts(counts, cache.vocabulary, 0.5, 0.1, STOPWORDS)
+    assert_same(X_tfidf, vectorizer, texts, 0.5, 0.1)
+
+
+@pytest.mark.parametrize('max_df, min_df', DF_LIMITS)
+def test_prune_vocabulary(max_df, min_df):
+    texts = documents()
+    _, vectorizer = fit(texts, max_df, min_df)
+
+    df, n_documents = document_frequencies(texts, vectorizer.build_analyzer())
+
+    assert n_documents == len(texts)
+    assert prune_vocabulary(df, n_documents, max_df, min_df) == vectorizer.get_feature_names_out().tolist()
+
+
+def test_nothing_left_after_pruning(tmp_path):
+    texts = documents(50)
+    cache = TermCountCache(tmp_path, STOPWORDS)
+
+    with pytest.raises(ValueError):
+        tfidf_from_counts(cache.count_matrix(texts), cache.vocabulary, 0.01, 0.99, STOPWORDS)
+    with pytest.raises(ValueError):
+        prune_vocabulary(*document_frequencies(texts, cache.analyzer), 0.01, 0.99)